@@ -1,6 +1,6 @@
 import os
 from functools import lru_cache
-from typing import final
+from typing import Literal, final
 
 from pydantic import AmqpDsn, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -33,6 +33,77 @@ class Config(BaseSettings):
     QUEUE_PROCESS_IMAGE: str = Field(default="process_image_queue")
     QUEUE_RESULT: str = Field(default="result_queue")
 
+    # Версия протокола сообщений в очередь обработки:
+    # 1 - JSON с hex-данными (старые воркеры), 2 - бинарное тело и заголовки AMQP
+    MESSAGE_PROTOCOL_VERSION: int = 2
+
+    # Не больше USER_MAX_IN_FLIGHT изображений пользователя в обработке одновременно
+    # (0 - без ограничения); место освобождается с результатом или через таймаут
+    USER_MAX_IN_FLIGHT: int = 3
+    USER_IN_FLIGHT_TIMEOUT: int = 1800
+    # Приоритеты RabbitMQ по размеру изображения (x-max-priority очереди обработки,
+    # должно совпадать с настройкой воркера; 0 - выключены)
+    QUEUE_MAX_PRIORITY: int = 0
+
+    # Маршрутизация по размеру: изображения до SMALL_MAX_MEGAPIXELS (по заголовку файла)
+    # уходят в <QUEUE_PROCESS_IMAGE>.small, остальные - в <QUEUE_PROCESS_IMAGE>.large
+    SIZE_ROUTING: bool = False
+    SMALL_MAX_MEGAPIXELS: float = 2.0
+
+    # Ограничение длины очереди обработки (x-max-length, 0 - без ограничения);
+    # бот объявляет очереди обработки с теми же аргументами, что и воркер,
+    # поэтому значения должны совпадать с настройкой воркера
+    QUEUE_MAX_LENGTH: int = 0
+    QUEUE_OVERFLOW: Literal["reject-publish", "reject-publish-dlx", "drop-head"] = (
+        "reject-publish"
+    )
+
+    # Контроль допуска задач по статистике воркеров (0 - порог не проверяется):
+    # при превышении reject - отказ, defer - ожидание до ADMISSION_DEFER_SECONDS
+    STATS_EXCHANGE: str = "worker_stats"
+    STATS_STALE_SECONDS: float = 60.0
+    ADMISSION_MAX_BACKLOG: int = 0
+    ADMISSION_MAX_ETA_MINUTES: float = 30.0
+    ADMISSION_POLICY: Literal["reject", "defer"] = "defer"
+    ADMISSION_DEFER_SECONDS: float = 300.0
+    ADMISSION_POLL_SECONDS: float = 10.0
+
+    # Доставка результатов: параллельно до DELIVERY_CONCURRENCY сообщений,
+    # в рамках лимитов Telegram (сообщений в секунду на бота и на чат)
+    DELIVERY_CONCURRENCY: int = 8
+    DELIVERY_MAX_RETRIES: int = 5
+    TELEGRAM_GLOBAL_RATE: float = 30.0
+    TELEGRAM_CHAT_RATE: float = 1.0
+    TELEGRAM_CHAT_BURST: float = 3.0
+
+    # Claim check: тела сообщений больше BLOB_THRESHOLD_KB кладутся в хранилище,
+    # в RabbitMQ передаётся только ссылка (заголовок blob_ref).
+    # none - выключено; local - общий для бота и воркера каталог; s3 - S3-совместимое хранилище
+    BLOB_STORE: Literal["none", "local", "s3"] = "none"
+    BLOB_THRESHOLD_KB: int = 256
+    BLOB_DIR: str = "blobs"
+    # Время жизни объектов: потерянные ссылки удаляются периодической очисткой
+    BLOB_TTL_HOURS: float = 24.0
+    BLOB_CLEANUP_INTERVAL: int = 600
+    S3_ENDPOINT_URL: str | None = None
+    S3_BUCKET: str = "ultrares"
+    S3_ACCESS_KEY: str | None = None
+    S3_SECRET_KEY: str | None = None
+    S3_REGION: str | None = None
+    S3_PREFIX: str = "blobs/"
+
+    # Кэш результатов по file_unique_id фотографии
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_DIR: str = "cache/results"
+    RESULT_CACHE_MAX_MB: int = 512
+    # Входит в ключ кэша: сменить при смене модели, точности или формата вывода
+    # у воркеров, чтобы не отдавать результаты старых настроек
+    RESULT_CACHE_VERSION: str = "1"
+
+    # Параметры обработки, передаваемые воркеру с каждой задачей
+    # (output_format, quality, chroma_subsampling, progressive); входят в ключ кэша
+    PROCESSING_OPTIONS: dict = Field(default_factory=dict)
+
     UPLOAD_DIR: str = "uploads"
     RESULT_DIR: str = "results"
 
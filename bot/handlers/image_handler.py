@@ -4,7 +4,8 @@ from aiogram import F
 from aiogram import Router, Bot
 from aiogram.types import Message, ContentType
 from bot.misc import rabbit_manager
-from bot.scripts.message_scripts import create_json_from_message
+from bot.services.capacity import format_eta
+from bot.services.rabbit_manager import QueueOverflowError
 
 from bot.config import get_config
 
@@ -16,6 +17,78 @@ logger = logging.getLogger(__name__)
 image_router = Router()
 
 
+async def _reply_from_cache(message: Message, processing_msg: Message, cache_key):
+    """Отправляет результат из кэша; возвращает True, если он там был"""
+    cached_image = await rabbit_manager.get_cached_result(cache_key)
+    if cached_image is None:
+        return False
+    await rabbit_manager.send_image_to_chat(message.from_user.id, cached_image)
+    await processing_msg.edit_text(
+        "✅ Это изображение уже обрабатывалось, результат отправлен.",
+    )
+    return True
+
+
+async def _admit(message: Message, processing_msg: Message):
+    """
+    Допуск изображения в обработку.
+
+    Возвращает пару (принято ли изображение, оценка загрузки); при отказе
+    слот пользователя освобождается.
+    """
+    # Ограничение числа изображений одного пользователя в обработке
+    if not rabbit_manager.in_flight.try_acquire(message.from_user.id):
+        await processing_msg.edit_text(
+            "✋ Слишком много изображений в обработке "
+            f"(не больше {config.USER_MAX_IN_FLIGHT} одновременно).\n"
+            "Пришлите это фото ещё раз, когда придут результаты.",
+        )
+        return False, None
+
+    # Контроль допуска: при перегрузке ждём освобождения места или отказываем
+    estimate = rabbit_manager.capacity.estimate()
+    if rabbit_manager.overloaded(estimate) and config.ADMISSION_POLICY == "defer":
+        await processing_msg.edit_text(
+            "🚦 Сейчас очередь переполнена.\n"
+            "Изображение уйдёт на обработку, как только освободится место.",
+        )
+        estimate = await rabbit_manager.wait_for_capacity(config.ADMISSION_DEFER_SECONDS)
+    if rabbit_manager.overloaded(estimate):
+        rabbit_manager.in_flight.release(message.from_user.id)
+        wait_text = ""
+        if estimate.eta_seconds is not None:
+            wait_text = f" Текущее время ожидания: {format_eta(estimate.eta_seconds)}."
+        await processing_msg.edit_text(
+            f"🚦 Сервис перегружен, попробуйте позже.{wait_text}",
+        )
+        return False, estimate
+    return True, estimate
+
+
+async def _enqueue(message: Message, processing_msg: Message, photo, cache_key):
+    """Отправляет фото в очередь; возвращает False, если очередь заполнена"""
+    try:
+        # большие фото скачиваются во временный файл и передаются ссылкой
+        photo_bytes = await rabbit_manager.download_photo(photo, photo.file_size)
+
+        await rabbit_manager.send_image_to_queue(
+            message.from_user.id,
+            photo_bytes,
+            cache_key=cache_key,
+            options=config.PROCESSING_OPTIONS,
+        )
+    except QueueOverflowError:
+        rabbit_manager.in_flight.release(message.from_user.id)
+        await processing_msg.edit_text(
+            "🚦 Очередь обработки заполнена, попробуйте позже.",
+        )
+        return False
+    except Exception:
+        rabbit_manager.in_flight.release(message.from_user.id)
+        raise
+    return True
+
+
 @image_router.message(F.content_type == ContentType.PHOTO)
 async def handle_photo(message: Message, bot: Bot):
     """Обработчик входящих фотографий"""
@@ -25,19 +98,31 @@ async def handle_photo(message: Message, bot: Bot):
             "📥 Получил ваше изображение. Начинаю обработку...",
         )
 
-        photo_bytes = await bot.download(message.photo[-1])
-        photo_bytes = photo_bytes.read()
+        photo = message.photo[-1]
 
-        await rabbit_manager.send_json_to_queue(
-            create_json_from_message(
-                message.from_user.id,
-                photo_bytes,
-                ),
-            )
+        # Повторно присланное изображение отдаём из кэша без обработки
+        cache_key = rabbit_manager.make_cache_key(
+            photo.file_unique_id,
+            config.PROCESSING_OPTIONS,
+        )
+        if await _reply_from_cache(message, processing_msg, cache_key):
+            return
 
+        admitted, estimate = await _admit(message, processing_msg)
+        if not admitted:
+            return
+
+        if not await _enqueue(message, processing_msg, photo, cache_key):
+            return
+
+        eta_text = "⏳ Я пришлю результат, как только он будет готов."
+        if estimate is not None and estimate.eta_seconds is not None:
+            eta_text = (
+                f"⏳ Примерное время ожидания: {format_eta(estimate.eta_seconds)}.\n"
+                "Я пришлю результат, как только он будет готов."
+            )
         await processing_msg.edit_text(
-            "🔄 Изображение отправлено на обработку.\n"
-            "⏳ Я пришлю результат, как только он будет готов.",
+            "🔄 Изображение отправлено на обработку.\n" + eta_text,
         )
 
     except Exception as e:
@@ -5,9 +5,10 @@ from aiogram import Dispatcher, Router
 from aiogram_dialog import setup_dialogs
 
 from bot.config import get_config
-from bot.misc import bot, dp, rabbit_manager
+from bot.misc import blob_store, bot, dp, rabbit_manager
 from bot.handlers import all_routers
 from bot.utils import setup_logging
+from shared.blob_store import cleanup_periodically
 
 config = get_config()
 setup_logging(config)
@@ -33,6 +34,10 @@ async def setup_dispatcher(dp: Dispatcher):
 async def start_pooling():
     await rabbit_manager.connect()
     asyncio.create_task(rabbit_manager.process_result())
+    asyncio.create_task(rabbit_manager.process_stats())
+    # Очистку хранилища выполняет бот: он один, а воркеров может быть много
+    if blob_store is not None:
+        asyncio.create_task(cleanup_periodically(blob_store, config.BLOB_CLEANUP_INTERVAL))
 
     try:
         await setup_dispatcher(dp)
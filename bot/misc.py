@@ -2,6 +2,8 @@ from aiogram import Bot, Dispatcher
 
 from bot.services.rabbit_manager import RabbitManager
 from bot.config import get_config
+from shared.blob_store import create_blob_store
+from shared.result_cache import ResultCache
 
 config = get_config()
 
@@ -11,4 +13,20 @@ dp = Dispatcher()
 # Bot
 bot = Bot(token=config.TELEGRAM_BOT_TOKEN)
 
-rabbit_manager = RabbitManager(rabbitmq_dsn=str(config.RABBITMQ_DSN), bot=bot)
+result_cache = (
+    ResultCache(
+        config.RESULT_CACHE_DIR,
+        max_size_bytes=config.RESULT_CACHE_MAX_MB * 1024 * 1024,
+    )
+    if config.RESULT_CACHE_ENABLED
+    else None
+)
+
+blob_store = create_blob_store(config)
+
+rabbit_manager = RabbitManager(
+    rabbitmq_dsn=str(config.RABBITMQ_DSN),
+    bot=bot,
+    result_cache=result_cache,
+    blob_store=blob_store,
+)
@@ -1,3 +1,48 @@
+import json
+import math
+
+import aio_pika
+
+# Версия 1: JSON {"chat_id": ..., "image_data": "<hex>"} в теле сообщения.
+# Версия 2: сырые байты изображения в теле, метаданные в заголовках AMQP.
+PROTOCOL_VERSION = 2
+VERSION_HEADER = "protocol_version"
+
+
+# Изображения до 512x512 получают наивысший приоритет, каждое удвоение числа
+# пикселей снижает приоритет на единицу
+PRIORITY_BASE_PIXELS = 512 * 512
+
+
+def message_priority(pixels: int | None, max_priority: int) -> int | None:
+    """
+    Приоритет RabbitMQ для задачи: чем меньше изображение, тем выше приоритет
+    (shortest job first). Задачи неизвестного размера получают средний приоритет.
+    """
+    if max_priority <= 0:
+        return None
+    if not pixels:
+        return max_priority // 2
+    steps = max(0, math.ceil(math.log2(pixels / PRIORITY_BASE_PIXELS)))
+    return max(0, max_priority - steps)
+
+
+def size_class_queue(queue_name: str, pixels: int | None, small_max_pixels: int) -> str:
+    """
+    Очередь класса размеров для изображения; неизвестный размер считается большим.
+    """
+    size_class = "small" if pixels and pixels <= small_max_pixels else "large"
+    return f"{queue_name}.{size_class}"
+
+
+def photo_cache_parts(file_unique_id: str, options: dict | None, cache_version: str) -> tuple:
+    """
+    Части ключа кэша результата для фотографии Telegram: сама фотография,
+    параметры обработки из сообщения и версия модели и настроек вывода воркеров.
+    """
+    return file_unique_id, cache_version, options or {}
+
+
 def create_json_from_message(chat_id: int, photo_bytes: bytes) -> dict:
     message = {
         "chat_id": chat_id,
@@ -6,6 +51,77 @@ def create_json_from_message(chat_id: int, photo_bytes: bytes) -> dict:
     return message
 
 
+def create_image_message(
+    chat_id: int,
+    photo_bytes: bytes,
+    image_format: str = "jpeg",
+    options: dict | None = None,
+    version: int = PROTOCOL_VERSION,
+    cache_key: str | None = None,
+    blob_ref: str | None = None,
+    pixels: int | None = None,
+    priority: int | None = None,
+) -> aio_pika.Message:
+    """
+    Создаёт сообщение с изображением для очереди обработки.
+
+    Версия 1 оставлена для совместимости со старыми воркерами на время выкатки.
+    При заданном blob_ref байты изображения лежат в хранилище, тело пустое.
+    pixels - размер изображения для планирования задач у воркера.
+    """
+    if version == 1:
+        return aio_pika.Message(
+            body=json.dumps(create_json_from_message(chat_id, photo_bytes)).encode(),
+            content_type="application/json",
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+        )
+
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Неподдерживаемая версия протокола: {version}")
+
+    headers = {
+        VERSION_HEADER: version,
+        "chat_id": chat_id,
+        "format": image_format,
+        "options": options or {},
+    }
+    if cache_key:
+        headers["cache_key"] = cache_key
+    if blob_ref:
+        headers["blob_ref"] = blob_ref
+    if pixels:
+        headers["pixels"] = pixels
+
+    return aio_pika.Message(
+        body=photo_bytes,
+        headers=headers,
+        content_type=f"image/{image_format}",
+        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+        priority=priority,
+    )
+
+
+# Расширения файлов результата по формату
+IMAGE_EXTENSIONS = {"jpeg": "jpg", "png": "png", "webp": "webp", "avif": "avif"}
+# Форматы, которые Telegram показывает как фотографию
+PHOTO_FORMATS = ("jpeg", "png", "webp")
+
+
+def detect_image_format(data: bytes) -> str:
+    """
+    Определяет формат изображения по первым байтам.
+    """
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[4:12] in (b"ftypavif", b"ftypavis"):
+        return "avif"
+    return "jpeg"
+
+
 def extract_chat_id(message) -> str:
     """
     Извлекает chat_id из заголовков сообщения.
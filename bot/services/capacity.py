@@ -0,0 +1,104 @@
+import json
+import logging
+import math
+import statistics
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CapacityEstimate:
+    """Оценка загрузки воркеров по их последней статистике."""
+
+    workers: int
+    # Задачи в очереди и у воркеров (полученные, но ещё не завершённые)
+    backlog: int
+    concurrency: int
+    eta_seconds: float | None
+
+    def overloaded(self, max_backlog: int, max_eta_seconds: float) -> bool:
+        """
+        Превышены ли пороги; нулевой порог не проверяется.
+        """
+        if max_backlog and self.backlog >= max_backlog:
+            return True
+        if max_eta_seconds and self.eta_seconds is not None:
+            return self.eta_seconds > max_eta_seconds
+        return False
+
+
+class CapacityMonitor:
+    """
+    Последняя статистика каждого воркера и оценка времени ожидания новой задачи.
+
+    Воркеры, не присылавшие статистику дольше stale_after секунд, считаются
+    остановленными и в оценке не участвуют.
+    """
+
+    def __init__(self, stale_after: float):
+        self.stale_after = stale_after
+        self._reports: dict[str, tuple[float, dict]] = {}
+
+    def update(self, report: dict) -> None:
+        self._reports[report["worker_id"]] = (time.monotonic(), report)
+
+    def handle_message(self, body: bytes) -> None:
+        try:
+            self.update(json.loads(body))
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Некорректная статистика воркера: {e}")
+
+    def _fresh_reports(self) -> list[dict]:
+        deadline = time.monotonic() - self.stale_after
+        for worker_id, (received, _) in list(self._reports.items()):
+            if received < deadline:
+                del self._reports[worker_id]
+        return [report for _, report in self._reports.values()]
+
+    def estimate(self) -> CapacityEstimate | None:
+        """
+        Оценка по свежей статистике или None, если воркеры её не присылают.
+
+        Новая задача ждёт, пока воркеры разберут backlog задач по concurrency
+        штук за p50 секунд, и затем обрабатывается сама.
+        """
+        reports = self._fresh_reports()
+        if not reports:
+            return None
+
+        # Очереди общие для воркеров: глубину каждой берём из самого свежего отчёта
+        queue_depths = {}
+        for report in sorted(reports, key=lambda report: report["timestamp"]):
+            queue_depths.update(report["queue_depths"])
+        backlog = sum(queue_depths.values()) + sum(
+            report["in_flight"] + report["waiting"] for report in reports
+        )
+        concurrency = max(1, sum(report["concurrency"] for report in reports))
+
+        eta_seconds = None
+        durations = [report["p50_seconds"] for report in reports if report["p50_seconds"]]
+        if durations:
+            job_seconds = statistics.mean(durations)
+            eta_seconds = (math.floor(backlog / concurrency) + 1) * job_seconds
+
+        return CapacityEstimate(
+            workers=len(reports),
+            backlog=backlog,
+            concurrency=concurrency,
+            eta_seconds=eta_seconds,
+        )
+
+
+def format_eta(seconds: float) -> str:
+    """
+    Время ожидания для сообщения пользователю.
+    """
+    minutes = math.ceil(seconds / 60)
+    if minutes <= 1:
+        return "меньше минуты"
+    if minutes < 60:
+        return f"около {minutes} мин"
+    hours, minutes = divmod(minutes, 60)
+    return f"около {hours} ч {minutes} мин" if minutes else f"около {hours} ч"
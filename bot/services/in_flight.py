@@ -0,0 +1,46 @@
+import time
+from collections import defaultdict, deque
+
+
+class InFlightLimiter:
+    """
+    Ограничение числа изображений пользователя, находящихся в обработке.
+
+    Место занимается перед публикацией в очередь и освобождается при получении
+    результата или сообщения об ошибке обработки. Если ответ потерян (например,
+    воркер остановился), занятое место освобождается само через timeout секунд.
+    """
+
+    def __init__(self, max_in_flight: int, timeout: float):
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self._started: dict = defaultdict(deque)
+
+    def _expire(self, chat_id, now):
+        started = self._started[chat_id]
+        while started and started[0] < now - self.timeout:
+            started.popleft()
+        return started
+
+    def in_flight(self, chat_id) -> int:
+        return len(self._expire(chat_id, time.monotonic()))
+
+    def try_acquire(self, chat_id) -> bool:
+        """
+        Занимает место, если у пользователя меньше max_in_flight задач в обработке.
+        """
+        if self.max_in_flight <= 0:
+            return True
+        now = time.monotonic()
+        started = self._expire(chat_id, now)
+        if len(started) >= self.max_in_flight:
+            return False
+        started.append(now)
+        return True
+
+    def release(self, chat_id) -> None:
+        started = self._started.get(chat_id)
+        if started:
+            started.popleft()
+        if not started:
+            self._started.pop(chat_id, None)
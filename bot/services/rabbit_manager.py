@@ -1,31 +1,114 @@
-import json
+import asyncio
+import io
 import logging
 import os
+import shutil
 from datetime import datetime
 
 import aio_pika
 from aio_pika import Channel, Connection, connect_robust
+from aio_pika.exceptions import DeliveryError, PublishError
 from aiogram import Bot
-from aiogram.types import BufferedInputFile
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
+from aiogram.types import BufferedInputFile, FSInputFile
 
 from bot.config import get_config
-from bot.scripts.message_scripts import extract_chat_id
+from bot.scripts.message_scripts import (
+    IMAGE_EXTENSIONS,
+    PHOTO_FORMATS,
+    create_image_message,
+    detect_image_format,
+    extract_chat_id,
+    message_priority,
+    photo_cache_parts,
+    size_class_queue,
+)
+from bot.services.capacity import CapacityEstimate, CapacityMonitor
+from bot.services.in_flight import InFlightLimiter
+from bot.services.rate_limit import DeliveryRateLimiter
+from shared.blob_store import BLOB_REF_HEADER, offload_body, release_body, resolve_body
+from shared.image_header import read_image_size
+from shared.result_cache import ResultCache
 
 config = get_config()
 
+# Ограничение Telegram на размер фотографии в send_photo
+TELEGRAM_PHOTO_MAX_BYTES = 10 * 1024 * 1024
+
 logger = logging.getLogger(__name__)
 
+# Сколько байт начала файла достаточно для определения формата и размеров
+HEADER_BYTES = 64 * 1024
+
+
+def read_header(image: bytes | str) -> bytes:
+    """
+    Начало изображения: из байтов или из файла по пути, не читая файл целиком.
+    """
+    if isinstance(image, str):
+        with open(image, "rb") as f:
+            return f.read(HEADER_BYTES)
+    return bytes(image[:HEADER_BYTES])
+
+
+def image_size_bytes(image: bytes | str) -> int:
+    return os.path.getsize(image) if isinstance(image, str) else len(image)
+
+
+def queue_arguments() -> dict:
+    """
+    Аргументы объявления очереди обработки; должны совпадать с аргументами воркера.
+    """
+    arguments = {}
+    if config.QUEUE_MAX_PRIORITY:
+        arguments["x-max-priority"] = config.QUEUE_MAX_PRIORITY
+    if config.QUEUE_MAX_LENGTH:
+        arguments["x-max-length"] = config.QUEUE_MAX_LENGTH
+        arguments["x-overflow"] = config.QUEUE_OVERFLOW
+    return arguments
+
+
+def processing_queues() -> list[str]:
+    """
+    Очереди обработки, в которые публикует бот.
+    """
+    if config.SIZE_ROUTING:
+        return [f"{config.QUEUE_PROCESS_IMAGE}.{size_class}" for size_class in ("small", "large")]
+    return [config.QUEUE_PROCESS_IMAGE]
+
+
+class QueueOverflowError(Exception):
+    """Очередь обработки заполнена (x-max-length), брокер отклонил сообщение."""
+
 
 class RabbitManager:
-    def __init__(self, rabbitmq_dsn: str, bot: Bot):
+    def __init__(
+        self,
+        rabbitmq_dsn: str,
+        bot: Bot,
+        result_cache: ResultCache | None = None,
+        blob_store=None,
+    ):
         self.rabbitmq_dsn = rabbitmq_dsn
         self.connection: Connection | None = None
         self.channel: Channel | None = None
         self.bot = bot
+        self.result_cache = result_cache
+        self.blob_store = blob_store
+        self.in_flight = InFlightLimiter(
+            config.USER_MAX_IN_FLIGHT,
+            timeout=config.USER_IN_FLIGHT_TIMEOUT,
+        )
+        self.capacity = CapacityMonitor(stale_after=config.STATS_STALE_SECONDS)
+        self.delivery_limiter = DeliveryRateLimiter(
+            global_rate=config.TELEGRAM_GLOBAL_RATE,
+            chat_rate=config.TELEGRAM_CHAT_RATE,
+            chat_burst=config.TELEGRAM_CHAT_BURST,
+        )
 
     @staticmethod
     async def _save_image_to_dir(
-        image_bytes: bytes,
+        image_bytes: bytes | str,
         chat_id: int,
         dir_name: str,
     ) -> str:
@@ -33,7 +116,7 @@ class RabbitManager:
         Сохраняет изображение в директорию dir_name, если DEBUG включен.
 
         Args:
-            image_bytes (bytes): Байты изображения.
+            image_bytes (bytes | str): Байты изображения или путь к файлу с ним.
             chat_id (int): ID пользователя.
             dir_name (str): Название директории
 
@@ -44,16 +127,28 @@ class RabbitManager:
             return None
 
         os.makedirs(dir_name, exist_ok=True)
-        file_name = f"{chat_id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.jpg"
+        extension = IMAGE_EXTENSIONS.get(detect_image_format(read_header(image_bytes)), "jpg")
+        file_name = f"{chat_id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}"
         file_path = os.path.join(dir_name, file_name)
-        with open(file_path, "wb") as f:
-            f.write(image_bytes)
+        if isinstance(image_bytes, str):
+            shutil.copyfile(image_bytes, file_path)
+        else:
+            with open(file_path, "wb") as f:
+                f.write(image_bytes)
         logger.debug(f"Изображение сохранено в {file_path}")
         return file_path
 
     async def connect(self):
         self.connection = await connect_robust(self.rabbitmq_dsn)
         self.channel = await self.connection.channel()
+        # Очереди объявляются и ботом: задачи, отправленные до запуска воркеров,
+        # ждут их в очереди, а не теряются как неразгружаемые
+        for queue_name in processing_queues():
+            await self.channel.declare_queue(
+                queue_name,
+                durable=True,
+                arguments=queue_arguments(),
+            )
 
     async def close(self) -> None:
         """
@@ -68,33 +163,258 @@ class RabbitManager:
         except Exception as e:
             logger.error(f"Ошибка при закрытии соединения с RabbitMQ: {e}")
 
-    async def send_json_to_queue(self, json_message):
+    def make_cache_key(self, file_unique_id: str, options: dict | None = None) -> str | None:
+        """
+        Ключ кэша результата для фотографии Telegram с заданными параметрами обработки.
+        """
+        if self.result_cache is None:
+            return None
+        return self.result_cache.make_key(
+            *photo_cache_parts(file_unique_id, options, config.RESULT_CACHE_VERSION),
+        )
+
+    async def get_cached_result(self, cache_key: str | None) -> bytes | None:
+        """
+        Возвращает ранее полученный результат обработки или None.
+        """
+        if self.result_cache is None or not cache_key:
+            return None
+        return await asyncio.to_thread(self.result_cache.get, cache_key)
+
+    def overloaded(self, estimate: CapacityEstimate | None) -> bool:
+        """
+        Превышены ли пороги допуска задач по статистике воркеров.
+        """
+        if estimate is None:
+            return False
+        return estimate.overloaded(
+            config.ADMISSION_MAX_BACKLOG,
+            config.ADMISSION_MAX_ETA_MINUTES * 60,
+        )
+
+    async def wait_for_capacity(self, timeout: float) -> CapacityEstimate | None:
+        """
+        Ждёт не дольше timeout секунд, пока загрузка опустится ниже порогов.
+
+        Returns:
+            CapacityEstimate | None: Последняя оценка загрузки.
+        """
+        deadline = asyncio.get_running_loop().time() + timeout
+        estimate = self.capacity.estimate()
+        while self.overloaded(estimate) and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(config.ADMISSION_POLL_SECONDS)
+            estimate = self.capacity.estimate()
+        return estimate
+
+    def _offload_threshold(self) -> int | None:
+        """
+        Порог размера для передачи фото через хранилище (None - только в теле).
+        """
+        # версия 1 протокола хранит всё в JSON-теле
+        if self.blob_store is None or config.MESSAGE_PROTOCOL_VERSION == 1:
+            return None
+        return config.BLOB_THRESHOLD_KB * 1024
+
+    async def download_photo(self, file, file_size: int | None = None) -> bytes | str:
+        """
+        Скачивает фото из Telegram без лишних копий в памяти.
+
+        Большое фото при настроенном хранилище скачивается частями сразу во
+        временный файл хранилища и уходит воркеру ссылкой, не попадая в память
+        бота; остальные - в буфер, bytes которого забираются без копирования.
+
+        Returns:
+            bytes | str: Байты фото или путь к временному файлу.
+        """
+        threshold = self._offload_threshold()
+        if threshold is not None and file_size and file_size > threshold:
+            path = await asyncio.to_thread(self.blob_store.temp_path)
+            try:
+                await self.bot.download(file, destination=path)
+            except Exception:
+                os.remove(path)
+                raise
+            return path
+
+        buffer = io.BytesIO()
+        await self.bot.download(file, destination=buffer)
+        # getvalue() отдаёт внутренний буфер BytesIO, а не его копию
+        return buffer.getvalue()
+
+    def _offload_file(self, path: str) -> dict:
+        try:
+            ref = self.blob_store.put_file(path)
+        except Exception:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        return {BLOB_REF_HEADER: ref}
+
+    async def _offload(self, photo_bytes: bytes | str) -> tuple[bytes, dict]:
+        """
+        Тело сообщения и заголовки ссылки на хранилище для фото или временного файла.
+        """
+        if isinstance(photo_bytes, str):
+            return b"", await asyncio.to_thread(self._offload_file, photo_bytes)
+        threshold = self._offload_threshold()
+        if threshold is None:
+            return photo_bytes, {}
+        return await asyncio.to_thread(offload_body, self.blob_store, photo_bytes, threshold)
+
+    @staticmethod
+    def _routing_key(pixels: int | None) -> str:
+        """
+        Очередь обработки: маленькие и большие изображения обрабатывают разные пулы воркеров.
+        """
+        if not config.SIZE_ROUTING:
+            return config.QUEUE_PROCESS_IMAGE
+        return size_class_queue(
+            config.QUEUE_PROCESS_IMAGE,
+            pixels,
+            int(config.SMALL_MAX_MEGAPIXELS * 1_000_000),
+        )
+
+    async def send_image_to_queue(
+        self,
+        chat_id: int,
+        photo_bytes: bytes | str,
+        cache_key: str | None = None,
+        options: dict | None = None,
+    ) -> None:
+        """
+        Публикует изображение в очередь обработки в формате
+        config.MESSAGE_PROTOCOL_VERSION.
+
+        photo_bytes - байты фото или путь к временному файлу из download_photo;
+        файл переносится в хранилище целиком, без чтения в память.
+        options передаются воркеру как есть, например параметры кодирования
+        результата: output_format, quality, chroma_subsampling, progressive.
+        """
+        blob_headers = {}
         try:
             if not self.channel:
                 raise ConnectionError("Канал RabbitMQ не установлен.")
 
+            # Размер из заголовка изображения: по нему воркер и RabbitMQ пропускают
+            # маленькие изображения вперёд больших
+            header = await asyncio.to_thread(read_header, photo_bytes)
+            size = read_image_size(header)
+            pixels = size[0] * size[1] if size else None
+
+            # Большая фотография уходит в хранилище, в очереди остаётся ссылка
+            photo_bytes, blob_headers = await self._offload(photo_bytes)
+            routing_key = self._routing_key(pixels)
+
             await self.channel.default_exchange.publish(
-                aio_pika.Message(
-                    body=json.dumps(json_message).encode(),
-                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                create_image_message(
+                    chat_id,
+                    photo_bytes,
+                    version=config.MESSAGE_PROTOCOL_VERSION,
+                    options=options,
+                    cache_key=cache_key,
+                    blob_ref=blob_headers.get(BLOB_REF_HEADER),
+                    pixels=pixels,
+                    priority=message_priority(pixels, config.QUEUE_MAX_PRIORITY),
                 ),
-                routing_key=config.QUEUE_PROCESS_IMAGE,
+                routing_key=routing_key,
             )
 
-            logger.info("Изображение отправлено в очередь")
+            logger.info(f"Изображение отправлено в очередь {routing_key}")
+        except DeliveryError as e:
+            await asyncio.to_thread(release_body, self.blob_store, blob_headers)
+            if isinstance(e, PublishError):
+                # сообщение вернулось (basic.return): очереди с таким именем нет
+                logger.error(f"Сообщение не доставлено ни в одну очередь: {e}")
+                raise
+            # очередь достигла x-max-length и отклоняет новые сообщения (basic.nack)
+            logger.warning(f"Очередь обработки переполнена: {e}")
+            raise QueueOverflowError("Очередь обработки переполнена.") from e
         except Exception as e:
             logger.error(f"Ошибка отправки изображения в очередь: {e}")
+            # временный файл не дошёл до хранилища
+            if isinstance(photo_bytes, str) and os.path.exists(photo_bytes):
+                os.remove(photo_bytes)
             raise e
 
-    async def send_image_to_chat(self, chat_id: str, image: bytes) -> None:
+    async def _send_limited(self, send, chat_id, **kwargs):
+        """
+        Вызывает метод отправки Bot с учётом лимитов Telegram.
+
+        На 429 (RetryAfter) ждёт указанное Telegram время, на сетевые ошибки -
+        экспоненциальную задержку; не больше DELIVERY_MAX_RETRIES повторов.
+        """
+        for attempt in range(config.DELIVERY_MAX_RETRIES + 1):
+            await self.delivery_limiter.acquire(chat_id)
+            try:
+                return await send(chat_id=chat_id, **kwargs)
+            except TelegramRetryAfter as e:
+                if attempt == config.DELIVERY_MAX_RETRIES:
+                    raise
+                logger.warning(f"Лимит Telegram для чата {chat_id}, повтор через {e.retry_after} с")
+                self.delivery_limiter.retry_after(chat_id, e.retry_after)
+            except TelegramNetworkError as e:
+                if attempt == config.DELIVERY_MAX_RETRIES:
+                    raise
+                logger.warning(f"Ошибка сети при отправке в чат {chat_id}: {e}")
+                await asyncio.sleep(2**attempt)
+
+    async def send_image_to_chat(
+        self,
+        chat_id: str,
+        image: bytes | str,
+        image_format: str | None = None,
+        as_document: bool = False,
+    ) -> None:
         """
         Отправляет изображение в чат.
+
+        image - байты или путь к файлу; файл загружается в Telegram частями,
+        не читаясь в память целиком.
+        Если результат не проходит ограничения send_photo (размер, формат или
+        подсказка воркера в заголовке delivery), он отправляется документом,
+        что заодно сохраняет его без пересжатия Telegram.
         """
-        image_file = BufferedInputFile(image, filename="processed_image.jpg")
-        await self.bot.send_photo(
-            chat_id=chat_id,
-            photo=image_file,
-            caption="Вот ваше обработанное изображение!",
+        if image_format is None:
+            image_format = detect_image_format(await asyncio.to_thread(read_header, image))
+        as_document = (
+            bool(as_document)
+            or image_size_bytes(image) > TELEGRAM_PHOTO_MAX_BYTES
+            or image_format not in PHOTO_FORMATS
+        )
+        filename = f"processed_image.{IMAGE_EXTENSIONS.get(image_format, 'jpg')}"
+        if isinstance(image, str):
+            image_file = FSInputFile(image, filename=filename)
+        else:
+            image_file = BufferedInputFile(image, filename=filename)
+        caption = "Вот ваше обработанное изображение!"
+
+        if not as_document:
+            try:
+                await self._send_limited(
+                    self.bot.send_photo,
+                    chat_id,
+                    photo=image_file,
+                    caption=caption,
+                )
+                return
+            except TelegramBadRequest as e:
+                logger.warning(f"Telegram не принял фото, отправляем документом: {e}")
+        await self._send_limited(
+            self.bot.send_document,
+            chat_id,
+            document=image_file,
+            caption=caption,
+        )
+
+    async def _notify_failure(self, chat_id, error) -> None:
+        """
+        Сообщает пользователю, что воркер не смог обработать изображение.
+        """
+        logger.warning(f"Воркер не смог обработать изображение чата {chat_id}: {error}")
+        await self._send_limited(
+            self.bot.send_message,
+            chat_id,
+            text="❌ Не удалось обработать изображение. Попробуйте отправить его ещё раз.",
         )
 
     async def _process_message(self, message) -> None:
@@ -103,33 +423,94 @@ class RabbitManager:
         """
         try:
             chat_id = extract_chat_id(message)
-            processed_image = message.body
+            self.in_flight.release(chat_id)
+            if message.headers.get("status") == "error":
+                await self._notify_failure(chat_id, message.headers.get("error"))
+                return
+            # Результат из хранилища отправляется из файла, не загружаясь в память
+            if message.headers.get(BLOB_REF_HEADER) and self.blob_store is not None:
+                processed_image = await asyncio.to_thread(
+                    self.blob_store.get_file, message.headers[BLOB_REF_HEADER],
+                )
+            else:
+                processed_image = await asyncio.to_thread(
+                    resolve_body, self.blob_store, message.headers, message.body,
+                )
 
-            await self._save_image_to_dir(
-                processed_image,
-                chat_id,
-                config.RESULT_DIR,
-            )
-            await self.send_image_to_chat(chat_id, processed_image)
+            try:
+                await self._save_image_to_dir(
+                    processed_image,
+                    chat_id,
+                    config.RESULT_DIR,
+                )
+                await self.send_image_to_chat(
+                    chat_id,
+                    processed_image,
+                    image_format=message.headers.get("format"),
+                    as_document=message.headers.get("delivery") == "document",
+                )
 
+                cache_key = message.headers.get("cache_key")
+                if self.result_cache is not None and cache_key:
+                    put = (
+                        self.result_cache.put_file
+                        if isinstance(processed_image, str)
+                        else self.result_cache.put
+                    )
+                    await asyncio.to_thread(put, cache_key, processed_image)
+            finally:
+                if isinstance(processed_image, str):
+                    await asyncio.to_thread(self.blob_store.release_file, processed_image)
+
+            await asyncio.to_thread(release_body, self.blob_store, message.headers)
             logger.info(f"Изображение успешно отправлено в чат {chat_id}")
         except Exception as e:
             logger.error(f"Ошибка при обработке сообщения: {e}")
 
-    async def process_result(self) -> None:
+    async def process_stats(self) -> None:
         """
-        Подписывается на очередь и обрабатывает результаты обработки изображений.
+        Подписывается на статистику воркеров для контроля допуска задач.
         """
         if not self.channel:
             raise ConnectionError("Канал RabbitMQ не установлен.")
 
-        queue = await self.channel.declare_queue(config.QUEUE_RESULT, durable=True)
-        logger.info("Подписан на очередь результатов")
+        exchange = await self.channel.declare_exchange(
+            config.STATS_EXCHANGE,
+            aio_pika.ExchangeType.FANOUT,
+        )
+        queue = await self.channel.declare_queue(exclusive=True)
+        await queue.bind(exchange)
+        logger.info("Подписан на статистику воркеров")
 
         try:
-            async with queue.iterator() as queue_iter:
+            async with queue.iterator(no_ack=True) as queue_iter:
                 async for message in queue_iter:
-                    async with message.process():
-                        await self._process_message(message)
+                    self.capacity.handle_message(message.body)
+        except Exception as e:
+            logger.error(f"Ошибка при получении статистики воркеров: {e}")
+
+    async def process_result(self) -> None:
+        """
+        Подписывается на очередь и обрабатывает результаты обработки изображений.
+
+        Результаты доставляются параллельно: одновременно в работе не больше
+        DELIVERY_CONCURRENCY сообщений (prefetch отдельного канала), частоту
+        отправок ограничивает delivery_limiter.
+        """
+        if not self.connection:
+            raise ConnectionError("Соединение с RabbitMQ не установлено.")
+
+        try:
+            channel = await self.connection.channel()
+            await channel.set_qos(prefetch_count=config.DELIVERY_CONCURRENCY)
+            queue = await channel.declare_queue(config.QUEUE_RESULT, durable=True)
+
+            async def deliver(message):
+                async with message.process():
+                    await self._process_message(message)
+
+            await queue.consume(deliver)
+            logger.info("Подписан на очередь результатов")
+            await asyncio.Future()
         except Exception as e:
             logger.error(f"Ошибка при обработке очереди: {e}")
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate токенов в секунду, не больше capacity подряд.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        # до этого момента токены не выдаются (ответ 429 от Telegram)
+        self._paused_until = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """
+        Берёт токен, если он есть, и возвращает 0; иначе - сколько секунд подождать.
+        """
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._refill(now)
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """
+        Не выдавать токены seconds секунд; после паузы доступен один токен.
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = min(1.0, self.capacity)
+        self._updated = self._paused_until
+
+    @property
+    def idle(self) -> bool:
+        """Ведро полное и не на паузе - его можно забыть."""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return False
+        self._refill(now)
+        return self._tokens >= self.capacity
+
+
+class DeliveryRateLimiter:
+    """
+    Ограничение частоты отправки сообщений в Telegram.
+
+    Общий лимит бота и лимит на каждый чат; ответ 429 (RetryAfter) ставит
+    отправки на паузу на указанное Telegram время.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float = 1):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._global = TokenBucket(global_rate, max(1.0, global_rate))
+        self._chats: dict = {}
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # ведра чатов без отправок удаляются, чтобы словарь не рос бесконечно
+            if len(self._chats) > 1000:
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def acquire(self, chat_id) -> None:
+        """
+        Ждёт, пока отправка в чат chat_id уложится в оба лимита.
+        """
+        chat_bucket = self._chat_bucket(chat_id)
+        while delay := chat_bucket.delay():
+            await asyncio.sleep(delay)
+        while delay := self._global.delay():
+            await asyncio.sleep(delay)
+
+    def retry_after(self, chat_id, seconds: float) -> None:
+        """
+        Учитывает ответ 429 от Telegram.
+
+        Из ответа не видно, превышен лимит чата или всего бота, поэтому пауза
+        действует на все отправки: при настроенных лимитах 429 приходит редко.
+        """
+        self._chat_bucket(chat_id).pause(seconds)
+        self._global.pause(seconds)
@@ -0,0 +1,136 @@
+import logging
+import os
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+# eager       - обычный nn.Module
+# compile     - torch.compile поверх eager-модели (компиляция при первом вызове)
+# torchscript - трассированная модель, сохранённая рядом с весами (*.ts)
+# onnx        - ONNX Runtime с CPUExecutionProvider (*.onnx)
+BACKENDS = ("eager", "compile", "torchscript", "onnx")
+
+_ARTIFACT_EXTENSIONS = {
+    "torchscript": ".ts",
+    "onnx": ".onnx",
+}
+
+ONNX_OPSET = 17
+
+
+def artifact_path(model_path, backend):
+    """
+    Путь к экспортированной модели рядом с файлом весов.
+    """
+    if backend not in _ARTIFACT_EXTENSIONS:
+        raise ValueError(f"Backend {backend} has no exported artifact")
+    return os.path.splitext(model_path)[0] + _ARTIFACT_EXTENSIONS[backend]
+
+
+def validate_backend(backend, device, precision):
+    """
+    Проверить, что бэкенд совместим с устройством и режимом точности.
+
+    :raises ValueError: Если сочетание не поддерживается.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+    if backend != "eager" and precision == "int8":
+        raise ValueError("int8 precision is supported only by the eager backend")
+    if backend in ("torchscript", "onnx") and precision != "fp32":
+        raise ValueError(f"Backend {backend} supports only fp32 precision")
+    if backend == "onnx" and device.type != "cpu":
+        raise ValueError("Backend onnx supports only CPU (CPUExecutionProvider)")
+
+
+def _example_input(model):
+    # pixel_unshuffle требует размеров, кратных 4
+    channels = int(model.conv_first.in_channels * (model.scale / 4) ** 2)
+    return torch.rand(1, channels, 64, 64)
+
+
+def export_model(model, model_path, backend):
+    """
+    Экспортировать eager-модель в формат бэкенда и сохранить рядом с весами.
+
+    :param model: RRDBNet с загруженными весами.
+    :param model_path: Путь к файлу весов (*.pth).
+    :param backend: "torchscript" или "onnx".
+    :return: Путь к сохранённому файлу.
+    """
+    path = artifact_path(model_path, backend)
+    model = model.cpu().eval()
+    example_input = _example_input(model)
+
+    with torch.no_grad():
+        if backend == "torchscript":
+            traced = torch.jit.trace(model, example_input)
+            traced = torch.jit.freeze(traced)
+            traced.save(path)
+        elif backend == "onnx":
+            dynamic_axes = {0: "batch", 2: "height", 3: "width"}
+            torch.onnx.export(
+                model,
+                (example_input,),
+                path,
+                input_names=["input"],
+                output_names=["output"],
+                dynamic_axes={"input": dynamic_axes, "output": dynamic_axes},
+                opset_version=ONNX_OPSET,
+                dynamo=False,
+            )
+
+    logger.info(f"Exported {backend} model to {path}")
+    return path
+
+
+class OnnxRuntimeModel:
+    """
+    Обёртка над onnxruntime.InferenceSession с интерфейсом вызова как у nn.Module.
+    """
+
+    def __init__(self, path, intra_op_threads=0):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads
+        self.session = onnxruntime.InferenceSession(
+            path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, input_tensor):
+        input_array = np.ascontiguousarray(input_tensor.detach().cpu().numpy())
+        output = self.session.run(None, {self.input_name: input_array})[0]
+        return torch.from_numpy(output).to(input_tensor.device)
+
+
+def load_backend(model, model_path, backend, device):
+    """
+    Вернуть вызываемую модель для выбранного бэкенда.
+
+    :param model: Eager-модель RRDBNet с загруженными весами на device.
+    :param model_path: Путь к файлу весов, рядом с которым лежат экспортированные модели.
+    :param backend: Один из BACKENDS.
+    :param device: Устройство инференса.
+    """
+    if backend == "eager":
+        return model
+    if backend == "compile":
+        return torch.compile(model, dynamic=True)
+
+    path = artifact_path(model_path, backend)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"{path} not found, export it with: "
+            f"python -m model.export --backend {backend} --model-path {model_path}",
+        )
+
+    if backend == "torchscript":
+        return torch.jit.load(path, map_location=device).eval()
+    return OnnxRuntimeModel(path)
@@ -0,0 +1,96 @@
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import torch
+from model.calibration import _PeakRssSampler
+from model.model import RRDBNet
+from model.precision import sample_image
+from model.real_esrgan_inference import RESRGANinf
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_prepare(model, img):
+    """Preprocessing as it was before the fused path: one full-size copy per step."""
+    img = img.astype(np.float32)
+    max_range = 65536 if np.max(img) > 256 else 256
+    img = cv2.cvtColor(img / max_range, cv2.COLOR_BGR2RGB)
+    return model.pre_process(img)
+
+
+def fused_prepare(model, img):
+    ctx = model.fused_pre_process(img)
+    model.release(ctx)
+    return ctx
+
+
+def _measure(prepare, model, img, repeats):
+    prepare(model, img)  # warm-up, fills the buffer pool
+    with _PeakRssSampler() as sampler:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            prepare(model, img)
+        elapsed = (time.perf_counter() - start) / repeats
+    return elapsed, sampler.peak_kb / 1024
+
+
+def benchmark(model, height, width, repeats=10):
+    """
+    Compare legacy and fused preprocessing of one height x width uint8 image.
+
+    :return: Dict with mean seconds and peak RSS growth (MB) for both paths.
+    """
+    img = np.ascontiguousarray(
+        cv2.resize(sample_image(), (width, height), interpolation=cv2.INTER_NEAREST),
+    )
+    legacy_seconds, legacy_mb = _measure(legacy_prepare, model, img, repeats)
+    fused_seconds, fused_mb = _measure(fused_prepare, model, img, repeats)
+    return {
+        "legacy_seconds": legacy_seconds,
+        "legacy_peak_mb": legacy_mb,
+        "fused_seconds": fused_seconds,
+        "fused_peak_mb": fused_mb,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк предобработки изображения")
+    parser.add_argument("--sizes", default="1000x750,2000x1500,4000x3000")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--precision", default="fp32")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    # веса не влияют на предобработку, достаточно маленькой модели
+    model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=8, num_block=1, num_grow_ch=8, scale=4)
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = os.path.join(directory, "model.pth")
+        torch.save({"params_ema": model.state_dict()}, model_path)
+        inference = RESRGANinf(
+            scale=4,
+            model=model,
+            model_path=model_path,
+            device=args.device,
+            precision=args.precision,
+        )
+
+    for size in args.sizes.split(","):
+        width, height = (int(value) for value in size.split("x"))
+        result = benchmark(inference, height, width, args.repeats)
+        logger.info(
+            f"{width}x{height}: legacy {result['legacy_seconds'] * 1000:.1f} ms, "
+            f"+{result['legacy_peak_mb']:.0f} MB; fused {result['fused_seconds'] * 1000:.1f} ms, "
+            f"+{result['fused_peak_mb']:.0f} MB "
+            f"(x{result['legacy_seconds'] / result['fused_seconds']:.2f})",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+import psutil
+import torch
+from model.precision import autocast_context, parameter_dtype
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROBE_SIZES = (64, 96, 128, 160)
+
+
+class _PeakRssSampler:
+    """
+    Замеряет пиковый прирост RSS процесса, опрашивая его в фоновом потоке.
+
+    Крупные тензоры CPU выделяются через mmap и сразу возвращаются системе,
+    поэтому прирост RSS хорошо отражает пиковую память прямого прохода.
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.baseline = 0
+        self.peak = 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.baseline = self.peak = self._process.memory_info().rss
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._process.memory_info().rss)
+
+    @property
+    def peak_kb(self):
+        return (self.peak - self.baseline) / 1024
+
+
+def calibration_key(device, precision, scale):
+    """
+    Ключ записи калибровки: устройство, режим точности и масштаб модели.
+    """
+    return f"{device.type}:{precision}:x{scale}"
+
+
+def _probe_channels(model):
+    # pixel_unshuffle увеличивает число входных каналов для scale 2 и 1
+    return int(model.conv_first.in_channels * (model.scale / 4) ** 2)
+
+
+def measure_peak_kb(model, device, size, precision="fp32"):
+    """
+    Измерить пиковую память одного прямого прохода на квадратном входе size x size.
+
+    :return: Пиковая память в килобайтах.
+    """
+    dtype = parameter_dtype(precision)
+    probe = torch.rand(1, _probe_channels(model), size, size, device=device, dtype=dtype)
+
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+        baseline = torch.cuda.memory_allocated(device)
+        with torch.no_grad(), autocast_context(precision, device):
+            model(probe)
+        torch.cuda.synchronize(device)
+        return (torch.cuda.max_memory_allocated(device) - baseline) / 1024
+
+    with _PeakRssSampler() as sampler, torch.no_grad(), autocast_context(precision, device):
+        model(probe)
+    return sampler.peak_kb
+
+
+def _floor_pixel_cost(calibration, min_pixel_cost_kb):
+    """
+    Не дать измеренной стоимости пикселя опуститься ниже аналитической оценки.
+
+    На CPU аллокатор переиспользует освобождённую память без роста RSS, и
+    замеры могут почти не расти с размером входа: без нижней границы бюджет
+    памяти выглядит бесконечным и тайлинг фактически отключается.
+    """
+    if min_pixel_cost_kb is None or calibration["pixel_cost_kb"] >= min_pixel_cost_kb:
+        return calibration
+    logger.warning(
+        f"Measured pixel cost {calibration['pixel_cost_kb']:.4f} KB is below the estimate "
+        f"{min_pixel_cost_kb:.4f} KB, using the estimate.",
+    )
+    return {**calibration, "pixel_cost_kb": float(min_pixel_cost_kb)}
+
+
+def calibrate_pixel_cost(
+    model,
+    device,
+    probe_sizes=DEFAULT_PROBE_SIZES,
+    precision="fp32",
+    min_pixel_cost_kb=None,
+):
+    """
+    Прогнать модель на нескольких размерах входа и подобрать линейную модель
+    стоимости памяти: peak_kb = pixel_cost_kb * pixels + fixed_cost_kb.
+
+    :param model: Экземпляр RRDBNet, уже перенесённый на device.
+    :param device: Устройство (CPU или CUDA).
+    :param probe_sizes: Стороны пробных входов в пикселях.
+    :param precision: Режим точности (см. model.precision.PRECISIONS).
+    :param min_pixel_cost_kb: Нижняя граница стоимости пикселя, обычно
+        model.memory_manager.estimate_pixel_cost_kb.
+    :return: Словарь с pixel_cost_kb и fixed_cost_kb.
+    """
+    # прогрев: первая итерация включает инициализацию библиотек и кэшей
+    measure_peak_kb(model, device, probe_sizes[0], precision)
+
+    pixels, peaks = [], []
+    for size in probe_sizes:
+        peak_kb = measure_peak_kb(model, device, size, precision)
+        pixels.append(size * size)
+        peaks.append(peak_kb)
+        logger.debug(f"Calibration probe {size}x{size}: peak {peak_kb:.2f} KB")
+
+    pixel_cost_kb, fixed_cost_kb = np.polyfit(pixels, peaks, 1)
+    calibration = {
+        "pixel_cost_kb": float(max(pixel_cost_kb, 1e-3)),
+        "fixed_cost_kb": float(max(fixed_cost_kb, 0.0)),
+    }
+    return _floor_pixel_cost(calibration, min_pixel_cost_kb)
+
+
+def load_or_calibrate(
+    model,
+    device,
+    cache_path,
+    probe_sizes=DEFAULT_PROBE_SIZES,
+    precision="fp32",
+    force=False,
+    min_pixel_cost_kb=None,
+):
+    """
+    Вернуть калибровку памяти из кэш-файла или выполнить её и сохранить.
+
+    :param model: Экземпляр RRDBNet, уже перенесённый на device.
+    :param device: Устройство.
+    :param cache_path: Путь к JSON-файлу с результатами калибровки.
+    :param probe_sizes: Стороны пробных входов в пикселях.
+    :param precision: Режим точности (см. model.precision.PRECISIONS).
+    :param force: Выполнить калибровку заново, даже если она есть в кэше.
+    :param min_pixel_cost_kb: Нижняя граница стоимости пикселя, применяется
+        и к результатам из кэша.
+    :return: Словарь с pixel_cost_kb и fixed_cost_kb или None, если устройство
+        не поддерживает замер памяти.
+    """
+    if device.type not in ("cpu", "cuda"):
+        logger.warning(f"Memory calibration is not supported on {device}, using estimate.")
+        return None
+
+    key = calibration_key(device, precision, model.scale)
+
+    cache = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cache = json.load(f)
+        if key in cache and not force:
+            logger.debug(f"Loaded memory calibration {key}: {cache[key]}")
+            return _floor_pixel_cost(cache[key], min_pixel_cost_kb)
+
+    logger.info(f"Calibrating memory cost model for {key}...")
+    cache[key] = calibrate_pixel_cost(model, device, probe_sizes, precision, min_pixel_cost_kb)
+    logger.info(f"Memory calibration {key}: {cache[key]}")
+
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, cache_path)
+
+    return cache[key]
@@ -0,0 +1,37 @@
+import argparse
+import logging
+
+from model.backends import export_model
+from model.model import RRDBNet
+from model.weights import load_weights
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Экспорт RRDBNet в TorchScript или ONNX рядом с файлом весов",
+    )
+    parser.add_argument("--backend", choices=["torchscript", "onnx"], required=True)
+    parser.add_argument("--model-path", default="model/RealESRGAN_x4plus.pth")
+    parser.add_argument("--scale", type=int, default=4)
+    parser.add_argument("--num-block", type=int, default=23)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    model = RRDBNet(
+        num_in_ch=3,
+        num_out_ch=3,
+        num_feat=64,
+        num_block=args.num_block,
+        num_grow_ch=32,
+        scale=args.scale,
+    )
+    load_weights(model, args.model_path)
+
+    export_model(model, args.model_path, args.backend)
+
+
+if __name__ == "__main__":
+    main()
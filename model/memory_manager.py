@@ -1,46 +1,125 @@
 import logging
 import math
+from dataclasses import dataclass
 
 import psutil
 import torch
 
 logger = logging.getLogger(__name__)
 
+# Запас на фрагментацию аллокатора и рабочие буферы свёрток
+ACTIVATION_OVERHEAD = 1.5
+
+
+def estimate_pixel_cost_kb(model, bytes_per_element=4):
+    """
+    Оценить пиковую память RRDBNet на один входной пиксель.
+
+    Учитываются живые активации основной ветки (вход RRDB, конкатенация
+    плотного блока) и ступеней апсемплинга, которые работают в scale**2
+    раз большем разрешении, а также входной и выходной тензоры.
+
+    :param model: Экземпляр RRDBNet.
+    :param bytes_per_element: Размер одного элемента тензора в байтах.
+    :return: Стоимость одного входного пикселя (по всем каналам) в килобайтах.
+    """
+    num_feat = model.conv_first.out_channels
+    num_grow_ch = model.body[0].rdb1.conv1.out_channels
+    num_out_ch = model.conv_last.out_channels
+    scale = model.scale
+    # pixel_unshuffle уменьшает разрешение основной ветки для scale 2 и 1
+    trunk_pixels = (scale / 4) ** 2
+
+    trunk_elements = (5 * num_feat + 8 * num_grow_ch) * trunk_pixels
+    upsample_elements = (3 * num_feat + num_out_ch) * scale**2
+    io_elements = num_out_ch * (1 + scale**2)
+
+    elements = max(trunk_elements, upsample_elements) + io_elements
+    return elements * bytes_per_element * ACTIVATION_OVERHEAD / 1024
+
+
+@dataclass(frozen=True)
+class TilePlan:
+    """
+    План тайлинга изображения.
+
+    tile_size равен None, если изображение целиком помещается в память.
+    """
+
+    tile_size: int | None
+    tile_pad: int
+    batch_size: int
+
+    @property
+    def tiled(self):
+        return self.tile_size is not None
+
 
 class MemoryManager:
-    def __init__(self, pixel_cost_kb, device):
+    def __init__(
+        self,
+        pixel_cost_kb,
+        device,
+        fixed_cost_kb=0.0,
+        memory_fraction=0.5,
+        min_tile_size=64,
+        max_tile_size=1024,
+        tile_align=8,
+    ):
         """
         Инициализация менеджера памяти.
 
-        :param pixel_cost_kb: Стоимость одного пикселя в килобайтах.
+        :param pixel_cost_kb: Пиковая стоимость одного входного пикселя (по всем каналам)
+            в килобайтах, включая промежуточные активации модели.
         :param device: Устройство (например, MPS, CUDA, CPU).
+        :param fixed_cost_kb: Постоянная часть пиковой памяти прохода, не зависящая
+            от размера входа, в килобайтах.
+        :param memory_fraction: Доля доступной памяти, которую можно занять под инференс.
+        :param min_tile_size: Минимальная сторона тайла в пикселях.
+        :param max_tile_size: Максимальная сторона тайла в пикселях.
+        :param tile_align: Кратность стороны тайла.
         """
         self.pixel_cost_kb = pixel_cost_kb
+        self.fixed_cost_kb = fixed_cost_kb
         self.device = device
-        self.memory_limit_kb = self.__get_memory_limit()  # Кэшируем лимит памяти
+        self.memory_fraction = memory_fraction
+        self.min_tile_size = min_tile_size
+        self.max_tile_size = max_tile_size
+        self.tile_align = tile_align
 
         logger.debug(
-            f"Initialized MemoryManager with pixel_cost_kb={self.pixel_cost_kb}, "
-            f"device={self.device}, memory_limit_kb={self.memory_limit_kb:.2f}",
+            f"Initialized MemoryManager with pixel_cost_kb={self.pixel_cost_kb:.2f}, "
+            f"fixed_cost_kb={self.fixed_cost_kb:.2f}, device={self.device}, "
+            f"memory_limit_kb={self.memory_limit_kb:.2f}",
         )
 
+    @property
+    def memory_limit_kb(self):
+        """
+        Доступная память устройства, перечитывается при каждом обращении,
+        чтобы план тайлинга учитывал текущую нагрузку.
+        """
+        return self.__get_memory_limit()
+
     def __get_memory_limit(self):
         """
         Получить рекомендуемое ограничение памяти для устройства.
 
         :return: Рекомендуемое ограничение памяти в килобайтах.
         """
-        if self.device == torch.device("mps"):
+        if self.device.type == "mps":
             if not hasattr(torch.mps, "recommended_max_memory"):
                 raise RuntimeError("MPS is not supported or PyTorch is not properly configured.")
             memory_limit = torch.mps.recommended_max_memory() / 1024
-        elif self.device == torch.device("cuda"):
+        elif self.device.type == "cuda":
             if not torch.cuda.is_available():
                 raise RuntimeError("CUDA is not available.")
-            device_index = torch.cuda.current_device()
+            device_index = (
+                self.device.index if self.device.index is not None else torch.cuda.current_device()
+            )
             free_memory, _ = torch.cuda.mem_get_info(device_index)
             memory_limit = free_memory / 1024
-        elif self.device == torch.device("cpu"):
+        elif self.device.type == "cpu":
             memory_info_available_kb = psutil.virtual_memory().available / 1024
             memory_limit = memory_info_available_kb
         else:
@@ -50,37 +129,73 @@ class MemoryManager:
 
         return memory_limit
 
-    @staticmethod
-    def __calculate_pixel_count(batch, channel, height, width):
+    @property
+    def max_pixels(self):
+        """
+        Максимальное число входных пикселей за один прямой проход модели.
         """
-        Рассчитать общее количество пикселей для заданных параметров изображения.
+        budget_kb = self.memory_limit_kb * self.memory_fraction - self.fixed_cost_kb
+        return max(0, int(budget_kb / self.pixel_cost_kb))
 
-        :param batch: Размер батча (количество изображений).
-        :param channel: Количество каналов (например, 3 для RGB, 1 для Grayscale).
-        :param height: Высота изображения в пикселях.
-        :param width: Ширина изображения в пикселях.
-        :return: Общее количество пикселей.
+    def calculate_batch_size(self, tile_height, tile_width, max_batch_size=8):
         """
-        return batch * channel * height * width
+        Рассчитать, сколько тайлов одного размера можно обработать за один
+        прямой проход модели в рамках ограничений памяти.
 
-    def calculate_tile_count(self, batch, channel, width, height):
+        :param tile_height: Высота тайла с учётом отступов в пикселях.
+        :param tile_width: Ширина тайла с учётом отступов в пикселях.
+        :param max_batch_size: Верхняя граница размера батча.
+        :return: Размер батча (int), не меньше 1.
         """
-        Рассчитать количество тайлов, необходимых для обработки изображения
-        в рамках ограничений памяти.
+        max_pixels = self.max_pixels
+        batch_size = max(1, min(max_batch_size, max_pixels // (tile_height * tile_width)))
 
-        :param batch: Размер батча (количество изображений).
-        :param channel: Количество каналов.
-        :param width: Ширина изображения в пикселях.
-        :param height: Высота изображения в пикселях.
-        :return: Количество тайлов (int).
+        logger.debug(
+            f"Calculated batch size: {batch_size} for tile {tile_height}x{tile_width} "
+            f"and max_pixels={max_pixels}",
+        )
+        return batch_size
+
+    def plan_tiles(self, height, width, tile_pad, max_batch_size=8):
         """
-        pixel_count = self.__calculate_pixel_count(batch, channel, width, height)
-        required_memory_kb = pixel_count * self.pixel_cost_kb
+        Подобрать самый крупный тайл и батч, помещающиеся в бюджет памяти.
 
-        tile_count = math.ceil(required_memory_kb / self.memory_limit_kb)
+        Сторона тайла выравнивается так, чтобы изображение делилось на тайлы
+        почти одинакового размера: так меньше лишних вычислений на краях и
+        больше тайлов одной формы для батчинга.
+
+        :param height: Высота изображения в пикселях.
+        :param width: Ширина изображения в пикселях.
+        :param tile_pad: Перекрытие тайлов (отступ с каждой стороны) в пикселях.
+        :param max_batch_size: Верхняя граница размера батча.
+        :return: План тайлинга (TilePlan).
+        """
+        max_pixels = self.max_pixels
+        if height * width <= max_pixels:
+            plan = TilePlan(tile_size=None, tile_pad=0, batch_size=1)
+            logger.debug(f"Tile plan for {height}x{width}: whole image, max_pixels={max_pixels}")
+            return plan
+
+        tile_size = int(math.isqrt(max_pixels)) - 2 * tile_pad
+        tile_size = tile_size // self.tile_align * self.tile_align
+        tile_size = max(self.min_tile_size, min(self.max_tile_size, tile_size))
+
+        # выравниваем тайлы по размеру изображения, сохраняя кратность tile_align;
+        # округление вверх не выходит за исходный тайл, так что бюджет соблюдается
+        tiles_y = math.ceil(height / tile_size)
+        tiles_x = math.ceil(width / tile_size)
+        balanced = max(math.ceil(height / tiles_y), math.ceil(width / tiles_x))
+        tile_size = min(tile_size, math.ceil(balanced / self.tile_align) * self.tile_align)
+
+        padded = tile_size + 2 * tile_pad
+        batch_size = min(
+            self.calculate_batch_size(padded, padded, max_batch_size),
+            tiles_y * tiles_x,
+        )
 
+        plan = TilePlan(tile_size=tile_size, tile_pad=tile_pad, batch_size=batch_size)
         logger.debug(
-            f"Calculated tile count: {tile_count} for required_memory_kb={required_memory_kb:.2f} "
-            f"and memory_limit_kb={self.memory_limit_kb:.2f}",
+            f"Tile plan for {height}x{width}: {plan}, tiles={tiles_y}x{tiles_x}, "
+            f"max_pixels={max_pixels}",
         )
-        return tile_count
+        return plan
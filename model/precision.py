@@ -0,0 +1,165 @@
+import contextlib
+import logging
+import time
+
+import cv2
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+# fp32     - полная точность
+# fp16     - веса и активации в float16 (CUDA, MPS)
+# bf16     - веса и активации в bfloat16 (CPU с AVX512/AMX, CUDA Ampere+)
+# autocast - веса в float32, свёртки в пониженной точности через torch.autocast
+# int8     - статическая int8-квантизация свёрток RRDB (только CPU)
+PRECISIONS = ("fp32", "fp16", "bf16", "autocast", "int8")
+
+_SUPPORTED_DEVICES = {
+    "fp32": ("cpu", "cuda", "mps"),
+    "fp16": ("cuda", "mps"),
+    "bf16": ("cpu", "cuda"),
+    "autocast": ("cpu", "cuda"),
+    "int8": ("cpu",),
+}
+
+
+def validate_precision(precision, device):
+    """
+    Проверить, что режим точности поддерживается устройством.
+
+    :raises ValueError: Если режим неизвестен или не поддерживается устройством.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision}, expected one of {PRECISIONS}")
+    if device.type not in _SUPPORTED_DEVICES[precision]:
+        raise ValueError(f"Precision {precision} is not supported on {device}")
+    if precision == "bf16" and device.type == "cuda" and not torch.cuda.is_bf16_supported():
+        raise ValueError(f"Precision bf16 is not supported on {device}")
+    if precision == "bf16" and device.type == "cpu":
+        capability = torch.backends.cpu.get_cpu_capability()
+        if capability != "AVX512":
+            logger.warning(f"CPU capability is {capability}, bf16 inference may be slow.")
+
+
+def parameter_dtype(precision):
+    """Тип весов и входного тензора модели."""
+    if precision == "fp16":
+        return torch.float16
+    if precision == "bf16":
+        return torch.bfloat16
+    return torch.float32
+
+
+def bytes_per_element(precision):
+    """Размер элемента промежуточных активаций в байтах."""
+    # в режиме int8 апсемплинг, где находится пик памяти, остаётся в fp32
+    return 2 if precision in ("fp16", "bf16", "autocast") else 4
+
+
+def autocast_context(precision, device):
+    """Контекст смешанной точности для прямого прохода модели."""
+    if precision != "autocast":
+        return contextlib.nullcontext()
+    dtype = torch.float16 if device.type == "cuda" else torch.bfloat16
+    return torch.autocast(device_type=device.type, dtype=dtype)
+
+
+def psnr(reference, candidate, max_value=255.0):
+    """
+    Пиковое отношение сигнал/шум между двумя изображениями в дБ.
+    """
+    mse = np.mean((reference.astype(np.float64) - candidate.astype(np.float64)) ** 2)
+    if mse == 0:
+        return float("inf")
+    return float(10 * np.log10(max_value**2 / mse))
+
+
+def sample_image(height=96, width=96, seed=0):
+    """
+    Детерминированное тестовое изображение: плавные градиенты с мелкими деталями.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack(
+        [
+            127 + 100 * np.sin(x / 9),
+            127 + 100 * np.cos(y / 13),
+            127 + 100 * np.sin((x + y) / 17),
+        ],
+        axis=2,
+    )
+    noise = rng.normal(0, 12, size=base.shape)
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def ssim(reference, candidate, max_value=255.0):
+    """
+    Индекс структурного сходства (SSIM) с гауссовым окном 11x11, усреднённый по каналам.
+    """
+    c1 = (0.01 * max_value) ** 2
+    c2 = (0.03 * max_value) ** 2
+    reference = reference.astype(np.float64)
+    candidate = candidate.astype(np.float64)
+
+    def blur(img):
+        return cv2.GaussianBlur(img, (11, 11), 1.5)
+
+    mu_x, mu_y = blur(reference), blur(candidate)
+    sigma_x = blur(reference * reference) - mu_x**2
+    sigma_y = blur(candidate * candidate) - mu_y**2
+    sigma_xy = blur(reference * candidate) - mu_x * mu_y
+
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * sigma_xy + c2)) / (
+        (mu_x**2 + mu_y**2 + c1) * (sigma_x + sigma_y + c2)
+    )
+    return float(ssim_map.mean())
+
+
+def _timed_upgrade(model, img):
+    start = time.perf_counter()
+    output, _ = model.upgrade_resolution(img)
+    return output, time.perf_counter() - start
+
+
+def precision_report(candidate, reference, images=None):
+    """
+    Сравнить модель в пониженной точности с fp32 по качеству и скорости.
+
+    :param candidate: RESRGANinf в проверяемом режиме точности.
+    :param reference: RESRGANinf в режиме fp32 с теми же весами.
+    :param images: Изображения BGR uint8; по умолчанию используется sample_image().
+    :return: Словарь с минимальными PSNR (дБ) и SSIM по изображениям, суммарным
+        временем обработки обеих моделей (с) и ускорением.
+    """
+    if not images:
+        images = [sample_image()]
+
+    # прогрев, чтобы не учитывать инициализацию библиотек
+    reference.upgrade_resolution(images[0])
+    candidate.upgrade_resolution(images[0])
+
+    psnr_values, ssim_values = [], []
+    reference_time = candidate_time = 0.0
+    for img in images:
+        reference_output, elapsed = _timed_upgrade(reference, img)
+        reference_time += elapsed
+        candidate_output, elapsed = _timed_upgrade(candidate, img)
+        candidate_time += elapsed
+        psnr_values.append(psnr(reference_output, candidate_output))
+        ssim_values.append(ssim(reference_output, candidate_output))
+
+    report = {
+        "precision": candidate.precision,
+        "psnr": min(psnr_values),
+        "ssim": min(ssim_values),
+        "reference_seconds": reference_time,
+        "candidate_seconds": candidate_time,
+        "speedup": reference_time / candidate_time if candidate_time else float("inf"),
+    }
+    logger.info(
+        f"Precision {report['precision']} vs fp32: PSNR {report['psnr']:.2f} dB, "
+        f"SSIM {report['ssim']:.4f}, {report['candidate_seconds']:.2f}s vs "
+        f"{report['reference_seconds']:.2f}s (x{report['speedup']:.2f})",
+    )
+    return report
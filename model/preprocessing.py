@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict
+
+import torch
+
+
+class BufferPool:
+    """
+    Reusable input tensors keyed by shape, dtype and device.
+
+    Photos from one camera or chat tend to share a resolution, so the NCHW input
+    buffer of a finished request is kept and handed to the next request of the
+    same shape instead of being allocated again.
+    """
+
+    def __init__(self, max_shapes=4, buffers_per_shape=2):
+        self.max_shapes = max_shapes
+        self.buffers_per_shape = buffers_per_shape
+        self._free: OrderedDict[tuple, list[torch.Tensor]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, shape, dtype, device):
+        key = (tuple(shape), dtype, device)
+        with self._lock:
+            buffers = self._free.get(key)
+            if buffers:
+                self._free.move_to_end(key)
+                return buffers.pop()
+        return torch.empty(shape, dtype=dtype, device=device)
+
+    def release(self, tensor):
+        key = (tuple(tensor.shape), tensor.dtype, tensor.device)
+        with self._lock:
+            buffers = self._free.setdefault(key, [])
+            self._free.move_to_end(key)
+            if len(buffers) < self.buffers_per_shape:
+                buffers.append(tensor)
+            while len(self._free) > self.max_shapes:
+                self._free.popitem(last=False)
+
+
+def reflect_pad_(tensor, height, width, pad_h, pad_w):
+    """
+    Reflect-pad in place the bottom and right of the top-left height x width area
+    of an NCHW tensor, same as functional.pad(..., (0, pad_w, 0, pad_h), "reflect").
+    """
+    if pad_h:
+        tensor[:, :, height : height + pad_h, :width] = tensor[
+            :, :, height - 1 - pad_h : height - 1, :width
+        ].flip(2)
+    if pad_w:
+        tensor[:, :, : height + pad_h, width : width + pad_w] = tensor[
+            :, :, : height + pad_h, width - 1 - pad_w : width - 1
+        ].flip(3)
+
+
+def fill_input(buffer, img):
+    """
+    Write a uint8 BGR (HWC) or grayscale (HW) image into the top-left corner of an
+    NCHW buffer as normalised RGB, converting dtype in the same pass.
+    """
+    height, width = img.shape[:2]
+    source = torch.from_numpy(img).to(buffer.device)
+    target = buffer[0, :, :height, :width]
+    if img.ndim == 2:
+        target.copy_(source.expand(3, height, width))
+    else:
+        # channel flip through per-channel views, no intermediate RGB copy
+        for channel in range(3):
+            target[channel].copy_(source[:, :, 2 - channel])
+    # 1 / 256 is exact in every supported dtype
+    target.mul_(1 / 256)
@@ -0,0 +1,43 @@
+import logging
+
+import torch
+from torch.ao.quantization import QConfigMapping, get_default_qconfig
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+logger = logging.getLogger(__name__)
+
+
+def quantize_model(model, calibration_inputs, backend="x86"):
+    """
+    Static post-training int8 quantization of the RRDB trunk (FX graph mode).
+
+    Only the convolutions of ResidualDenseBlock/RRDB (model.body) are quantized:
+    they take almost all of the compute, while the first convolution and the
+    upsampling head stay in fp32 to keep colour accuracy.
+
+    Args:
+        model (RRDBNet): fp32 model on CPU in eval mode.
+        calibration_inputs (list[Tensor]): Pre-processed NCHW inputs used to
+            collect activation ranges.
+        backend (str): Quantized engine, "x86" or "qnnpack".
+
+    Returns:
+        GraphModule: Quantized model with the same forward signature.
+    """
+    if not calibration_inputs:
+        raise ValueError("At least one calibration input is required for int8 quantization.")
+
+    torch.backends.quantized.engine = backend
+    qconfig_mapping = QConfigMapping().set_module_name("body", get_default_qconfig(backend))
+
+    model.eval()
+    prepared = prepare_fx(model, qconfig_mapping, example_inputs=(calibration_inputs[0],))
+    with torch.no_grad():
+        for calibration_input in calibration_inputs:
+            prepared(calibration_input)
+    quantized = convert_fx(prepared)
+    # GraphModule keeps only submodules, model attributes used elsewhere are copied
+    quantized.scale = model.scale
+
+    logger.info(f"Quantized RRDB trunk to int8 using {len(calibration_inputs)} calibration inputs.")
+    return quantized
@@ -1,15 +1,95 @@
 import logging
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
 
 import cv2
 import numpy as np
 import torch
-from model.memory_manager import MemoryManager
+from model.backends import load_backend, validate_backend
+from model.calibration import load_or_calibrate
+from model.memory_manager import MemoryManager, estimate_pixel_cost_kb
+from model.precision import (
+    autocast_context,
+    bytes_per_element,
+    parameter_dtype,
+    sample_image,
+    validate_precision,
+)
+from model.preprocessing import BufferPool, fill_input, reflect_pad_
+from model.quantization import quantize_model
+from model.tile_pipeline import TilePipeline
+from model.weights import load_weights
 from torch.nn import functional
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class InferenceContext:
+    """Per-request state of a single upgrade_resolution call."""
+
+    img: torch.Tensor
+    mod_pad_h: int = 0
+    mod_pad_w: int = 0
+    output: torch.Tensor | None = None
+    img_mode: str = "RGB"
+    max_range: int = 256
+    alpha: np.ndarray | None = None
+    # sum of blending weights per output pixel when tiles are feathered
+    weight: torch.Tensor | None = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # img is a pooled buffer to be returned with RESRGANinf.release
+    pooled: bool = False
+
+
+@dataclass(frozen=True)
+class Tile:
+    """Position of one tile in the input image and in the upscaled output."""
+
+    input_y: slice
+    input_x: slice
+    output_y: slice
+    output_x: slice
+    tile_y: slice
+    tile_x: slice
+
+    @property
+    def padded_shape(self):
+        return (
+            self.input_y.stop - self.input_y.start,
+            self.input_x.stop - self.input_x.start,
+        )
+
+    def padded_output(self, scale):
+        """Area of the whole upscaled tile, context padding included, in the output."""
+        return (
+            slice(self.input_y.start * scale, self.input_y.stop * scale),
+            slice(self.input_x.start * scale, self.input_x.stop * scale),
+        )
+
+
+TILE_BLENDS = ("linear", "cosine")
+
+
+def blend_ramp(length, blend):
+    """Weights rising from 0 to 1 over length pixels; a ramp and its reverse sum to 1."""
+    position = (torch.arange(length, dtype=torch.float32) + 0.5) / length
+    if blend == "cosine":
+        return 0.5 - 0.5 * torch.cos(torch.pi * position)
+    return position
+
+
 class RESRGANinf:
+    """
+    Real-ESRGAN inference wrapper.
+
+    The instance only holds read-only configuration and the model, all per-request
+    state lives in an InferenceContext, so one loaded model can serve concurrent
+    upgrade_resolution calls from several threads.
+    """
+
     def __init__(
         self,
         scale,
@@ -19,14 +99,80 @@ class RESRGANinf:
         calc_tiles=False,
         tile_pad=10,
         pad=10,
-        pixel_size_kb=50,
+        pixel_size_kb=None,
+        max_tile_batch=8,
+        calibrate=False,
+        calibration_cache=None,
+        precision="fp32",
+        calibration_images=None,
+        backend="eager",
+        stream_min_pixels=None,
+        stream_tile_size=512,
+        stream_buffer_dir=None,
+        pipeline_workers=2,
+        tile_blend=None,
     ) -> None:
+        if tile_blend is not None and tile_blend not in TILE_BLENDS:
+            raise ValueError(f"Unknown tile blend {tile_blend}, expected one of {TILE_BLENDS}")
         self.calc_tiles = calc_tiles
         self.tile_pad = tile_pad
+        # None crops the context padding of every tile; "linear" or "cosine" keep it and
+        # feather neighbouring tiles over their 2 * tile_pad overlap instead
+        self.tile_blend = tile_blend
+        self._blend_weights = {}
         self.scale = scale
         self.pad = pad
-        self.mod_scale = None
+        self.max_tile_batch = max_tile_batch
+        # images with at least stream_min_pixels pixels are upscaled band by band
+        # straight into a uint8 buffer (a memory-mapped file if stream_buffer_dir is set)
+        self.stream_min_pixels = stream_min_pixels
+        self.stream_tile_size = stream_tile_size
+        self.stream_buffer_dir = stream_buffer_dir
+        if scale == 2:
+            self.mod_scale = 2
+        elif scale == 1:
+            self.mod_scale = 4
+        else:
+            self.mod_scale = None
+
+        self._init_device(device, precision, backend)
+        self._init_pipeline(pipeline_workers)
+
+        logger.debug(f"Loading model from {model_path}...")
+        load_start = time.perf_counter()
+        mapped = load_weights(model, model_path)
+
+        model.eval()
+        self.model = model.to(self.device, dtype=self.input_dtype)
+        logger.info(
+            f"Loaded weights from {model_path} in {time.perf_counter() - load_start:.2f}s "
+            f"(mmap={mapped})",
+        )
+        pixel_estimate_kb = estimate_pixel_cost_kb(self.model, bytes_per_element(precision))
+
+        if precision == "int8":
+            self.model = quantize_model(self.model, self._calibration_inputs(calibration_images))
+
+        self.memory_manager = None
+        if calc_tiles:
+            self._init_memory_manager(
+                pixel_size_kb or pixel_estimate_kb,
+                calibrate=calibrate and pixel_size_kb is None,
+                calibration_cache=calibration_cache,
+                pixel_estimate_kb=pixel_estimate_kb,
+            )
 
+        # память калибруется на eager-модели, бэкенд подменяет только вызов модели
+        self.model = load_backend(self.model, model_path, backend, self.device)
+
+        logger.warning(
+            f"Initialized RESRGANinf with scale={self.scale}, device={self.device}, "
+            f"precision={self.precision}, backend={self.backend}, calc_tiles={self.calc_tiles}, "
+            f"tile_pad={self.tile_pad}, pad={self.pad}",
+        )
+
+    def _init_device(self, device, precision, backend):
+        """Resolve the inference device and check the precision and backend against it."""
         if device is None:
             if torch.cuda.is_available():
                 self.device = torch.device("cuda")
@@ -37,154 +183,336 @@ class RESRGANinf:
         else:
             self.device = torch.device(f"{device}")
 
-        logger.debug(f"Loading model from {model_path}...")
-        model_loader = torch.load(model_path, map_location=torch.device("cpu"), weights_only=True)
-        keyname = "params_ema" if "params_ema" in model_loader else "params"
-        model.load_state_dict(model_loader[keyname], strict=True)
-
-        model.eval()
-        self.model = model.to(self.device)
-
-        self.memory_manager = (
-            MemoryManager(
-                pixel_cost_kb=pixel_size_kb,
-                device=self.device,
+        validate_precision(precision, self.device)
+        validate_backend(backend, self.device, precision)
+        self.precision = precision
+        self.backend = backend
+        self.input_dtype = parameter_dtype(precision)
+
+    def _init_pipeline(self, pipeline_workers):
+        # with a tile pipeline on CUDA request images stay in host memory and tiles are
+        # copied to the device asynchronously while the previous tile computes
+        self.tile_pipeline = None
+        if pipeline_workers:
+            self.tile_pipeline = TilePipeline(self.device, pipeline_workers)
+        self.input_device = self.device
+        if self.tile_pipeline is not None and self.device.type == "cuda":
+            self.input_device = torch.device("cpu")
+        self.input_buffers = BufferPool()
+
+    def _init_memory_manager(self, pixel_size_kb, calibrate, calibration_cache, pixel_estimate_kb):
+        """Set up the tile planner, with a measured memory cost model if calibrate is set."""
+        fixed_cost_kb = 0.0
+        if calibrate:
+            calibration = load_or_calibrate(
+                self.model,
+                self.device,
+                calibration_cache,
+                precision=self.precision,
+                min_pixel_cost_kb=pixel_estimate_kb,
             )
-            if calc_tiles
-            else None
+            if calibration is not None:
+                pixel_size_kb = calibration["pixel_cost_kb"]
+                fixed_cost_kb = calibration["fixed_cost_kb"]
+        self.memory_manager = MemoryManager(
+            pixel_cost_kb=pixel_size_kb,
+            fixed_cost_kb=fixed_cost_kb,
+            device=self.device,
         )
 
-        logger.warning(
-            f"Initialized RESRGANinf with scale={self.scale}, device={self.device}, "
-            f"calc_tiles={self.calc_tiles}, tile_pad={self.tile_pad}, pad={self.pad}",
-        )
+    def _calibration_inputs(self, images=None):
+        """Pre-processed inputs for int8 calibration, synthetic samples by default."""
+        if not images:
+            images = [sample_image(seed=seed) for seed in range(4)]
+        inputs = []
+        for img in images:
+            ctx = self.prepare_image(img)
+            # the pooled buffer goes back to the pool and may be reused by the next sample
+            inputs.append(ctx.img.clone())
+            self.release(ctx)
+        return inputs
+
+    @torch.no_grad()
+    def warmup(self, size=64):
+        """
+        Run one dummy forward pass so that lazy initialisation (kernels, allocator,
+        torch.compile) happens before the first real request.
+        """
+        start = time.perf_counter()
+        self.upgrade_resolution(np.zeros((size, size, 3), dtype=np.uint8))
+        elapsed = time.perf_counter() - start
+        logger.info(f"Warm-up forward pass took {elapsed:.2f}s")
+        return elapsed
 
     def pre_process(self, img):
         logger.debug(f"Pre-processing image with shape: {img.shape}")
         img = torch.from_numpy(np.transpose(img, (2, 0, 1))).float()
-        self.img = img.unsqueeze(0).to(self.device)
+        ctx = InferenceContext(img=img.unsqueeze(0).to(self.input_device))
 
         if self.pad != 0:
-            self.img = functional.pad(self.img, (0, self.pad, 0, self.pad), "reflect")
+            ctx.img = functional.pad(ctx.img, (0, self.pad, 0, self.pad), "reflect")
 
-        if self.scale == 2:
-            self.mod_scale = 2
-        elif self.scale == 1:
-            self.mod_scale = 4
         if self.mod_scale is not None:
-            self.mod_pad_h, self.mod_pad_w = 0, 0
-            _, _, height, width = self.img.size()
+            _, _, height, width = ctx.img.size()
             if height % self.mod_scale != 0:
-                self.mod_pad_h = self.mod_scale - height % self.mod_scale
+                ctx.mod_pad_h = self.mod_scale - height % self.mod_scale
             if width % self.mod_scale != 0:
-                self.mod_pad_w = self.mod_scale - width % self.mod_scale
-            self.img = functional.pad(self.img, (0, self.mod_pad_w, 0, self.mod_pad_h), "reflect")
+                ctx.mod_pad_w = self.mod_scale - width % self.mod_scale
+            ctx.img = functional.pad(ctx.img, (0, ctx.mod_pad_w, 0, ctx.mod_pad_h), "reflect")
             logger.debug(
                 f"Image dimensions adjusted with padding: "
-                f"mod_pad_h={self.mod_pad_h}, mod_pad_w={self.mod_pad_w}",
+                f"mod_pad_h={ctx.mod_pad_h}, mod_pad_w={ctx.mod_pad_w}",
             )
 
-        return self.img
+        ctx.img = ctx.img.to(dtype=self.input_dtype)
+        return ctx
 
-    def tile_inference(self, tile_size):
-        logger.debug(f"Starting tiled inference with tile size: {tile_size}")
-        batch, channel, height, width = self.img.shape
-        output_height = height * self.scale
-        output_width = width * self.scale
-        output_shape = (batch, channel, output_height, output_width)
+    def _padded_size(self, height, width):
+        height, width = height + self.pad, width + self.pad
+        mod_pad_h = mod_pad_w = 0
+        if self.mod_scale is not None:
+            mod_pad_h = -height % self.mod_scale
+            mod_pad_w = -width % self.mod_scale
+        return height, width, mod_pad_h, mod_pad_w
+
+    def fused_pre_process(self, img):
+        """
+        Single-pass equivalent of prepare_image + pre_process for uint8 BGR or
+        grayscale images.
+
+        The image is converted straight into a pooled NCHW buffer of the model dtype;
+        the reflect paddings are written in place, so apart from the buffer itself no
+        full-size intermediate is allocated.
+        """
+        height, width = img.shape[:2]
+        padded_h, padded_w, mod_pad_h, mod_pad_w = self._padded_size(height, width)
+        buffer = self.input_buffers.acquire(
+            (1, 3, padded_h + mod_pad_h, padded_w + mod_pad_w),
+            self.input_dtype,
+            self.input_device,
+        )
+        fill_input(buffer, img)
+        reflect_pad_(buffer, height, width, self.pad, self.pad)
+        reflect_pad_(buffer, padded_h, padded_w, mod_pad_h, mod_pad_w)
+        return InferenceContext(
+            img=buffer,
+            mod_pad_h=mod_pad_h,
+            mod_pad_w=mod_pad_w,
+            img_mode="L" if img.ndim == 2 else "RGB",
+            pooled=True,
+        )
 
-        # start with black image
-        self.output = self.img.new_zeros(output_shape)
+    def release(self, ctx):
+        """Return the input buffer of a finished request to the pool."""
+        if ctx.pooled:
+            self.input_buffers.release(ctx.img)
+            ctx.img = None
+            ctx.pooled = False
+
+    def split_tiles(self, height, width, tile_size, tile_pad=None):
+        """
+        Split an image of the given size into tiles.
+
+        Returns a list of Tile objects describing, for every tile, the padded input area,
+        the area it covers in the output image and the useful part of the upscaled tile.
+        """
+        if tile_pad is None:
+            tile_pad = self.tile_pad
+        tiles = []
         tiles_x = int(np.ceil(width / tile_size))
         tiles_y = int(np.ceil(height / tile_size))
-        # loop over all tiles
         for tile_row_index in range(tiles_y):
             for tile_column_index in range(tiles_x):
-                # extract tile from input image
-                offset_x = tile_column_index * tile_size
-                offset_y = tile_row_index * tile_size
                 # input tile area on total image
-                input_start_x = offset_x
-                input_end_x = min(offset_x + tile_size, width)
-                input_start_y = offset_y
-                input_end_y = min(offset_y + tile_size, height)
+                input_start_x = tile_column_index * tile_size
+                input_end_x = min(input_start_x + tile_size, width)
+                input_start_y = tile_row_index * tile_size
+                input_end_y = min(input_start_y + tile_size, height)
 
                 # input tile area on total image with padding
-                input_start_x_pad = max(input_start_x - self.tile_pad, 0)
-                input_end_x_pad = min(input_end_x + self.tile_pad, width)
-                input_start_y_pad = max(input_start_y - self.tile_pad, 0)
-                input_end_y_pad = min(input_end_y + self.tile_pad, height)
-
-                # input tile dimensions
-                input_tile_width = input_end_x - input_start_x
-                input_tile_height = input_end_y - input_start_y
-                input_tile = self.img[
-                    :,
-                    :,
-                    input_start_y_pad:input_end_y_pad,
-                    input_start_x_pad:input_end_x_pad,
-                ]
-
-                # upscale tile
-                try:
-                    with torch.no_grad():
-                        output_tile = self.model(input_tile)
-                except RuntimeError as error:
-                    print("Error", error)
-
-                # output tile area on total image
-                output_start_x = input_start_x * self.scale
-                output_end_x = input_end_x * self.scale
-                output_start_y = input_start_y * self.scale
-                output_end_y = input_end_y * self.scale
+                input_start_x_pad = max(input_start_x - tile_pad, 0)
+                input_end_x_pad = min(input_end_x + tile_pad, width)
+                input_start_y_pad = max(input_start_y - tile_pad, 0)
+                input_end_y_pad = min(input_end_y + tile_pad, height)
 
                 # output tile area without padding
                 output_start_x_tile = (input_start_x - input_start_x_pad) * self.scale
-                output_end_x_tile = output_start_x_tile + input_tile_width * self.scale
                 output_start_y_tile = (input_start_y - input_start_y_pad) * self.scale
-                output_end_y_tile = output_start_y_tile + input_tile_height * self.scale
-
-                # put tile into output image
-                self.output[
-                    :,
-                    :,
-                    output_start_y:output_end_y,
-                    output_start_x:output_end_x,
-                ] = output_tile[
-                    :,
-                    :,
-                    output_start_y_tile:output_end_y_tile,
-                    output_start_x_tile:output_end_x_tile,
-                ]
+
+                tiles.append(
+                    Tile(
+                        input_y=slice(input_start_y_pad, input_end_y_pad),
+                        input_x=slice(input_start_x_pad, input_end_x_pad),
+                        output_y=slice(input_start_y * self.scale, input_end_y * self.scale),
+                        output_x=slice(input_start_x * self.scale, input_end_x * self.scale),
+                        tile_y=slice(
+                            output_start_y_tile,
+                            output_start_y_tile + (input_end_y - input_start_y) * self.scale,
+                        ),
+                        tile_x=slice(
+                            output_start_x_tile,
+                            output_start_x_tile + (input_end_x - input_start_x) * self.scale,
+                        ),
+                    ),
+                )
+        return tiles
+
+    def tile_inputs(self, ctx, tiles):
+        """Slice the padded input area of every tile out of the request image."""
+        return [ctx.img[:, :, tile.input_y, tile.input_x] for tile in tiles]
+
+    def _allocate_canvas(self, ctx):
+        batch, channel, height, width = ctx.img.shape
+        # start with black image
+        output_shape = (batch, channel, height * self.scale, width * self.scale)
+        # the canvas stays on the model device, only the final uint8 image leaves it
+        ctx.output = torch.zeros(output_shape, dtype=ctx.img.dtype, device=self.device)
+        if self.tile_blend is not None:
+            ctx.weight = torch.zeros(
+                (1, 1, height * self.scale, width * self.scale),
+                dtype=ctx.img.dtype,
+                device=self.device,
+            )
+
+    def tile_weight(self, tile, device):
+        """
+        Blending weights of the whole upscaled tile, shape (1, 1, H, W).
+
+        Every side that has context padding ramps up over twice the padding, which is
+        exactly the overlap with the neighbouring tile, so the weights of two
+        neighbours sum to one across the seam. Sides on the image border stay at 1.
+        """
+        pad_top = tile.tile_y.start
+        pad_left = tile.tile_x.start
+        height, width = (size * self.scale for size in tile.padded_shape)
+        pad_bottom = height - tile.tile_y.stop
+        pad_right = width - tile.tile_x.stop
+        key = (self.tile_blend, height, width, pad_top, pad_bottom, pad_left, pad_right, device)
+        if key not in self._blend_weights:
+            weight_y = self._edge_weights(height, pad_top, pad_bottom)
+            weight_x = self._edge_weights(width, pad_left, pad_right)
+            weight = torch.outer(weight_y, weight_x)[None, None]
+            self._blend_weights[key] = weight.to(device)
+        return self._blend_weights[key]
+
+    def _edge_weights(self, length, pad_start, pad_end):
+        weights = torch.ones(length)
+        if pad_start:
+            ramp_length = min(2 * pad_start, length)
+            weights[:ramp_length] *= blend_ramp(2 * pad_start, self.tile_blend)[:ramp_length]
+        if pad_end:
+            ramp_length = min(2 * pad_end, length)
+            ramp = blend_ramp(2 * pad_end, self.tile_blend).flip(0)
+            weights[length - ramp_length :] *= ramp[2 * pad_end - ramp_length :]
+        return weights
+
+    def _accumulate_tile(self, output, weight, tile, output_tile, offset_y=0):
+        """Add a feathered tile to an output canvas and its weight sum."""
+        output_y, output_x = tile.padded_output(self.scale)
+        output_y = slice(output_y.start - offset_y, output_y.stop - offset_y)
+        tile_weight = self.tile_weight(tile, output.device)
+        output[:, :, output_y, output_x] += output_tile.to(output.dtype) * tile_weight
+        weight[:, :, output_y, output_x] += tile_weight
+
+    def merge_tiles(self, ctx, tiles, output_tiles):
+        """Put upscaled tiles into the output canvas of the request."""
+        if ctx.output is None:
+            self._allocate_canvas(ctx)
+        if ctx.weight is not None:
+            # overlapping tiles may be merged from several pipeline threads
+            with ctx.lock:
+                for tile, output_tile in zip(tiles, output_tiles):
+                    self._accumulate_tile(ctx.output, ctx.weight, tile, output_tile)
+            return
+        for tile, output_tile in zip(tiles, output_tiles):
+            ctx.output[:, :, tile.output_y, tile.output_x] = output_tile[
+                :,
+                :,
+                tile.tile_y,
+                tile.tile_x,
+            ]
+
+    @torch.no_grad()
+    def forward(self, input_batch):
+        """Run the model over a batch of tiles or images of the same shape."""
+        try:
+            with autocast_context(self.precision, self.device):
+                return self.model(input_batch.to(self.device))
+        except RuntimeError as error:
+            logger.error(f"Batch inference failed: {error}")
+            raise
+
+    def tile_inference(self, ctx, tile_size, batch_size=1, tile_pad=None):
+        logger.debug(
+            f"Starting tiled inference with tile size: {tile_size}, batch size: {batch_size}",
+        )
+        batch, _, height, width = ctx.img.shape
+        # the canvas is allocated up front, the pipeline merges tiles from several threads
+        self._allocate_canvas(ctx)
+
+        self._run_chunks(
+            self._tile_chunks(self.split_tiles(height, width, tile_size, tile_pad), batch_size),
+            lambda chunk: torch.cat(self.tile_inputs(ctx, chunk), dim=0),
+            lambda chunk, output_batch: self.merge_tiles(
+                ctx, chunk, output_batch.split(batch, dim=0),
+            ),
+        )
         logger.debug("Tiled inference completed.")
 
-    def inference(self):
+    @staticmethod
+    def _tile_chunks(tiles, batch_size):
+        """Group tiles into batches; only tiles of the same padded shape can be stacked."""
+        groups = {}
+        for tile in tiles:
+            groups.setdefault(tile.padded_shape, []).append(tile)
+        return [
+            tiles[start : start + batch_size]
+            for tiles in groups.values()
+            for start in range(0, len(tiles), batch_size)
+        ]
+
+    def _run_chunks(self, chunks, load, store):
+        """Run tile batches through the model, pipelined when a TilePipeline is set."""
+        if self.tile_pipeline is not None:
+            self.tile_pipeline.run(chunks, load, self.forward, store)
+            return
+        for chunk in chunks:
+            store(chunk, self.forward(load(chunk)))
+
+    def inference(self, ctx):
         logger.debug("Starting inference on the whole image.")
-        self.output = self.model(self.img)
+        ctx.output = self.forward(ctx.img)
         logger.debug("Inference completed.")
 
-    def post_process(self):
+    def post_process(self, ctx):
         logger.debug("Post-processing output image.")
+        output = ctx.output
+        if ctx.weight is not None:
+            output = output / ctx.weight
         if self.mod_scale is not None:
-            _, _, height, width = self.output.size()
-            self.output = self.output[
+            _, _, height, width = output.size()
+            output = output[
                 :,
                 :,
-                0 : height - self.mod_pad_h * self.scale,
-                0 : width - self.mod_pad_w * self.scale,
+                0 : height - ctx.mod_pad_h * self.scale,
+                0 : width - ctx.mod_pad_w * self.scale,
             ]
         # remove prepad
         if self.pad != 0:
-            _, _, height, width = self.output.size()
-            self.output = self.output[
+            _, _, height, width = output.size()
+            output = output[
                 :, :,
                 0 : height - self.pad * self.scale, 0 : width - self.pad * self.scale,
             ]
 
-        logger.debug(f"Post-processing completed. Final output shape: {self.output.shape}")
-        return self.output
+        logger.debug(f"Post-processing completed. Final output shape: {output.shape}")
+        return output
+
+    def prepare_image(self, img, alpha_upsampler="realesrgan"):
+        # 8-bit images cannot exceed max_range 256, no need to scan them
+        if img.dtype == np.uint8 and (img.ndim == 2 or img.shape[2] == 3):
+            return self.fused_pre_process(img)
 
-    def _prepare_image(self, img, alpha_upsampler):
         img = img.astype(np.float32)
         if np.max(img) > 256:
             max_range = 65536
@@ -193,6 +521,7 @@ class RESRGANinf:
 
         img = img / max_range
         alpha = None  # Инициализация alpha по умолчанию
+        img_mode = "RGB"
 
         if len(img.shape) == 2:
             img_mode = "L"
@@ -205,39 +534,212 @@ class RESRGANinf:
             if alpha_upsampler == "realesrgan":
                 alpha = cv2.cvtColor(alpha, cv2.COLOR_GRAY2RGB)
         else:
-            img_mode = "RGB"
             img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
-        self.pre_process(img)
+        ctx = self.pre_process(img)
+        ctx.img_mode = img_mode
+        ctx.max_range = max_range
+        ctx.alpha = alpha
+
+        return ctx
+
+    def use_streaming(self, ctx):
+        """Whether the request should go through the bounded-memory streaming pipeline."""
+        if self.stream_min_pixels is None:
+            return False
+        # alpha and 16-bit outputs need the full float image, they use the regular path
+        if ctx.img_mode not in ("RGB", "L") or ctx.max_range != 256:
+            return False
+        _, _, height, width = ctx.img.shape
+        return height * width >= self.stream_min_pixels
+
+    def _allocate_output(self, shape):
+        if self.stream_buffer_dir is None:
+            return np.empty(shape, dtype=np.uint8)
+        # the temporary file is unlinked right away, the mapping keeps it alive
+        return np.memmap(
+            tempfile.TemporaryFile(dir=self.stream_buffer_dir),
+            dtype=np.uint8,
+            mode="w+",
+            shape=shape,
+        )
+
+    @staticmethod
+    def to_uint8_image(output, img_mode="RGB"):
+        """
+        Convert an upscaled RGB tensor (1, 3, H, W) to a uint8 BGR (H, W, 3) or
+        grayscale (H, W) array.
+
+        Clamping, scaling, rounding, channel reorder and the uint8 cast run on the
+        tensor's device, float32 outputs are modified in place, and only the uint8
+        image is copied to the host, ready to be passed to the encoder.
+        """
+        output = output[0].float().clamp_(0, 1)
+        _, height, width = output.shape
+        if img_mode == "L":
+            # same weights as cv2.COLOR_BGR2GRAY
+            gray = output[2] * 0.114
+            gray.add_(output[1], alpha=0.587).add_(output[0], alpha=0.299)
+            return gray.mul_(255.0).round_().to(torch.uint8).cpu().numpy()
+
+        output.mul_(255.0).round_()
+        image = torch.empty((height, width, 3), dtype=torch.uint8, device=output.device)
+        for channel in range(3):
+            image[:, :, channel].copy_(output[2 - channel])
+        return image.cpu().numpy()
+
+    def _stream_plan(self, height, width):
+        """Tile size, batch size and tile padding for streaming an image of the given size."""
+        if self.memory_manager is not None:
+            plan = self.memory_manager.plan_tiles(
+                height,
+                width,
+                self.tile_pad,
+                max_batch_size=self.max_tile_batch,
+            )
+            if plan.tiled:
+                return plan.tile_size, plan.batch_size, plan.tile_pad
+        return self.stream_tile_size, self.max_tile_batch, None
+
+    def _band_rows(self, band_tiles):
+        """Output rows covered by a band of tiles."""
+        if self.tile_blend is None:
+            return band_tiles[0].output_y
+        # feathered tiles cover their context padding too
+        return band_tiles[0].padded_output(self.scale)[0]
+
+    def _new_band(self, ctx, band_y, width, carry):
+        """
+        Allocate a band canvas and, for feathered tiles, its weight sum pre-filled with
+        the rows carried over from the previous band.
+        """
+        _, channel, _, _ = ctx.img.shape
+        band_shape = (1, channel, band_y.stop - band_y.start, width * self.scale)
+        band_options = {"dtype": ctx.img.dtype, "device": self.device}
+        if self.tile_blend is None:
+            return torch.empty(band_shape, **band_options), None
+
+        band = torch.zeros(band_shape, **band_options)
+        band_weight = torch.zeros((1, 1, *band_shape[2:]), **band_options)
+        if carry is not None:
+            carry_output, carry_weight = carry
+            band[:, :, : carry_output.shape[2]] += carry_output
+            band_weight[:, :, : carry_weight.shape[2]] += carry_weight
+        return band, band_weight
+
+    def _band_store(self, band, band_weight, band_y):
+        """Store callback putting upscaled tiles of one band into its canvas."""
+        lock = threading.Lock()
+
+        def store(chunk, output_batch):
+            for tile, output_tile in zip(chunk, output_batch.split(1, dim=0)):
+                if band_weight is None:
+                    band[:, :, :, tile.output_x] = output_tile[:, :, tile.tile_y, tile.tile_x]
+                    continue
+                with lock:
+                    self._accumulate_tile(band, band_weight, tile, output_tile, band_y.start)
+
+        return store
+
+    def _finish_band(self, band, band_weight, band_y, next_band_y):
+        """
+        Normalise a feathered band by its weights.
+
+        Rows shared with the next band are not finished yet, they are returned as the
+        carry to be added to the next band together with their weights.
+
+        :return: (finished band, first row that is not finished, carry or None)
+        """
+        if band_weight is None:
+            return band, band_y.stop, None
+        ready = band_y.stop if next_band_y is None else next_band_y.start
+        rows = ready - band_y.start
+        carry = (band[:, :, rows:].clone(), band_weight[:, :, rows:].clone())
+        return band[:, :, :rows] / band_weight[:, :, :rows], ready, carry
+
+    def stream_process(self, ctx):
+        """
+        Upscale the image one row band of tiles at a time.
+
+        Every band is converted to uint8 as soon as it is ready and written into a
+        preallocated output buffer, so peak memory depends on the band size rather
+        than on the size of the image.
+        """
+        _, _, height, width = ctx.img.shape
+        tile_size, batch_size, tile_pad = self._stream_plan(height, width)
+
+        # crop the reflect padding added by pre_process
+        output_height = (height - ctx.mod_pad_h - self.pad) * self.scale
+        output_width = (width - ctx.mod_pad_w - self.pad) * self.scale
+        if ctx.img_mode == "L":
+            output = self._allocate_output((output_height, output_width))
+        else:
+            output = self._allocate_output((output_height, output_width, 3))
+        logger.debug(
+            f"Streaming inference with tile size: {tile_size}, batch size: {batch_size}, "
+            f"output shape: {output.shape}",
+        )
+
+        bands = {}
+        for tile in self.split_tiles(height, width, tile_size, tile_pad):
+            bands.setdefault(tile.output_y.start, []).append(tile)
+        band_rows = [self._band_rows(band_tiles) for band_tiles in bands.values()]
+
+        carry = None
+        for index, band_tiles in enumerate(bands.values()):
+            band_y = band_rows[index]
+            if band_y.start >= output_height:
+                break
+            band, band_weight = self._new_band(ctx, band_y, width, carry)
+            self._run_chunks(
+                self._tile_chunks(band_tiles, batch_size),
+                lambda chunk: torch.cat(self.tile_inputs(ctx, chunk), dim=0),
+                self._band_store(band, band_weight, band_y),
+            )
+
+            next_band_y = band_rows[index + 1] if index + 1 < len(band_rows) else None
+            band, ready, carry = self._finish_band(band, band_weight, band_y, next_band_y)
+            stop = min(ready, output_height)
+            output[band_y.start : stop] = self.to_uint8_image(
+                band[:, :, : stop - band_y.start, :output_width],
+                ctx.img_mode,
+            )
+            del band, band_weight
 
-        return img, img_mode, alpha, max_range
+        logger.debug("Streaming inference completed.")
+        return output
 
-    def _process_image(self):
-        batch, channel, height, width = self.img.shape
+    def _process_image(self, ctx):
         if self.calc_tiles:
-            tile_size = self.memory_manager.calculate_tile_count(batch, channel, height, width)
-            if tile_size > 1:
-                self.tile_inference(tile_size * 2 if tile_size > 5 else 10)
-            else:
-                self.inference()
-        else:
-            self.inference()
+            _, _, height, width = ctx.img.shape
+            plan = self.memory_manager.plan_tiles(
+                height,
+                width,
+                self.tile_pad,
+                max_batch_size=self.max_tile_batch,
+            )
+            if plan.tiled:
+                self.tile_inference(ctx, plan.tile_size, plan.batch_size, plan.tile_pad)
+                return
+        self.inference(ctx)
 
+    def finalize_image(self, ctx, alpha_upsampler="realesrgan"):
+        output_img = self.post_process(ctx)
+        if ctx.img_mode in ("RGB", "L") and ctx.max_range == 256:
+            return self.to_uint8_image(output_img, ctx.img_mode)
 
-    def _finalize_image(self, img_mode, max_range, alpha, alpha_upsampler):
-        output_img = self.post_process()
         output_img = output_img.data.squeeze().float().cpu().clamp_(0, 1).numpy()
         output_img = np.transpose(output_img[[2, 1, 0], :, :], (1, 2, 0))
 
         # Обработка для режимов 'L' и 'RGBA'
-        if img_mode == "L":
+        if ctx.img_mode == "L":
             output_img = cv2.cvtColor(output_img, cv2.COLOR_BGR2GRAY)
-        if img_mode == "RGBA":
-            output_alpha = self._process_alpha(alpha, alpha_upsampler)
+        if ctx.img_mode == "RGBA":
+            output_alpha = self._process_alpha(ctx.alpha, alpha_upsampler)
             output_img = self._merge_alpha(output_img, output_alpha)
 
         # Приведение к исходному диапазону
-        if max_range == 65536:  # 16-bit изображение
+        if ctx.max_range == 65536:  # 16-bit изображение
             output_img = (output_img * 65535.0).round().astype(np.uint16)
         else:
             output_img = (output_img * 255.0).round().astype(np.uint8)
@@ -246,9 +748,9 @@ class RESRGANinf:
 
     def _process_alpha(self, alpha, alpha_upsampler):
         if alpha_upsampler == "realesrgan":
-            self.pre_process(alpha)
-            self.inference()
-            output_alpha = self.post_process()
+            alpha_ctx = self.pre_process(alpha)
+            self.inference(alpha_ctx)
+            output_alpha = self.post_process(alpha_ctx)
             output_alpha = output_alpha.data.squeeze().float().cpu().clamp_(0, 1).numpy()
             output_alpha = np.transpose(output_alpha[[2, 1, 0], :, :], (1, 2, 0))
             output_alpha = cv2.cvtColor(output_alpha, cv2.COLOR_BGR2GRAY)
@@ -281,14 +783,19 @@ class RESRGANinf:
     def upgrade_resolution(self, img, outscale=None, alpha_upsampler="realesrgan"):
         logger.debug(f"Upgrading resolution for image with shape: {img.shape}")
 
-        img, img_mode, alpha, max_range = self._prepare_image(img, alpha_upsampler)
+        ctx = self.prepare_image(img, alpha_upsampler)
 
-        self._process_image()
-
-        output_img = self._finalize_image(img_mode, max_range, alpha, alpha_upsampler)
+        try:
+            if self.use_streaming(ctx):
+                output_img = self.stream_process(ctx)
+            else:
+                self._process_image(ctx)
+                output_img = self.finalize_image(ctx, alpha_upsampler)
+        finally:
+            self.release(ctx)
 
         if outscale is not None and outscale != float(self.scale):
             output_img = self._rescale_output(output_img, img.shape[:2], outscale)
 
         logger.debug("Resolution upgrade completed.")
-        return output_img, img_mode
+        return output_img, ctx.img_mode
@@ -0,0 +1,132 @@
+import argparse
+import logging
+import time
+
+import cv2
+import numpy as np
+import torch
+from model.model import RRDBNet
+from model.precision import psnr, sample_image
+from model.real_esrgan_inference import RESRGANinf
+
+logger = logging.getLogger(__name__)
+
+
+def _seam_mask(height, width, tile_size, scale, band=2):
+    """Output pixels within band pixels of a tile boundary."""
+    mask = np.zeros((height, width), dtype=bool)
+    step = tile_size * scale
+    for position in range(step, height, step):
+        mask[max(position - band, 0) : position + band, :] = True
+    for position in range(step, width, step):
+        mask[:, max(position - band, 0) : position + band] = True
+    return mask
+
+
+def _tile_overhead(model, height, width, tile_size, tile_pad):
+    """Computed pixels per image pixel, context padding included."""
+    tiles = model.split_tiles(height, width, tile_size, tile_pad)
+    return sum(np.prod(tile.padded_shape) for tile in tiles) / (height * width)
+
+
+def _tiled_output(model, img, tile_size, tile_pad):
+    """Tiled result and the time spent in tile inference."""
+    ctx = model.prepare_image(img)
+    try:
+        start = time.perf_counter()
+        model.tile_inference(ctx, tile_size, model.max_tile_batch, tile_pad)
+        elapsed = time.perf_counter() - start
+        return model.finalize_image(ctx), elapsed
+    finally:
+        model.release(ctx)
+
+
+@torch.no_grad()
+def seam_report(model, img, tile_size, tile_pads, blends):
+    """
+    Compare tiled inference against full-image inference.
+
+    :param model: RESRGANinf; its tile_blend is changed during the run and restored.
+    :param img: BGR uint8 image small enough to be processed without tiling.
+    :param tile_size: Tile side in input pixels.
+    :param tile_pads: Context paddings to try.
+    :param blends: Blend modes to try, None for cropping.
+    :return: One dict per (blend, tile_pad) with PSNR and errors against the
+        full-image result, error near seams, compute overhead and time.
+    """
+    ctx = model.prepare_image(img)
+    _, _, height, width = ctx.img.shape
+    try:
+        model.inference(ctx)
+        reference = model.finalize_image(ctx).astype(np.float64)
+    finally:
+        model.release(ctx)
+
+    seams = _seam_mask(*reference.shape[:2], tile_size, model.scale)
+    original_blend = model.tile_blend
+    results = []
+    try:
+        for blend in blends:
+            model.tile_blend = blend
+            for tile_pad in tile_pads:
+                output, elapsed = _tiled_output(model, img, tile_size, tile_pad)
+                error = np.abs(output.astype(np.float64) - reference)
+                results.append(
+                    {
+                        "blend": blend or "none",
+                        "tile_pad": tile_pad,
+                        "psnr": psnr(reference, output),
+                        "max_error": float(error.max()),
+                        "seam_mae": float(error[seams].mean()) if seams.any() else 0.0,
+                        "overhead": _tile_overhead(model, height, width, tile_size, tile_pad),
+                        "seconds": elapsed,
+                    },
+                )
+    finally:
+        model.tile_blend = original_blend
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ошибка на швах тайлов относительно инференса целого изображения",
+    )
+    parser.add_argument("--model-path", default="model/RealESRGAN_x4plus.pth")
+    parser.add_argument("--scale", type=int, default=4)
+    parser.add_argument("--num-block", type=int, default=23)
+    parser.add_argument("--image", default=None, help="По умолчанию синтетическое 192x192")
+    parser.add_argument("--tile-size", type=int, default=64)
+    parser.add_argument("--tile-pads", default="0,2,4,6,10")
+    parser.add_argument("--blends", default="none,linear,cosine")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    img = cv2.imread(args.image, cv2.IMREAD_COLOR) if args.image else sample_image(192, 192)
+    model = RESRGANinf(
+        scale=args.scale,
+        model=RRDBNet(
+            num_in_ch=3,
+            num_out_ch=3,
+            num_feat=64,
+            num_block=args.num_block,
+            num_grow_ch=32,
+            scale=args.scale,
+        ),
+        model_path=args.model_path,
+        device="cpu",
+    )
+    blends = [None if blend == "none" else blend for blend in args.blends.split(",")]
+    tile_pads = [int(tile_pad) for tile_pad in args.tile_pads.split(",")]
+
+    for result in seam_report(model, img, args.tile_size, tile_pads, blends):
+        logger.info(
+            f"blend={result['blend']:<6} tile_pad={result['tile_pad']:<3} "
+            f"PSNR {result['psnr']:6.2f} dB, max error {result['max_error']:5.1f}, "
+            f"seam MAE {result['seam_mae']:.3f}, overhead x{result['overhead']:.2f}, "
+            f"{result['seconds']:.2f}s",
+        )
+
+
+if __name__ == "__main__":
+    main()
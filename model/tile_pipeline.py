@@ -0,0 +1,78 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class TilePipeline:
+    """
+    Overlaps tile preparation and result merging with model compute.
+
+    While chunk N runs through the model on the calling thread, chunk N+1 is
+    sliced and copied to the device and finished chunks are merged on a small
+    thread pool. On CUDA the host-to-device copies use a dedicated stream and pinned
+    host memory, the results stay on the device; on CPU the slicing and merging
+    simply run next to the convolutions, which release the GIL.
+    """
+
+    def __init__(self, device, workers=2, max_pending=2):
+        self.device = device
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tiles")
+        self._cuda = device.type == "cuda"
+        if self._cuda:
+            self._h2d_stream = torch.cuda.Stream(device)
+
+    def _load(self, load, chunk):
+        input_batch = load(chunk)
+        if not self._cuda or input_batch.device.type == "cuda":
+            return input_batch, None
+        with torch.cuda.stream(self._h2d_stream):
+            input_batch = input_batch.pin_memory().to(self.device, non_blocking=True)
+            copied = torch.cuda.Event()
+            copied.record(self._h2d_stream)
+        return input_batch, copied
+
+    def run(self, chunks, load, compute, store):
+        """
+        Process chunks as load -> compute -> store with one chunk of prefetch.
+
+        :param chunks: Work items, e.g. lists of tiles of the same shape.
+        :param load: chunk -> input batch; runs on the pool.
+        :param compute: input batch -> output batch; runs on the calling thread.
+        :param store: (chunk, output batch) -> None; runs on the pool and receives
+            the output batch on the device it was computed on.
+        """
+        if not chunks:
+            return
+
+        pending = []
+        next_input = self._executor.submit(self._load, load, chunks[0])
+        try:
+            for index, chunk in enumerate(chunks):
+                input_batch, copied = next_input.result()
+                if index + 1 < len(chunks):
+                    next_input = self._executor.submit(self._load, load, chunks[index + 1])
+
+                if copied is not None:
+                    stream = torch.cuda.current_stream(self.device)
+                    stream.wait_event(copied)
+                    input_batch.record_stream(stream)
+                output_batch = compute(input_batch)
+
+                pending.append(self._executor.submit(store, chunk, output_batch))
+                # bound the number of finished batches waiting to be merged
+                while len(pending) > self.max_pending:
+                    pending.pop(0).result()
+            for future in pending:
+                future.result()
+        finally:
+            # after an error the remaining work only has to finish, its own errors
+            # must not replace the exception that is already propagating
+            next_input.cancel()
+            wait([next_input, *pending])
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
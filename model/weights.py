@@ -0,0 +1,78 @@
+import argparse
+import logging
+import os
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+SAFETENSORS_EXTENSION = ".safetensors"
+
+
+def safetensors_path(model_path):
+    """
+    Путь к весам в формате safetensors рядом с исходным файлом.
+    """
+    return os.path.splitext(model_path)[0] + SAFETENSORS_EXTENSION
+
+
+def load_checkpoint_state_dict(model_path):
+    """
+    Прочитать state_dict из чекпоинта Real-ESRGAN (*.pth) целиком в память.
+    """
+    model_loader = torch.load(model_path, map_location=torch.device("cpu"), weights_only=True)
+    keyname = "params_ema" if "params_ema" in model_loader else "params"
+    return model_loader[keyname]
+
+
+def load_weights(model, model_path):
+    """
+    Загрузить веса в модель.
+
+    Файлы *.safetensors отображаются в память (mmap), и тензоры модели
+    присваиваются без копирования: несколько процессов воркера на одном хосте
+    используют одни и те же физические страницы из page cache.
+    Остальные файлы читаются как чекпоинт torch.
+
+    :return: True, если веса отображены в память без копирования.
+    """
+    if model_path.endswith(SAFETENSORS_EXTENSION):
+        from safetensors.torch import load_file
+
+        model.load_state_dict(load_file(model_path, device="cpu"), strict=True, assign=True)
+        return True
+
+    model.load_state_dict(load_checkpoint_state_dict(model_path), strict=True)
+    return False
+
+
+def convert_to_safetensors(model_path):
+    """
+    Сконвертировать чекпоинт *.pth в *.safetensors рядом с исходным файлом.
+
+    :return: Путь к сохранённому файлу.
+    """
+    from safetensors.torch import save_file
+
+    state_dict = {
+        name: tensor.contiguous() for name, tensor in load_checkpoint_state_dict(model_path).items()
+    }
+    path = safetensors_path(model_path)
+    save_file(state_dict, path)
+    logger.info(f"Converted {model_path} to {path}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Конвертация весов Real-ESRGAN в формат safetensors для загрузки через mmap",
+    )
+    parser.add_argument("--model-path", default="model/RealESRGAN_x4plus.pth")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    convert_to_safetensors(args.model_path)
+
+
+if __name__ == "__main__":
+    main()
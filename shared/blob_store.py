@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Заголовок со ссылкой на тело сообщения, вынесенное в хранилище (claim check)
+BLOB_REF_HEADER = "blob_ref"
+
+
+class LocalBlobStore:
+    """
+    Хранилище тел сообщений в каталоге, общем для бота и воркера (shared volume).
+
+    Каждый объект - отдельный файл; запись атомарна (через временный файл),
+    устаревшие объекты удаляются по mtime.
+    """
+
+    def __init__(self, directory: str, ttl_seconds: float):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, ref: str) -> str:
+        # ссылка приходит из сообщения, наружу каталога выйти нельзя
+        return os.path.join(self.directory, os.path.basename(ref))
+
+    def put(self, data: bytes) -> str:
+        ref = uuid.uuid4().hex
+        path = self._path(ref)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return ref
+
+    def get(self, ref: str) -> bytes:
+        with open(self._path(ref), "rb") as f:
+            return f.read()
+
+    def temp_path(self) -> str:
+        """
+        Путь для временного файла, который затем можно передать в put_file.
+
+        Файл создаётся в каталоге хранилища, чтобы put_file его просто переименовал.
+        """
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        return path
+
+    def put_file(self, path: str) -> str:
+        """
+        Переносит файл в хранилище без чтения в память.
+        """
+        ref = uuid.uuid4().hex
+        os.replace(path, self._path(ref))
+        return ref
+
+    def get_file(self, ref: str) -> str:
+        """
+        Путь к файлу объекта; после использования передаётся в release_file.
+        """
+        return self._path(ref)
+
+    def release_file(self, path: str) -> None:
+        pass
+
+    def delete(self, ref: str) -> None:
+        try:
+            os.remove(self._path(ref))
+        except FileNotFoundError:
+            pass
+
+    def cleanup(self) -> int:
+        """
+        Удаляет объекты старше ttl_seconds и возвращает их число.
+        """
+        deadline = time.time() - self.ttl_seconds
+        removed = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < deadline:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+
+class S3BlobStore:
+    """
+    Хранилище тел сообщений в S3-совместимом объектном хранилище (S3, MinIO и т.п.).
+
+    Для бакета стоит дополнительно настроить lifecycle-правило на то же время
+    жизни; cleanup() удаляет устаревшие объекты на случай, если его нет.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        ttl_seconds: float,
+        endpoint_url: str | None = None,
+        access_key: str | None = None,
+        secret_key: str | None = None,
+        region: str | None = None,
+        prefix: str = "",
+        client=None,
+    ):
+        if client is None:
+            import boto3
+
+            client = boto3.client(
+                "s3",
+                endpoint_url=endpoint_url,
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                region_name=region,
+            )
+        self.client = client
+        self.bucket = bucket
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def put(self, data: bytes) -> str:
+        ref = f"{self.prefix}{uuid.uuid4().hex}"
+        self.client.put_object(Bucket=self.bucket, Key=ref, Body=data)
+        return ref
+
+    def get(self, ref: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=ref)["Body"].read()
+
+    def temp_path(self) -> str:
+        fd, path = tempfile.mkstemp(suffix=".tmp")
+        os.close(fd)
+        return path
+
+    def put_file(self, path: str) -> str:
+        """
+        Загружает файл в хранилище частями и удаляет его.
+        """
+        ref = f"{self.prefix}{uuid.uuid4().hex}"
+        try:
+            self.client.upload_file(path, self.bucket, ref)
+        finally:
+            os.remove(path)
+        return ref
+
+    def get_file(self, ref: str) -> str:
+        """
+        Скачивает объект во временный файл частями; файл удаляет release_file.
+        """
+        path = self.temp_path()
+        self.client.download_file(self.bucket, ref, path)
+        return path
+
+    def release_file(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def delete(self, ref: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=ref)
+
+    def cleanup(self) -> int:
+        deadline = time.time() - self.ttl_seconds
+        removed = 0
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                if item["LastModified"].timestamp() < deadline:
+                    self.client.delete_object(Bucket=self.bucket, Key=item["Key"])
+                    removed += 1
+        return removed
+
+
+def create_blob_store(config):
+    """
+    Создаёт хранилище для больших тел сообщений по конфигурации (None - выключено).
+    """
+    ttl_seconds = config.BLOB_TTL_HOURS * 3600
+    if config.BLOB_STORE == "local":
+        return LocalBlobStore(config.BLOB_DIR, ttl_seconds)
+    if config.BLOB_STORE == "s3":
+        return S3BlobStore(
+            config.S3_BUCKET,
+            ttl_seconds,
+            endpoint_url=config.S3_ENDPOINT_URL,
+            access_key=config.S3_ACCESS_KEY,
+            secret_key=config.S3_SECRET_KEY,
+            region=config.S3_REGION,
+            prefix=config.S3_PREFIX,
+        )
+    return None
+
+
+def offload_body(blob_store, data: bytes, threshold: int) -> tuple[bytes, dict]:
+    """
+    Выносит тело больше threshold байт в хранилище.
+
+    Returns:
+        tuple[bytes, dict]: Тело сообщения и заголовки, которые нужно к нему добавить.
+    """
+    if blob_store is None or len(data) <= threshold:
+        return data, {}
+    ref = blob_store.put(data)
+    logger.debug(f"Тело сообщения ({len(data)} байт) вынесено в хранилище: {ref}")
+    return b"", {BLOB_REF_HEADER: ref}
+
+
+def resolve_body(blob_store, headers: dict | None, body: bytes) -> bytes:
+    """
+    Возвращает тело сообщения, при необходимости загружая его из хранилища.
+    """
+    ref = (headers or {}).get(BLOB_REF_HEADER)
+    if not ref:
+        return body
+    if blob_store is None:
+        raise ValueError(f"Тело сообщения в хранилище ({ref}), но хранилище не настроено.")
+    return blob_store.get(ref)
+
+
+def release_body(blob_store, headers: dict | None) -> None:
+    """
+    Удаляет вынесенное тело после того, как сообщение обработано.
+    """
+    ref = (headers or {}).get(BLOB_REF_HEADER)
+    if not ref or blob_store is None:
+        return
+    try:
+        blob_store.delete(ref)
+    except Exception as e:
+        # объект всё равно удалит очистка по времени жизни
+        logger.warning(f"Не удалось удалить объект {ref} из хранилища: {e}")
+
+
+async def cleanup_periodically(blob_store, interval_seconds: float) -> None:
+    """
+    Периодически удаляет из хранилища объекты старше времени жизни.
+    """
+    while True:
+        try:
+            removed = await asyncio.to_thread(blob_store.cleanup)
+            if removed:
+                logger.info(f"Удалено устаревших объектов из хранилища: {removed}")
+        except Exception as e:
+            logger.error(f"Ошибка очистки хранилища: {e}")
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    Кэш результатов обработки на диске с вытеснением по LRU при превышении размера.
+
+    Каждая запись хранится в отдельном файле, время последнего доступа
+    отслеживается по mtime файла, поэтому каталог можно разделять между процессами.
+    """
+
+    def __init__(self, directory: str, max_size_bytes: int):
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+        logger.info(
+            f"Кэш результатов: {directory}, занято {self._size} из {max_size_bytes} байт",
+        )
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """
+        Строит ключ кэша из частей; словари сериализуются в канонический JSON.
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, bytes | bytearray | memoryview):
+                digest.update(part)
+            elif isinstance(part, dict):
+                digest.update(json.dumps(part, sort_keys=True).encode())
+            else:
+                digest.update(str(part).encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # Обновляем время доступа для LRU; запись могли вытеснить сразу после
+        # чтения (другая задача или процесс), прочитанные данные всё равно верны
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_size_bytes:
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        self._commit(tmp_path, path, len(data))
+
+    def put_file(self, key: str, source_path: str) -> None:
+        """
+        Кладёт в кэш содержимое файла, не читая его в память целиком.
+        """
+        size = os.path.getsize(source_path)
+        if size > self.max_size_bytes:
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        self._commit(tmp_path, path, size)
+
+    def _commit(self, tmp_path: str, path: str, size: int) -> None:
+        """
+        Переносит готовый временный файл на место записи и учитывает его размер;
+        размер перезаписанной записи вычитается из занятого объёма.
+        """
+        with self._lock:
+            try:
+                replaced_size = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced_size = 0
+            os.replace(tmp_path, path)
+            self._size += size - replaced_size
+            if self._size > self.max_size_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """
+        Удаляет самые давно использованные записи, пока кэш не уложится в лимит.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            logger.debug(f"Запись кэша вытеснена: {path}")
@@ -0,0 +1,43 @@
+import pytest
+
+# torch и модель импортируются внутри фикстур: тесты бота запускаются и без них
+
+
+def _small_model():
+    from model.model import RRDBNet
+
+    return RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=16, num_block=1, num_grow_ch=8, scale=4)
+
+
+@pytest.fixture
+def small_model():
+    """Фабрика маленькой RRDBNet x4 со случайными весами."""
+    return _small_model
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    """Чекпоинт маленькой модели с фиксированными весами."""
+    import torch
+
+    torch.manual_seed(0)
+    path = str(tmp_path / "model.pth")
+    torch.save({"params_ema": _small_model().state_dict()}, path)
+    return path
+
+
+@pytest.fixture
+def make_inference(model_path):
+    """Фабрика RESRGANinf на CPU с весами из model_path."""
+    from model import RESRGANinf
+
+    def create(**kwargs):
+        return RESRGANinf(
+            scale=4,
+            model=_small_model(),
+            model_path=model_path,
+            device="cpu",
+            **kwargs,
+        )
+
+    return create
@@ -0,0 +1,80 @@
+import importlib.util
+
+import pytest
+import torch
+from model.backends import OnnxRuntimeModel, export_model, load_backend, validate_backend
+from model.precision import precision_report, sample_image
+from model.weights import load_weights
+
+
+@pytest.fixture
+def eager_model(small_model, model_path):
+    model = small_model()
+    load_weights(model, model_path)
+    return model.eval(), model_path
+
+
+@pytest.mark.parametrize("backend", ["torchscript", "onnx"])
+def test_exported_backend_matches_eager(eager_model, backend):
+    if backend == "onnx":
+        pytest.importorskip("onnx")
+        pytest.importorskip("onnxruntime")
+    model, model_path = eager_model
+
+    export_model(model, model_path, backend)
+    runner = load_backend(model, model_path, backend, torch.device("cpu"))
+
+    # размер входа отличается от примера, использованного при экспорте
+    input_tensor = torch.rand(2, 3, 40, 56)
+    with torch.no_grad():
+        expected = model(input_tensor)
+        actual = runner(input_tensor)
+
+    assert actual.shape == expected.shape
+    assert torch.allclose(actual, expected, atol=1e-4)
+
+
+def test_missing_artifact_raises(eager_model):
+    model, model_path = eager_model
+
+    with pytest.raises(FileNotFoundError):
+        load_backend(model, model_path, "onnx", torch.device("cpu"))
+
+
+def test_backend_selection(eager_model):
+    model, model_path = eager_model
+    device = torch.device("cpu")
+
+    assert load_backend(model, model_path, "eager", device) is model
+    compiled = load_backend(model, model_path, "compile", device)
+    assert compiled is not model
+    assert compiled._orig_mod is model
+
+    # экспорт в ONNX требует пакета onnx, запуск - onnxruntime
+    if all(importlib.util.find_spec(name) for name in ("onnx", "onnxruntime")):
+        export_model(model, model_path, "onnx")
+        assert isinstance(load_backend(model, model_path, "onnx", device), OnnxRuntimeModel)
+
+
+@pytest.mark.parametrize(
+    "backend, device, precision",
+    [
+        ("compile", "cpu", "int8"),
+        ("torchscript", "cpu", "bf16"),
+        ("onnx", "cuda", "fp32"),
+        ("tensorrt", "cpu", "fp32"),
+    ],
+)
+def test_unsupported_backend_is_rejected(backend, device, precision):
+    with pytest.raises(ValueError):
+        validate_backend(backend, torch.device(device), precision)
+
+
+def test_int8_model_stays_close_to_fp32(make_inference):
+    def create(precision):
+        return make_inference(precision=precision)
+
+    report = precision_report(create("int8"), create("fp32"), [sample_image(48, 64)])
+
+    assert report["precision"] == "int8"
+    assert report["psnr"] > 25
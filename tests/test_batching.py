@@ -0,0 +1,127 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import torch
+from model.precision import sample_image
+from worker.batching import BatchScheduler
+from worker.encoding import EncodeOptions
+
+
+class FakeExecutor:
+    """Пул потоков с интерфейсом InferenceExecutor, достаточным для BatchScheduler."""
+
+    def __init__(self, model, workers=2):
+        self.model = model
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    async def call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+
+
+class RecordingModel:
+    """Модель-заглушка: запоминает размеры батчей и удваивает вход."""
+
+    memory_manager = None
+
+    def __init__(self, error=None):
+        self.batch_sizes = []
+        self.error = error
+
+    def forward(self, input_batch):
+        self.batch_sizes.append(input_batch.shape[0])
+        if self.error is not None:
+            raise self.error
+        return input_batch * 2
+
+
+def _tiled_reference(model, img, tile_size):
+    ctx = model.prepare_image(img)
+    model.tile_inference(ctx, tile_size, batch_size=1)
+    output = model.finalize_image(ctx)
+    model.release(ctx)
+    return output
+
+
+def test_batched_requests_match_per_image_tiles(make_inference):
+    model = make_inference(pipeline_workers=0)
+    scheduler = BatchScheduler(FakeExecutor(model), max_batch_size=4, tile_size=32)
+    images = [sample_image(60, 70, seed=0), sample_image(60, 70, seed=1)]
+    encoding = EncodeOptions(format="png", max_bytes=None)
+
+    async def process_all():
+        payloads = [cv2.imencode(".png", img)[1].tobytes() for img in images]
+        return await asyncio.gather(*(scheduler.process(data, encoding) for data in payloads))
+
+    results = asyncio.run(process_all())
+
+    for img, result in zip(images, results):
+        actual = cv2.imdecode(np.frombuffer(result.data, np.uint8), cv2.IMREAD_COLOR)
+        # батч из тайлов разных запросов против батча из одного тайла: свёртки
+        # могут округлять по-разному, допускаем один уровень яркости
+        expected = _tiled_reference(model, img, 32)
+        assert np.abs(actual.astype(int) - expected).max() <= 1
+
+
+def test_tile_size_and_batch_follow_memory_budget(make_inference):
+    # большая стоимость пикселя: план даёт минимальный тайл, в батч помещается один тайл
+    model = make_inference(calc_tiles=True, pixel_size_kb=1e6, pipeline_workers=0)
+    scheduler = BatchScheduler(FakeExecutor(model), max_batch_size=8, tile_size=256)
+
+    plan = model.memory_manager.plan_tiles(300, 300, model.tile_pad)
+    assert scheduler._tile_size(300, 300) == plan.tile_size < 256
+    assert scheduler._batch_limit((3, 84, 84)) == 1
+
+
+def test_group_is_flushed_at_max_batch_size():
+    model = RecordingModel()
+    scheduler = BatchScheduler(FakeExecutor(model), max_batch_size=3, max_latency_ms=60_000)
+
+    async def submit_all():
+        tiles = [torch.full((1, 3, 8, 8), float(index)) for index in range(3)]
+        return await asyncio.wait_for(
+            asyncio.gather(*(scheduler.submit(tile) for tile in tiles)),
+            timeout=5,
+        )
+
+    outputs = asyncio.run(submit_all())
+
+    assert model.batch_sizes == [3]
+    for index, output in enumerate(outputs):
+        assert torch.equal(output, torch.full((1, 3, 8, 8), 2.0 * index))
+
+
+def test_partial_group_is_flushed_after_max_latency():
+    model = RecordingModel()
+    scheduler = BatchScheduler(FakeExecutor(model), max_batch_size=8, max_latency_ms=20)
+
+    async def submit_all():
+        tiles = [torch.zeros(1, 3, 8, 8), torch.zeros(1, 3, 8, 8), torch.zeros(1, 3, 16, 16)]
+        return await asyncio.wait_for(
+            asyncio.gather(*(scheduler.submit(tile) for tile in tiles)),
+            timeout=5,
+        )
+
+    asyncio.run(submit_all())
+
+    # тайлы разной формы попадают в разные батчи
+    assert sorted(model.batch_sizes) == [1, 2]
+
+
+def test_failed_batch_fails_every_request():
+    model = RecordingModel(error=RuntimeError("out of memory"))
+    scheduler = BatchScheduler(FakeExecutor(model), max_batch_size=3, max_latency_ms=20)
+
+    async def submit_all():
+        tiles = [torch.zeros(1, 3, 8, 8) for _ in range(3)]
+        return await asyncio.gather(
+            *(scheduler.submit(tile) for tile in tiles),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(submit_all())
+
+    assert model.batch_sizes == [3]
+    assert all(isinstance(result, RuntimeError) for result in results)
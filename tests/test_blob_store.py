@@ -0,0 +1,63 @@
+import os
+import time
+
+from bot.scripts.message_scripts import create_image_message
+from shared.blob_store import (
+    BLOB_REF_HEADER,
+    LocalBlobStore,
+    offload_body,
+    release_body,
+    resolve_body,
+)
+from worker.protocol import parse_image_message
+
+
+def test_large_body_travels_as_reference(tmp_path):
+    store = LocalBlobStore(str(tmp_path), ttl_seconds=3600)
+    photo_bytes = b"\xff\xd8\xff" + os.urandom(4096)
+
+    body, headers = offload_body(store, photo_bytes, threshold=1024)
+    assert body == b""
+    message = create_image_message(7, body, blob_ref=headers[BLOB_REF_HEADER])
+
+    job = parse_image_message(message, resolve_body(store, message.headers, message.body))
+    assert job.chat_id == 7
+    assert job.image_bytes == photo_bytes
+
+    release_body(store, message.headers)
+    assert not os.listdir(tmp_path)
+
+
+def test_small_body_stays_inline(tmp_path):
+    store = LocalBlobStore(str(tmp_path), ttl_seconds=3600)
+
+    body, headers = offload_body(store, b"small", threshold=1024)
+
+    assert body == b"small"
+    assert headers == {}
+    assert resolve_body(store, headers, body) == b"small"
+
+
+def test_cleanup_removes_expired_blobs(tmp_path):
+    store = LocalBlobStore(str(tmp_path), ttl_seconds=60)
+    expired = store.put(b"old")
+    fresh = store.put(b"new")
+    old_time = time.time() - 120
+    os.utime(tmp_path / expired, (old_time, old_time))
+
+    assert store.cleanup() == 1
+    assert store.get(fresh) == b"new"
+
+
+def test_file_is_moved_into_store_without_copy(tmp_path):
+    store = LocalBlobStore(str(tmp_path), ttl_seconds=3600)
+    path = store.temp_path()
+    with open(path, "wb") as f:
+        f.write(b"photo")
+
+    ref = store.put_file(path)
+
+    assert not os.path.exists(path)
+    assert store.get(ref) == b"photo"
+    with open(store.get_file(ref), "rb") as f:
+        assert f.read() == b"photo"
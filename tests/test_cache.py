@@ -0,0 +1,78 @@
+import os
+
+from bot.scripts.message_scripts import photo_cache_parts
+from shared.result_cache import ResultCache
+
+
+def test_get_returns_stored_result(tmp_path):
+    cache = ResultCache(str(tmp_path), max_size_bytes=1024)
+    key = cache.make_key(b"image", "model.pth", 4, {"quality": 90})
+
+    assert cache.get(key) is None
+    cache.put(key, b"result")
+    assert cache.get(key) == b"result"
+
+
+def test_key_depends_on_options(tmp_path):
+    cache = ResultCache(str(tmp_path), max_size_bytes=1024)
+
+    assert cache.make_key(b"image", {"a": 1, "b": 2}) == cache.make_key(b"image", {"b": 2, "a": 1})
+    assert cache.make_key(b"image", {"a": 1}) != cache.make_key(b"image", {"a": 2})
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path), max_size_bytes=250)
+    keys = [cache.make_key(index) for index in range(3)]
+
+    cache.put(keys[0], b"x" * 100)
+    cache.put(keys[1], b"x" * 100)
+    os.utime(cache._path(keys[0]), (1, 1))
+    os.utime(cache._path(keys[1]), (2, 2))
+    # обращение к первой записи делает её самой свежей
+    cache.get(keys[0])
+    cache.put(keys[2], b"x" * 100)
+
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
+
+
+def test_overwrite_does_not_inflate_size(tmp_path):
+    cache = ResultCache(str(tmp_path), max_size_bytes=250)
+    keys = [cache.make_key(index) for index in range(2)]
+
+    for _ in range(3):
+        cache.put(keys[0], b"x" * 100)
+    cache.put(keys[1], b"x" * 100)
+
+    # повторная запись заменяет запись, а не добавляет её размер ещё раз
+    assert cache._size == 200
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is not None
+
+
+def test_entry_evicted_during_get_is_still_returned(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path), max_size_bytes=1024)
+    key = cache.make_key(b"image")
+    cache.put(key, b"result")
+
+    def evicted(path):
+        raise FileNotFoundError(path)
+
+    # запись удалена другим процессом между чтением и обновлением mtime
+    monkeypatch.setattr(os, "utime", evicted)
+
+    assert cache.get(key) == b"result"
+
+
+def test_photo_key_misses_after_settings_change(tmp_path):
+    cache = ResultCache(str(tmp_path), max_size_bytes=1024)
+
+    def key(options, cache_version="1"):
+        return cache.make_key(*photo_cache_parts("photo", options, cache_version))
+
+    cache.put(key({"output_format": "webp"}), b"result")
+
+    assert cache.get(key({"output_format": "webp"})) == b"result"
+    assert cache.get(key({"output_format": "png"})) is None
+    assert cache.get(key({"output_format": "webp"}, cache_version="2")) is None
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+from aio_pika.exceptions import ChannelNotFoundEntity
+from bot.services.capacity import CapacityMonitor, format_eta
+from worker.stats import WorkerStats, percentile, publish_stats_periodically
+
+
+def _report(worker_id, **values):
+    report = {
+        "worker_id": worker_id,
+        "timestamp": time.time(),
+        "concurrency": 2,
+        "queue_depths": {"process_image_queue": 0},
+        "waiting": 0,
+        "in_flight": 0,
+        "p50_seconds": 10.0,
+    }
+    report.update(values)
+    return report
+
+
+def test_worker_stats_snapshot():
+    stats = WorkerStats(rate_window=60)
+    for seconds in (1.0, 2.0, 3.0, 4.0):
+        stats.job_started()
+        stats.job_finished(seconds, pixels=1_000_000)
+    stats.job_started()
+    stats.job_finished(None)
+    stats.job_started()
+
+    snapshot = stats.snapshot()
+
+    assert snapshot["in_flight"] == 1
+    assert snapshot["p50_seconds"] == 2.0
+    assert snapshot["p95_seconds"] == 4.0
+    assert snapshot["jobs_per_minute"] == 4
+    assert percentile([], 0.5) is None
+
+
+def test_eta_grows_with_backlog():
+    monitor = CapacityMonitor(stale_after=60)
+    assert monitor.estimate() is None
+
+    monitor.update(_report("a", queue_depths={"process_image_queue": 7}, in_flight=2))
+    monitor.update(
+        _report("b", queue_depths={"process_image_queue": 7}, in_flight=1, waiting=2),
+    )
+    estimate = monitor.estimate()
+
+    assert estimate.workers == 2
+    assert estimate.backlog == 12
+    assert estimate.eta_seconds == (12 // 4 + 1) * 10.0
+    assert estimate.overloaded(max_backlog=10, max_eta_seconds=0)
+    assert not estimate.overloaded(max_backlog=0, max_eta_seconds=60)
+    assert estimate.overloaded(max_backlog=0, max_eta_seconds=30)
+
+
+def test_stale_workers_are_ignored():
+    monitor = CapacityMonitor(stale_after=0.01)
+    monitor.update(_report("a"))
+    time.sleep(0.02)
+
+    assert monitor.estimate() is None
+
+
+def test_format_eta():
+    assert format_eta(20) == "меньше минуты"
+    assert format_eta(600) == "около 10 мин"
+    assert format_eta(3 * 3600) == "около 3 ч"
+
+
+class FakeStatsChannel:
+    """Канал, который закрывается при пассивном объявлении ещё не созданной очереди."""
+
+    def __init__(self, declared, published):
+        self.declared = declared
+        self.published = published
+        self.is_closed = False
+
+    async def declare_exchange(self, name, exchange_type):
+        return SimpleNamespace(publish=self.publish)
+
+    async def declare_queue(self, name, passive=False):
+        if name not in self.declared:
+            self.is_closed = True
+            raise ChannelNotFoundEntity(f"no queue '{name}'")
+        return SimpleNamespace(declaration_result=SimpleNamespace(message_count=3))
+
+    async def publish(self, message, routing_key):
+        self.published.append(json.loads(message.body))
+
+
+def test_stats_survive_queue_declared_after_start():
+    declared, published, channels = set(), [], []
+
+    async def open_channel():
+        channels.append(FakeStatsChannel(declared, published))
+        return channels[-1]
+
+    async def run():
+        task = asyncio.create_task(
+            publish_stats_periodically(
+                SimpleNamespace(channel=open_channel),
+                "worker_stats",
+                ["process_image_queue"],
+                WorkerStats(),
+                concurrency=2,
+                waiting=lambda: 0,
+                interval=0.01,
+            ),
+        )
+        await asyncio.sleep(0.05)
+        # потребитель объявил очередь позже, чем запустилась статистика
+        declared.add("process_image_queue")
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(run())
+
+    assert len(channels) > 1
+    assert published
+    assert published[-1]["queue_depths"] == {"process_image_queue": 3}
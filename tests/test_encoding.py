@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from worker.encoding import (
+    EncodedImage,
+    EncodeOptions,
+    detect_format,
+    encode_image,
+    resolve_options,
+)
+
+
+def _noise(height, width, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def test_message_options_override_defaults():
+    defaults = EncodeOptions(format="auto", quality=90)
+
+    assert resolve_options(defaults, None) is defaults
+    assert resolve_options(defaults, {"scale": 4}) is defaults
+
+    resolved = resolve_options(defaults, {"output_format": "png", "quality": 150})
+    assert resolved.format == "png"
+    assert resolved.quality == 100
+
+    with pytest.raises(ValueError):
+        resolve_options(defaults, {"output_format": "gif"})
+
+
+@pytest.mark.parametrize("image_format", ["jpeg", "webp", "png"])
+def test_explicit_format_is_detected(image_format):
+    encoded = encode_image(_noise(64, 64), EncodeOptions(format=image_format))
+
+    assert encoded.format == image_format
+    assert detect_format(encoded.data) == image_format
+    assert not encoded.as_document
+    assert EncodedImage.from_bytes(encoded.data) == encoded
+
+
+def test_auto_lowers_quality_to_fit_limit():
+    img = _noise(256, 256)
+    unlimited = encode_image(img, EncodeOptions(format="jpeg", quality=95, max_bytes=None))
+    limit = len(unlimited.data) * 3 // 4
+
+    fitted = encode_image(img, EncodeOptions(quality=95, max_bytes=limit, min_quality=10))
+
+    assert len(fitted.data) <= limit
+    assert fitted.format in ("jpeg", "webp")
+
+
+def test_oversized_photo_is_sent_as_document():
+    encoded = encode_image(np.zeros((8, 10001, 3), dtype=np.uint8), EncodeOptions())
+
+    assert encoded.as_document
+
+
+@pytest.mark.parametrize("shape", [(8, 10001), (20, 500)])
+def test_cached_oversized_photo_is_sent_as_document(shape):
+    encoded = encode_image(np.zeros((*shape, 3), dtype=np.uint8), EncodeOptions(format="png"))
+
+    assert encoded.as_document
+    assert EncodedImage.from_bytes(encoded.data) == encoded
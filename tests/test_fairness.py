@@ -0,0 +1,77 @@
+import struct
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+from bot.scripts.message_scripts import message_priority
+from bot.services.in_flight import InFlightLimiter
+from shared.image_header import read_image_size
+from worker.fairness import FairQueue, job_priority_key
+
+
+def test_fair_queue_round_robins_users_and_prefers_small_jobs():
+    queue = FairQueue()
+    for index in range(3):
+        queue.put("album", 4_000_000, f"album-{index}")
+    queue.put("album", 100, "album-small")
+    queue.put("other", 8_000_000, "other-0")
+
+    order = [queue.get_nowait() for _ in range(len(queue))]
+
+    assert order == ["album-small", "other-0", "album-0", "album-1", "album-2"]
+    with pytest.raises(IndexError):
+        queue.get_nowait()
+
+
+def test_jobs_of_unknown_size_go_after_measured_jobs():
+    queue = FairQueue()
+    for name, headers in [
+        ("unknown", {"chat_id": 1}),
+        ("large", {"chat_id": 1, "pixels": 8_000_000}),
+        ("small", {"chat_id": 1, "pixels": 100}),
+    ]:
+        queue.put(*job_priority_key(SimpleNamespace(headers=headers)), name)
+
+    assert [queue.get_nowait() for _ in range(len(queue))] == ["small", "large", "unknown"]
+
+
+@pytest.mark.parametrize("extension", [".jpg", ".png", ".webp"])
+def test_image_size_is_read_from_header(extension):
+    img = np.zeros((37, 53, 3), dtype=np.uint8)
+    _, encoded = cv2.imencode(extension, img)
+
+    assert tuple(read_image_size(encoded.tobytes())) == (53, 37)
+
+
+def test_unknown_header_has_no_size():
+    assert read_image_size(b"GIF89a" + struct.pack("<HH", 1, 1)) is None
+
+
+def test_smaller_images_get_higher_priority():
+    assert message_priority(512 * 512, 10) == 10
+    assert message_priority(4000 * 3000, 10) < message_priority(1024 * 1024, 10)
+    assert message_priority(10**12, 10) == 0
+    assert message_priority(None, 10) == 5
+    assert message_priority(512 * 512, 0) is None
+
+
+def test_in_flight_limit_per_user():
+    limiter = InFlightLimiter(max_in_flight=2, timeout=60)
+
+    assert limiter.try_acquire(1)
+    assert limiter.try_acquire(1)
+    assert not limiter.try_acquire(1)
+    assert limiter.try_acquire(2)
+
+    limiter.release(1)
+    assert limiter.try_acquire(1)
+
+
+def test_in_flight_slots_expire():
+    limiter = InFlightLimiter(max_in_flight=1, timeout=0.01)
+
+    assert limiter.try_acquire(1)
+    time.sleep(0.02)
+    assert limiter.try_acquire(1)
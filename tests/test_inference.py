@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from model.precision import sample_image
+
+
+def test_concurrent_requests_match_sequential(make_inference):
+    # большая стоимость пикселя заставляет планировщик резать изображение на тайлы
+    model = make_inference(calc_tiles=True, pixel_size_kb=1e6)
+    images = [sample_image(60 + 10 * seed, 80 - 5 * seed, seed=seed) for seed in range(4)]
+
+    expected = [model.upgrade_resolution(img)[0] for img in images]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        actual = list(executor.map(lambda img: model.upgrade_resolution(img)[0], images * 2))
+
+    for index, output in enumerate(actual):
+        assert np.array_equal(output, expected[index % len(images)])
+
+
+def test_batched_tiles_match_sequential_tiles(make_inference):
+    model = make_inference(pipeline_workers=0)
+    img = sample_image(70, 90)
+
+    outputs = []
+    for batch_size in (1, 4):
+        ctx = model.prepare_image(img)
+        model.tile_inference(ctx, tile_size=32, batch_size=batch_size)
+        outputs.append(model.finalize_image(ctx))
+        model.release(ctx)
+
+    # алгоритмы свёртки oneDNN/cuDNN зависят от размера батча, допускаем
+    # расхождение округления в один уровень яркости
+    assert np.abs(outputs[0].astype(int) - outputs[1]).max() <= 1
+
+
+def test_input_buffer_is_returned_when_inference_fails(make_inference, monkeypatch):
+    model = make_inference()
+    released = []
+    monkeypatch.setattr(model.input_buffers, "release", released.append)
+
+    def fail(input_batch):
+        raise RuntimeError("out of memory")
+
+    monkeypatch.setattr(model, "forward", fail)
+
+    with pytest.raises(RuntimeError):
+        model.upgrade_resolution(sample_image(32, 32))
+    assert len(released) == 1
@@ -0,0 +1,98 @@
+import json
+import math
+from types import SimpleNamespace
+
+import pytest
+import torch
+from model import calibration
+from model.memory_manager import MemoryManager, estimate_pixel_cost_kb
+
+LIMIT_KB = 2_000_000
+
+
+@pytest.fixture
+def memory_manager(monkeypatch):
+    # фиксированный объём памяти вместо текущей свободной памяти машины
+    monkeypatch.setattr(MemoryManager, "memory_limit_kb", property(lambda self: LIMIT_KB))
+    return MemoryManager(pixel_cost_kb=10.0, fixed_cost_kb=100.0, device=torch.device("cpu"))
+
+
+def test_small_image_is_processed_whole(memory_manager):
+    plan = memory_manager.plan_tiles(200, 300, tile_pad=10)
+
+    assert not plan.tiled
+    assert plan.batch_size == 1
+
+
+@pytest.mark.parametrize("height, width", [(1000, 700), (2049, 3000), (500, 4000)])
+def test_tile_plan_fits_budget_and_image(memory_manager, height, width):
+    plan = memory_manager.plan_tiles(height, width, tile_pad=10, max_batch_size=8)
+    budget_kb = LIMIT_KB * memory_manager.memory_fraction - memory_manager.fixed_cost_kb
+
+    padded = plan.tile_size + 2 * plan.tile_pad
+    assert plan.tiled
+    assert 1 <= plan.batch_size <= 8
+    assert plan.batch_size * padded**2 * memory_manager.pixel_cost_kb <= budget_kb
+    assert plan.tile_size % memory_manager.tile_align == 0
+    # сторона тайла подобрана так, что хотя бы одна сторона изображения делится
+    # на почти равные тайлы: последний меньше остальных не больше чем на выравнивание
+    # каждого тайла
+    evenly_split = []
+    for side in (height, width):
+        tiles = math.ceil(side / plan.tile_size)
+        shortfall = plan.tile_size - (side - (tiles - 1) * plan.tile_size)
+        evenly_split.append(shortfall < tiles * memory_manager.tile_align)
+    assert any(evenly_split)
+
+
+def test_batch_grows_when_tiles_are_small(memory_manager):
+    memory_manager.max_tile_size = 64
+
+    plan = memory_manager.plan_tiles(1000, 1000, tile_pad=10, max_batch_size=8)
+
+    assert plan.tile_size <= 64
+    assert plan.batch_size == 8
+
+
+def test_calibration_is_cached_per_key(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_calibrate(model, device, probe_sizes, precision, min_pixel_cost_kb=None):
+        calls.append(precision)
+        return {"pixel_cost_kb": 1.5 * len(calls), "fixed_cost_kb": 0.0}
+
+    monkeypatch.setattr(calibration, "calibrate_pixel_cost", fake_calibrate)
+    cache_path = str(tmp_path / "calibration" / "memory.json")
+    model = SimpleNamespace(scale=4)
+    device = torch.device("cpu")
+
+    first = calibration.load_or_calibrate(model, device, cache_path)
+    # повторный вызов, в том числе из нового процесса, читает результат из файла
+    assert calibration.load_or_calibrate(model, device, cache_path) == first
+    assert calls == ["fp32"]
+
+    calibration.load_or_calibrate(model, device, cache_path, precision="bf16")
+    forced = calibration.load_or_calibrate(model, device, cache_path, force=True)
+
+    assert calls == ["fp32", "bf16", "fp32"]
+    assert forced != first
+    with open(cache_path) as f:
+        assert set(json.load(f)) == {"cpu:fp32:x4", "cpu:bf16:x4"}
+
+
+def test_flat_calibration_falls_back_to_estimate(memory_manager, small_model, monkeypatch):
+    # прогрев уже вырастил кучу, и замеры RSS почти не зависят от размера входа
+    monkeypatch.setattr(calibration, "measure_peak_kb", lambda *args: 50.0)
+    model = small_model()
+    estimate_kb = estimate_pixel_cost_kb(model)
+
+    result = calibration.calibrate_pixel_cost(
+        model,
+        torch.device("cpu"),
+        min_pixel_cost_kb=estimate_kb,
+    )
+    memory_manager.pixel_cost_kb = result["pixel_cost_kb"]
+    memory_manager.fixed_cost_kb = result["fixed_cost_kb"]
+
+    assert result["pixel_cost_kb"] == pytest.approx(estimate_kb)
+    assert memory_manager.plan_tiles(2000, 3000, tile_pad=10).tiled
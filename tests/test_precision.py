@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+from model.precision import precision_report, sample_image
+from worker import inference
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    """Подменяет загрузку модели и отчёт о точности; PSNR задаёт тест."""
+    created = []
+
+    def create_model(device, precision, sample_images=None, backend="eager"):
+        model = SimpleNamespace(precision=precision, backend=backend)
+        created.append(model)
+        return model
+
+    def report(candidate, reference, images=None):
+        return {"psnr": state.psnr, "ssim": 0.99, "speedup": 1.5}
+
+    monkeypatch.setattr(inference, "_create_model", create_model)
+    monkeypatch.setattr(inference, "precision_report", report)
+    monkeypatch.setattr(inference.config, "PRECISION_CHECK", True)
+    monkeypatch.setattr(inference.config, "PRECISION_MIN_PSNR", 40.0)
+    state = SimpleNamespace(created=created, psnr=None)
+    return state
+
+
+@pytest.mark.parametrize("precision", ["fp16", "bf16", "int8"])
+def test_precision_passing_the_check_is_kept(fake_models, precision):
+    fake_models.psnr = 45.0
+
+    model = inference.build_model("cpu", precision, backend="compile")
+
+    assert model.precision == precision
+    # проверяемая модель и эталон fp32
+    assert [created.precision for created in fake_models.created] == [precision, "fp32"]
+
+
+@pytest.mark.parametrize("precision", ["fp16", "bf16", "int8"])
+def test_precision_below_threshold_falls_back_to_fp32(fake_models, precision):
+    fake_models.psnr = 30.0
+
+    model = inference.build_model("cpu", precision, backend="compile")
+
+    assert model.precision == "fp32"
+    assert model.backend == "compile"
+
+
+def test_fp32_is_not_checked(fake_models):
+    model = inference.build_model("cpu", "fp32")
+
+    assert model.precision == "fp32"
+    assert len(fake_models.created) == 1
+
+
+def test_process_pool_reports_effective_precision(monkeypatch):
+    monkeypatch.setattr(inference, "_process_model", SimpleNamespace(precision="fp32"))
+
+    _, precision = inference._process_ready()
+
+    assert precision == "fp32"
+
+
+def test_bf16_report_against_fp32(make_inference):
+    def create(precision):
+        return make_inference(precision=precision)
+
+    reference = create("fp32")
+    images = [sample_image(48, 64)]
+
+    identical = precision_report(create("fp32"), reference, images)
+    reduced = precision_report(create("bf16"), reference, images)
+
+    assert identical["psnr"] == float("inf")
+    assert 20 < reduced["psnr"] < identical["psnr"]
+    assert 0 < reduced["ssim"] <= 1
+
+
+def test_calibration_inputs_return_pooled_buffers(make_inference, monkeypatch):
+    model = make_inference()
+    released = []
+    monkeypatch.setattr(model.input_buffers, "release", released.append)
+
+    inputs = model._calibration_inputs()
+
+    assert len(released) == len(inputs) == 4
+    # входы скопированы: повторное использование буфера пула их не меняет
+    for tensor, buffer in zip(inputs, released):
+        assert tensor.data_ptr() != buffer.data_ptr()
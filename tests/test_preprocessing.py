@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+from model import RESRGANinf
+from model.model import RRDBNet
+from model.precision import sample_image
+
+
+@pytest.fixture(params=[4, 2])
+def inference(request, tmp_path):
+    scale = request.param
+    model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=8, num_block=1, num_grow_ch=8, scale=scale)
+    model_path = str(tmp_path / "model.pth")
+    torch.save({"params_ema": model.state_dict()}, model_path)
+    return RESRGANinf(scale=scale, model=model, model_path=model_path, device="cpu")
+
+
+@pytest.mark.parametrize("grayscale", [False, True])
+def test_fused_pre_process_matches_legacy(inference, grayscale):
+    img = sample_image(37, 51)
+    conversion = cv2.COLOR_BGR2RGB
+    if grayscale:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        conversion = cv2.COLOR_GRAY2RGB
+
+    fused = inference.fused_pre_process(img)
+    legacy = inference.pre_process(cv2.cvtColor(img.astype(np.float32) / 256, conversion))
+
+    assert torch.equal(fused.img, legacy.img)
+    assert (fused.mod_pad_h, fused.mod_pad_w) == (legacy.mod_pad_h, legacy.mod_pad_w)
+
+
+def test_input_buffer_is_reused(inference):
+    img = sample_image(40, 40)
+
+    first = inference.prepare_image(img)
+    buffer = first.img
+    inference.release(first)
+    second = inference.prepare_image(sample_image(40, 40, seed=1))
+
+    assert second.img is buffer
+    assert first.img is None
+
+
+@pytest.mark.parametrize("img_mode", ["RGB", "L"])
+def test_to_uint8_image_matches_numpy_postprocessing(img_mode):
+    torch.manual_seed(0)
+    output = torch.rand(1, 3, 30, 40) * 1.2 - 0.1
+
+    expected = output.squeeze().clamp(0, 1).numpy()
+    expected = np.transpose(expected[[2, 1, 0], :, :], (1, 2, 0))
+    if img_mode == "L":
+        expected = cv2.cvtColor(expected, cv2.COLOR_BGR2GRAY)
+    expected = (expected * 255.0).round().astype(np.uint8)
+
+    actual = RESRGANinf.to_uint8_image(output, img_mode)
+
+    assert actual.flags["C_CONTIGUOUS"]
+    assert np.array_equal(actual, expected)
@@ -0,0 +1,146 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from bot.scripts.message_scripts import create_image_message
+from worker import main
+from worker.encoding import EncodedImage
+from worker.main import handle_message
+from worker.protocol import PROTOCOL_VERSION, parse_image_message, result_headers
+
+
+def test_binary_message_roundtrip():
+    photo_bytes = b"\xff\xd8\xff\xe0fake-jpeg"
+    message = create_image_message(12345, photo_bytes, options={"quality": 90})
+
+    assert message.body == photo_bytes
+    assert message.headers["protocol_version"] == PROTOCOL_VERSION
+
+    job = parse_image_message(message)
+    assert job.chat_id == 12345
+    assert job.image_bytes == photo_bytes
+    assert job.image_format == "jpeg"
+    assert job.options == {"quality": 90}
+    assert result_headers(job)["chat_id"] == 12345
+
+
+def test_legacy_json_message_is_accepted():
+    photo_bytes = b"\x89PNG-fake"
+    message = create_image_message(42, photo_bytes, version=1)
+
+    assert not message.headers
+    job = parse_image_message(message)
+    assert job.version == 1
+    assert job.chat_id == 42
+    assert job.image_bytes == photo_bytes
+
+
+def test_empty_binary_message_is_rejected():
+    message = create_image_message(42, b"")
+
+    with pytest.raises(ValueError):
+        parse_image_message(message)
+
+
+def test_unknown_version_is_rejected():
+    with pytest.raises(ValueError):
+        create_image_message(42, b"data", version=99)
+
+
+def test_cache_key_is_echoed_in_result_headers():
+    message = create_image_message(7, b"data", cache_key="abc")
+
+    job = parse_image_message(message)
+    assert job.cache_key == "abc"
+    assert result_headers(job)["cache_key"] == "abc"
+
+
+class FakeIncomingMessage:
+    def __init__(self, message):
+        self.headers = message.headers
+        self.body = message.body
+        self.rejected = False
+
+    async def ack(self):
+        raise AssertionError("failed job must not be acknowledged")
+
+    async def reject(self, requeue=False):
+        self.rejected = True
+
+
+class AckedIncomingMessage(FakeIncomingMessage):
+    acked = False
+
+    async def ack(self):
+        self.acked = True
+
+
+class EchoExecutor:
+    precision = "fp32"
+
+    async def run(self, image_bytes, encoding=None):
+        return EncodedImage(image_bytes, "jpeg")
+
+
+class FailingExecutor:
+    precision = "fp32"
+
+    async def run(self, image_bytes, encoding=None):
+        raise RuntimeError("CUDA out of memory")
+
+
+def test_failed_job_publishes_error_result():
+    published = []
+
+    async def publish(message, routing_key):
+        published.append((message, routing_key))
+
+    publisher_channel = SimpleNamespace(default_exchange=SimpleNamespace(publish=publish))
+    message = FakeIncomingMessage(create_image_message(12345, b"\xff\xd8\xff\xe0fake-jpeg"))
+
+    asyncio.run(
+        handle_message(
+            message,
+            FailingExecutor(),
+            publisher_channel,
+            "results",
+            asyncio.Semaphore(1),
+        ),
+    )
+
+    assert message.rejected
+    [(result, routing_key)] = published
+    assert routing_key == "results"
+    assert result.body == b""
+    assert result.headers["chat_id"] == 12345
+    assert result.headers["status"] == "error"
+    assert "out of memory" in result.headers["error"]
+
+
+def test_cleanup_failure_after_ack_is_not_a_job_error(monkeypatch):
+    published = []
+
+    async def publish(message, routing_key):
+        published.append(message)
+
+    def fail_release(blob_store, headers):
+        raise OSError("blob store unavailable")
+
+    monkeypatch.setattr(main, "release_body", fail_release)
+    publisher_channel = SimpleNamespace(default_exchange=SimpleNamespace(publish=publish))
+    message = AckedIncomingMessage(create_image_message(12345, b"\xff\xd8\xff\xe0fake-jpeg"))
+
+    asyncio.run(
+        handle_message(
+            message,
+            EchoExecutor(),
+            publisher_channel,
+            "results",
+            asyncio.Semaphore(1),
+        ),
+    )
+
+    assert message.acked
+    assert not message.rejected
+    [result] = published
+    assert result.headers.get("status") != "error"
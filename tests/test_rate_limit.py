@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+from bot.services.rate_limit import DeliveryRateLimiter, TokenBucket
+
+
+def test_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    assert bucket.delay() == 0
+    assert bucket.delay() == 0
+    assert 0 < bucket.delay() <= 0.1
+
+
+def test_pause_blocks_tokens():
+    bucket = TokenBucket(rate=100, capacity=5)
+    bucket.pause(0.5)
+
+    assert bucket.delay() > 0.4
+    assert not bucket.idle
+
+
+def test_chat_limit_does_not_slow_other_chats():
+    limiter = DeliveryRateLimiter(global_rate=1000, chat_rate=5, chat_burst=1)
+
+    async def send_all():
+        start = time.monotonic()
+        await asyncio.gather(*(limiter.acquire(chat_id) for chat_id in range(20)))
+        parallel = time.monotonic() - start
+
+        start = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire("same")
+        return parallel, time.monotonic() - start
+
+    parallel, same_chat = asyncio.run(send_all())
+
+    assert parallel < 0.1
+    # первая отправка сразу, две следующие - с интервалом 1 / chat_rate
+    assert same_chat >= 0.35
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import pytest
+from bot.scripts.message_scripts import size_class_queue as bot_size_class_queue
+from worker.routing import class_settings, served_size_classes, size_class_queue
+
+
+def _config(**values):
+    config = SimpleNamespace(
+        SIZE_ROUTING=True,
+        WORKER_SIZE_CLASSES="small,large",
+        SIZE_CLASS_SETTINGS={"small": {"BATCH_TILE_SIZE": 128}, "large": {"PREFETCH_COUNT": 1}},
+        PREFETCH_COUNT=2,
+        FAIR_QUEUE_SIZE=16,
+        BATCHING_ENABLED=True,
+        BATCH_MAX_SIZE=8,
+        BATCH_MAX_LATENCY_MS=20,
+        BATCH_TILE_SIZE=256,
+    )
+    vars(config).update(values)
+    return config
+
+
+def test_bot_and_worker_agree_on_queue_names():
+    small_max = 2_000_000
+
+    assert bot_size_class_queue("jobs", 512 * 512, small_max) == size_class_queue("jobs", "small")
+    assert bot_size_class_queue("jobs", 8000 * 6000, small_max) == size_class_queue("jobs", "large")
+    assert bot_size_class_queue("jobs", None, small_max) == "jobs.large"
+    assert size_class_queue("jobs", None) == "jobs"
+
+
+def test_worker_serves_configured_classes():
+    assert served_size_classes(_config()) == ["small", "large"]
+    assert served_size_classes(_config(WORKER_SIZE_CLASSES="large")) == ["large"]
+    assert served_size_classes(_config(SIZE_ROUTING=False)) == [None]
+    with pytest.raises(ValueError):
+        served_size_classes(_config(WORKER_SIZE_CLASSES="huge"))
+
+
+def test_class_settings_override_defaults():
+    config = _config()
+
+    assert class_settings(config, "small").BATCH_TILE_SIZE == 128
+    assert class_settings(config, "small").PREFETCH_COUNT == 2
+    assert class_settings(config, "large").PREFETCH_COUNT == 1
+    assert class_settings(config, None).BATCH_TILE_SIZE == 256
+    with pytest.raises(ValueError):
+        class_settings(_config(SIZE_CLASS_SETTINGS={"small": {"MODEL_PATH": "x"}}), "small")
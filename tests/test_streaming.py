@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+from model.precision import sample_image
+from model.seams import seam_report
+
+
+# большая стоимость пикселя заставляет планировщик резать изображение на тайлы
+TILED = {"calc_tiles": True, "pixel_size_kb": 1e6}
+
+
+@pytest.mark.parametrize("grayscale", [False, True])
+def test_streaming_matches_regular_pipeline(make_inference, tmp_path, grayscale):
+    img = sample_image(130, 170)
+    if grayscale:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    expected, _ = make_inference(**TILED).upgrade_resolution(img)
+    streaming = make_inference(**TILED, stream_min_pixels=1, stream_buffer_dir=str(tmp_path))
+    actual, _ = streaming.upgrade_resolution(img)
+
+    assert isinstance(actual, np.memmap)
+    assert actual.shape == expected.shape
+    assert np.array_equal(actual, expected)
+
+
+def test_tile_pipeline_matches_sequential_tiles(make_inference):
+    img = sample_image(90, 110)
+
+    expected, _ = make_inference(**TILED, pipeline_workers=0).upgrade_resolution(img)
+    actual, _ = make_inference(**TILED, pipeline_workers=2).upgrade_resolution(img)
+
+    assert np.array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("blend", ["linear", "cosine"])
+def test_blended_streaming_matches_blended_tiles(make_inference, blend):
+    img = sample_image(120, 150)
+
+    expected, _ = make_inference(**TILED, tile_blend=blend).upgrade_resolution(img)
+    streaming = make_inference(**TILED, tile_blend=blend, stream_min_pixels=1)
+    actual, _ = streaming.upgrade_resolution(img)
+
+    assert np.array_equal(actual, expected)
+
+
+def test_blend_weights_of_neighbours_sum_to_one(make_inference):
+    model = make_inference(**TILED, tile_blend="cosine")
+    left, right = model.split_tiles(40, 80, 40, tile_pad=4)
+    overlap = 2 * 4 * model.scale
+
+    left_weight = model.tile_weight(left, torch.device("cpu"))[0, 0, 0, -overlap:]
+    right_weight = model.tile_weight(right, torch.device("cpu"))[0, 0, 0, :overlap]
+
+    assert torch.allclose(left_weight + right_weight, torch.ones(overlap))
+
+
+def test_seam_report_returns_input_buffers(make_inference, monkeypatch):
+    model = make_inference(tile_blend="linear")
+    acquired, released = [], []
+    acquire = model.input_buffers.acquire
+
+    def tracked_acquire(*args):
+        acquired.append(acquire(*args))
+        return acquired[-1]
+
+    monkeypatch.setattr(model.input_buffers, "acquire", tracked_acquire)
+    monkeypatch.setattr(model.input_buffers, "release", released.append)
+
+    results = seam_report(model, sample_image(64, 64), 32, tile_pads=[0, 4], blends=[None, "linear"])
+
+    assert len(results) == 4
+    assert len(released) == len(acquired) == 5
+    assert model.tile_blend == "linear"
@@ -0,0 +1,44 @@
+import pytest
+from worker import supervisor
+from worker.supervisor import WorkerSupervisor, build_worker_specs, parse_devices
+
+
+class FakeProcess:
+    def __init__(self, alive=True, exitcode=None):
+        self.alive = alive
+        self.exitcode = exitcode
+
+    def is_alive(self):
+        return self.alive
+
+
+def test_specs_per_device_and_cpu_split(monkeypatch):
+    monkeypatch.setattr(supervisor, "_available_cpus", lambda: list(range(8)))
+
+    specs = build_worker_specs(parse_devices("cuda:0, cuda:1"), cpu_workers=2)
+
+    assert [spec.name for spec in specs] == ["cuda:0", "cuda:1", "cpu-0", "cpu-1"]
+    assert specs[0].num_threads is None
+    assert specs[2].cpu_affinity == (0, 1, 2, 3)
+    assert specs[3].cpu_affinity == (4, 5, 6, 7)
+    assert specs[3].num_threads == 4
+
+
+def test_specs_require_device():
+    with pytest.raises(ValueError):
+        build_worker_specs([], cpu_workers=0)
+
+
+def test_dead_process_is_restarted_after_delay(monkeypatch):
+    specs = build_worker_specs(["cuda:0"])
+    worker_supervisor = WorkerSupervisor(specs, restart_delay=0)
+    started = []
+    monkeypatch.setattr(worker_supervisor, "_start", lambda spec: started.append(spec.name))
+
+    worker_supervisor._processes["cuda:0"] = FakeProcess(alive=True)
+    worker_supervisor.check()
+    assert started == []
+
+    worker_supervisor._processes["cuda:0"] = FakeProcess(alive=False, exitcode=-9)
+    worker_supervisor.check()
+    assert started == ["cuda:0"]
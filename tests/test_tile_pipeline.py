@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+import torch
+from model.tile_pipeline import TilePipeline
+
+
+def test_pipeline_processes_every_chunk_in_order():
+    pipeline = TilePipeline(torch.device("cpu"))
+    stored = {}
+    compute_threads = set()
+
+    def compute(input_batch):
+        compute_threads.add(threading.get_ident())
+        return input_batch * 2
+
+    chunks = list(range(6))
+    pipeline.run(
+        chunks,
+        lambda chunk: torch.full((1, 3, 4, 4), float(chunk)),
+        compute,
+        lambda chunk, output_batch: stored.__setitem__(chunk, output_batch),
+    )
+    pipeline.shutdown()
+
+    assert sorted(stored) == chunks
+    for chunk, output_batch in stored.items():
+        assert torch.equal(output_batch, torch.full((1, 3, 4, 4), 2.0 * chunk))
+    # модель вызывается только из вызывающего потока
+    assert compute_threads == {threading.get_ident()}
+
+
+def test_compute_error_is_not_replaced_by_pending_load_error():
+    pipeline = TilePipeline(torch.device("cpu"))
+
+    def load(chunk):
+        if chunk == 1:
+            raise ValueError("load failed")
+        return torch.zeros(1, 3, 4, 4)
+
+    def compute(input_batch):
+        raise RuntimeError("compute failed")
+
+    with pytest.raises(RuntimeError, match="compute failed"):
+        pipeline.run([0, 1, 2], load, compute, lambda chunk, output_batch: None)
+    pipeline.shutdown()
+
+
+def test_store_error_is_raised():
+    pipeline = TilePipeline(torch.device("cpu"))
+
+    def store(chunk, output_batch):
+        raise ValueError("store failed")
+
+    with pytest.raises(ValueError, match="store failed"):
+        pipeline.run([0], lambda chunk: torch.zeros(1), lambda batch: batch, store)
+    pipeline.shutdown()
@@ -0,0 +1,28 @@
+import pytest
+import torch
+from model.weights import convert_to_safetensors, load_weights
+
+pytest.importorskip("safetensors")
+
+
+def test_safetensors_weights_match_checkpoint(tmp_path, small_model):
+    torch.manual_seed(0)
+    source = small_model()
+    model_path = str(tmp_path / "model.pth")
+    torch.save({"params_ema": source.state_dict()}, model_path)
+
+    converted_path = convert_to_safetensors(model_path)
+    model = small_model()
+    mapped = load_weights(model, converted_path)
+
+    assert mapped
+    for name, tensor in source.state_dict().items():
+        assert torch.equal(model.state_dict()[name], tensor)
+
+
+def test_checkpoint_weights_are_copied(tmp_path, small_model):
+    source = small_model()
+    model_path = str(tmp_path / "model.pth")
+    torch.save({"params": source.state_dict()}, model_path)
+
+    assert not load_weights(small_model(), model_path)
@@ -5,6 +5,7 @@ import argparse
 from worker.config import get_config
 from worker.utils import setup_logging
 from worker.main import main
+from worker.supervisor import WorkerSupervisor, build_worker_specs, parse_devices
 
 config = get_config()
 setup_logging(config)
@@ -19,9 +20,68 @@ if __name__ == "__main__":
         default=None,
         help="Устройство для использования (например, 'cuda:0'). Если не указано, используется значение по умолчанию."
     )
+    parser.add_argument(
+        "--executor",
+        choices=["thread", "process"],
+        default=None,
+        help="Тип пула для инференса. Если не указано, берётся INFERENCE_EXECUTOR из конфигурации."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Число параллельных задач инференса. Если не указано, берётся INFERENCE_WORKERS."
+    )
+    parser.add_argument(
+        "--precision",
+        choices=["fp32", "fp16", "bf16", "autocast", "int8"],
+        default=None,
+        help="Точность инференса. Если не указано, берётся PRECISION из конфигурации."
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["eager", "compile", "torchscript", "onnx"],
+        default=None,
+        help="Бэкенд инференса. Если не указано, берётся INFERENCE_BACKEND из конфигурации."
+    )
+    parser.add_argument(
+        "--devices",
+        type=str,
+        default=config.WORKER_DEVICES,
+        help=(
+            "Список устройств через запятую (например, 'cuda:0,cuda:1'): "
+            "по процессу на устройство."
+        ),
+    )
+    parser.add_argument(
+        "--cpu-workers",
+        type=int,
+        default=config.CPU_WORKERS,
+        help="Число CPU-процессов; ядра и потоки torch делятся между ними поровну."
+    )
     args = parser.parse_args()
     try:
-        asyncio.run(main(device=args.device))
+        if args.devices or args.cpu_workers:
+            specs = build_worker_specs(parse_devices(args.devices or ""), args.cpu_workers)
+            WorkerSupervisor(
+                specs,
+                options={
+                    "executor_kind": args.executor,
+                    "workers": args.workers,
+                    "precision": args.precision,
+                    "backend": args.backend,
+                },
+            ).run()
+        else:
+            asyncio.run(
+                main(
+                    device=args.device,
+                    executor_kind=args.executor,
+                    workers=args.workers,
+                    precision=args.precision,
+                    backend=args.backend,
+                ),
+            )
     except KeyboardInterrupt:
         logger.info("Сервис обработки изображений остановлен.")
     except Exception as e:
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+
+import cv2
+import numpy as np
+import torch
+
+from worker.encoding import EncodeOptions, encode_image
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    """
+    Динамический батчинг тайлов из нескольких одновременно обрабатываемых сообщений.
+
+    Каждое изображение разбивается на тайлы со стороной tile_size или меньше, если
+    так требует план тайлинга менеджера памяти модели. Тайлы одинаковой формы от
+    разных запросов накапливаются не дольше max_latency_ms (или пока батч помещается
+    в память, но не больше max_batch_size штук) и проходят через RRDBNet одним прямым
+    проходом, после чего каждый результат возвращается своему запросу.
+    """
+
+    def __init__(self, executor, max_batch_size=8, max_latency_ms=20, tile_size=256):
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self.tile_size = tile_size
+        self._pending: dict[tuple, list] = {}
+        self._timers: dict[tuple, asyncio.TimerHandle] = {}
+        self._limits: dict[tuple, int] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def model(self):
+        return self.executor.model
+
+    async def submit(self, tile_input):
+        """
+        Ставит тайл в очередь на батчинг и ждёт результат его инференса.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = tuple(tile_input.shape[1:])
+
+        group = self._pending.setdefault(key, [])
+        if not group:
+            self._limits[key] = self._batch_limit(key)
+        group.append((tile_input, future))
+        if len(group) >= self._limits[key]:
+            self._flush(key)
+        elif len(group) == 1:
+            self._timers[key] = loop.call_later(self.max_latency, self._flush, key)
+
+        return await future
+
+    def _batch_limit(self, key):
+        """
+        Сколько тайлов формы key можно объединить в один батч.
+        """
+        memory_manager = self.model.memory_manager
+        if memory_manager is None:
+            return self.max_batch_size
+        # батчи исполняются в пуле параллельно, бюджет памяти делится между ними
+        workers = max(1, self.executor.workers)
+        _, height, width = key
+        batch_size = memory_manager.calculate_batch_size(
+            height,
+            width,
+            max_batch_size=self.max_batch_size * workers,
+        )
+        return max(1, batch_size // workers)
+
+    def _flush(self, key):
+        group = self._pending.pop(key, None)
+        self._limits.pop(key, None)
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        if not group:
+            return
+
+        task = asyncio.create_task(self._run_batch(group))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _forward(self, inputs):
+        return self.model.forward(torch.cat(inputs, dim=0))
+
+    async def _run_batch(self, group):
+        inputs = [tile_input for tile_input, _ in group]
+        logger.debug(f"Запуск батча из {len(inputs)} тайлов формы {tuple(inputs[0].shape)}")
+        try:
+            outputs = await self.executor.call(self._forward, inputs)
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for index, (_, future) in enumerate(group):
+            if not future.done():
+                future.set_result(outputs[index : index + 1])
+
+    def _tile_size(self, height, width):
+        """
+        Сторона тайла: tile_size, но не больше тайла из плана менеджера памяти.
+        """
+        memory_manager = self.model.memory_manager
+        if memory_manager is None:
+            return self.tile_size
+        plan = memory_manager.plan_tiles(
+            height,
+            width,
+            self.model.tile_pad,
+            max_batch_size=self.max_batch_size,
+        )
+        if not plan.tiled:
+            return self.tile_size
+        return min(self.tile_size, plan.tile_size)
+
+    def _prepare(self, image_bytes):
+        np_image = np.frombuffer(image_bytes, np.uint8)
+        img = cv2.imdecode(np_image, cv2.IMREAD_COLOR)
+
+        if img is None:
+            logger.error("Ошибка: не удалось декодировать изображение.")
+            raise ValueError("Не удалось декодировать изображение.")
+
+        ctx = self.model.prepare_image(img)
+        if self.model.use_streaming(ctx):
+            return ctx, None, None
+        _, _, height, width = ctx.img.shape
+        tiles = self.model.split_tiles(height, width, self._tile_size(height, width))
+        return ctx, tiles, self.model.tile_inputs(ctx, tiles)
+
+    def _stream(self, ctx, encoding):
+        try:
+            processed_image = self.model.stream_process(ctx)
+        finally:
+            self.model.release(ctx)
+        return encode_image(processed_image, encoding)
+
+    def _finalize(self, ctx, tiles, output_tiles, encoding):
+        try:
+            self.model.merge_tiles(ctx, tiles, output_tiles)
+            processed_image = self.model.finalize_image(ctx)
+        finally:
+            self.model.release(ctx)
+        return encode_image(processed_image, encoding)
+
+    async def process(self, image_bytes, encoding=None):
+        """
+        Обрабатывает изображение: декодирование и сборка результата выполняются
+        в пуле исполнителя, инференс тайлов — общими батчами.
+        """
+        encoding = encoding or EncodeOptions()
+        ctx, tiles, tile_inputs = await self.executor.call(self._prepare, image_bytes)
+        if tiles is None:
+            # большие изображения обрабатываются потоково, без общих батчей
+            return await self.executor.call(self._stream, ctx, encoding)
+        # ждём все тайлы даже после ошибки: до этого буфер входа нельзя вернуть в пул
+        output_tiles = await asyncio.gather(
+            *(self.submit(tile) for tile in tile_inputs),
+            return_exceptions=True,
+        )
+        errors = [output for output in output_tiles if isinstance(output, BaseException)]
+        if errors:
+            self.model.release(ctx)
+            raise errors[0]
+        return await self.executor.call(self._finalize, ctx, tiles, output_tiles, encoding)
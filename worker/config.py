@@ -1,6 +1,6 @@
 import os
 from functools import lru_cache
-from typing import final
+from typing import Literal, final
 
 from pydantic import AmqpDsn, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -27,6 +27,131 @@ class Config(BaseSettings):
     QUEUE_PROCESS_IMAGE: str = Field(default="process_image_queue")
     QUEUE_RESULT: str = Field(default="result_queue")
 
+    # Claim check: тела сообщений больше BLOB_THRESHOLD_KB кладутся в хранилище,
+    # в RabbitMQ передаётся только ссылка (заголовок blob_ref).
+    # none - выключено; local - общий для бота и воркера каталог; s3 - S3-совместимое хранилище
+    BLOB_STORE: Literal["none", "local", "s3"] = "none"
+    BLOB_THRESHOLD_KB: int = 256
+    BLOB_DIR: str = "blobs"
+    # Время жизни объектов: потерянные ссылки удаляет периодическая очистка бота
+    BLOB_TTL_HOURS: float = 24.0
+    S3_ENDPOINT_URL: str | None = None
+    S3_BUCKET: str = "ultrares"
+    S3_ACCESS_KEY: str | None = None
+    S3_SECRET_KEY: str | None = None
+    S3_REGION: str | None = None
+    S3_PREFIX: str = "blobs/"
+
+    # Model
+    MODEL_PATH: str = "model/RealESRGAN_x4plus.pth"
+
+    # Кэш результатов по содержимому изображения
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_DIR: str = "cache/results"
+    RESULT_CACHE_MAX_MB: int = 1024
+
+    # Кодирование результата (значения по умолчанию; в сообщении можно передать
+    # options: output_format, quality, chroma_subsampling, progressive, optimize)
+    # auto - JPEG или WebP, что уложится в OUTPUT_MAX_MB
+    OUTPUT_FORMAT: Literal["auto", "jpeg", "webp", "avif", "png"] = "auto"
+    OUTPUT_QUALITY: int = 90
+    OUTPUT_CHROMA_SUBSAMPLING: Literal["411", "420", "422", "444"] = "420"
+    OUTPUT_PROGRESSIVE: bool = True
+    OUTPUT_OPTIMIZE: bool = True
+    # Лимит send_photo в Telegram - 10 МБ; больше - снижаем качество до OUTPUT_MIN_QUALITY,
+    # если не помогло, бот отправит результат документом
+    OUTPUT_MAX_MB: float | None = 10.0
+    OUTPUT_MIN_QUALITY: int = 60
+
+    # Точность инференса: fp32 | fp16 (CUDA) | bf16 (CPU/CUDA) | autocast | int8 (CPU)
+    PRECISION: Literal["fp32", "fp16", "bf16", "autocast", "int8"] = "fp32"
+    # Каталог с примерами изображений для калибровки int8 и проверки точности
+    PRECISION_SAMPLES_DIR: str | None = None
+    # Проверка точности против fp32 при старте; при PSNR ниже порога - откат на fp32
+    PRECISION_CHECK: bool = True
+    PRECISION_MIN_PSNR: float = 40.0
+
+    # Бэкенд инференса: eager | compile | torchscript | onnx
+    # (для torchscript/onnx нужен экспорт: python -m model.export --backend ...)
+    INFERENCE_BACKEND: Literal["eager", "compile", "torchscript", "onnx"] = "eager"
+
+    # Потоковая обработка больших изображений полосами тайлов сразу в uint8-буфер;
+    # при заданном STREAMING_BUFFER_DIR буфер результата отображается во временный файл
+    STREAMING_MIN_MEGAPIXELS: float | None = 4.0
+    STREAMING_TILE_SIZE: int = 512
+    STREAMING_BUFFER_DIR: str | None = None
+
+    # Контекст вокруг каждого тайла и режим склейки тайлов:
+    # None - контекст отбрасывается; linear/cosine - плавное смешивание соседних тайлов
+    # в зоне перекрытия (подбор TILE_PAD: python -m model.seams)
+    TILE_PAD: int = 10
+    TILE_BLEND: Literal["linear", "cosine"] | None = None
+
+    # Потоки конвейера тайлов: подготовка следующего тайла и копирование результата
+    # параллельно с инференсом текущего (0 - последовательная обработка)
+    TILE_PIPELINE_WORKERS: int = 2
+
+    # Калибровка модели стоимости памяти при старте воркера
+    MEMORY_CALIBRATION: bool = False
+    MEMORY_CALIBRATION_CACHE: str = "model/memory_calibration.json"
+
+    # Inference executor
+    # thread  - один экземпляр модели на процесс, задачи выполняются в пуле потоков
+    # process - отдельный процесс (и своя копия модели) на каждую задачу пула
+    INFERENCE_EXECUTOR: Literal["thread", "process"] = "thread"
+    INFERENCE_WORKERS: int = 2
+    PREFETCH_COUNT: int = 2
+
+    # Честное разделение воркера между пользователями: сообщения выбираются из
+    # FAIR_QUEUE_SIZE дополнительно полученных по кругу по chat_id, внутри одного
+    # пользователя - сначала меньшие изображения (заголовок pixels). Буфер держится
+    # небольшим: полученные сообщения не достанутся соседним воркерам
+    FAIR_SCHEDULING: bool = True
+    FAIR_QUEUE_SIZE: int = 3
+    # Приоритеты RabbitMQ в очереди обработки (x-max-priority, 0 - выключены);
+    # значение должно совпадать с настройкой бота, очередь с другим значением
+    # придётся пересоздать
+    QUEUE_MAX_PRIORITY: int = 0
+    # Маршрутизация по размеру: бот отправляет задачи в <QUEUE_PROCESS_IMAGE>.small
+    # и <QUEUE_PROCESS_IMAGE>.large, воркер читает очереди из WORKER_SIZE_CLASSES.
+    # SIZE_CLASS_SETTINGS переопределяет для класса PREFETCH_COUNT, FAIR_QUEUE_SIZE
+    # и настройки батчинга (JSON в переменной окружения)
+    SIZE_ROUTING: bool = False
+    WORKER_SIZE_CLASSES: str = "small,large"
+    SIZE_CLASS_SETTINGS: dict[str, dict] = {
+        # маленьким изображениям - короткое ожидание батча и мелкие тайлы
+        "small": {"PREFETCH_COUNT": 4, "BATCH_MAX_LATENCY_MS": 5, "BATCH_TILE_SIZE": 128},
+        # большие идут по одному через тайлинг по бюджету памяти и потоковую обработку
+        # и без буфера честной очереди, чтобы не забирать их у соседних воркеров
+        "large": {"PREFETCH_COUNT": 1, "FAIR_QUEUE_SIZE": 0, "BATCHING_ENABLED": False},
+    }
+
+    # Ограничение длины очереди обработки (x-max-length, 0 - без ограничения);
+    # reject-publish - бот получает отказ и сообщает пользователю о перегрузке.
+    # Бот объявляет те же очереди, значения должны совпадать с настройкой бота
+    QUEUE_MAX_LENGTH: int = 0
+    QUEUE_OVERFLOW: Literal["reject-publish", "reject-publish-dlx", "drop-head"] = (
+        "reject-publish"
+    )
+
+    # Публикация статистики загрузки (глубина очереди, p50/p95 времени задачи,
+    # пропускная способность) в fanout-обменник для бота; 0 - выключено
+    STATS_EXCHANGE: str = "worker_stats"
+    STATS_INTERVAL: float = 10.0
+
+    # Режим супервизора: по процессу-потребителю на каждое устройство
+    # WORKER_DEVICES - список через запятую, например "cuda:0,cuda:1"
+    # CPU_WORKERS - число CPU-процессов, ядра делятся между ними поровну
+    WORKER_DEVICES: str | None = None
+    CPU_WORKERS: int = 0
+    SUPERVISOR_RESTART_DELAY: float = 5.0
+
+    # Dynamic batching (только для INFERENCE_EXECUTOR=thread)
+    BATCHING_ENABLED: bool = True
+    BATCH_MAX_SIZE: int = 8
+    BATCH_MAX_LATENCY_MS: int = 20
+    BATCH_TILE_SIZE: int = 256
+
     @property
     def RABBITMQ_DSN(self) -> AmqpDsn:
         return AmqpDsn(f"amqp://"
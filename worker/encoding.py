@@ -0,0 +1,222 @@
+import logging
+from dataclasses import asdict, dataclass, replace
+
+import cv2
+
+from shared.image_header import read_image_size
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ("auto", "jpeg", "webp", "avif", "png")
+
+# Ограничения Telegram для send_photo: 10 МБ, сумма сторон не больше 10000
+# и отношение сторон не больше 20
+TELEGRAM_PHOTO_MAX_BYTES = 10 * 1024 * 1024
+TELEGRAM_PHOTO_MAX_DIMENSIONS = 10000
+TELEGRAM_PHOTO_MAX_RATIO = 20
+# Максимальный размер стороны изображения WebP
+WEBP_MAX_SIDE = 16383
+
+_EXTENSIONS = {"jpeg": ".jpg", "webp": ".webp", "avif": ".avif", "png": ".png"}
+# Форматы, которые Telegram показывает как фотографию
+PHOTO_FORMATS = ("jpeg", "png", "webp")
+
+_JPEG_SAMPLING = {
+    "411": "IMWRITE_JPEG_SAMPLING_FACTOR_411",
+    "420": "IMWRITE_JPEG_SAMPLING_FACTOR_420",
+    "422": "IMWRITE_JPEG_SAMPLING_FACTOR_422",
+    "444": "IMWRITE_JPEG_SAMPLING_FACTOR_444",
+}
+
+# Ключи параметров кодирования в options сообщения
+_OPTION_KEYS = {
+    "output_format": "format",
+    "quality": "quality",
+    "chroma_subsampling": "chroma_subsampling",
+    "progressive": "progressive",
+    "optimize": "optimize",
+}
+
+
+@dataclass(frozen=True)
+class EncodeOptions:
+    """Параметры кодирования результата."""
+
+    format: str = "auto"
+    quality: int = 90
+    chroma_subsampling: str = "420"
+    progressive: bool = True
+    optimize: bool = True
+    # Размер, в который нужно уложить результат снижением качества (None - без ограничения)
+    max_bytes: int | None = TELEGRAM_PHOTO_MAX_BYTES
+    min_quality: int = 60
+
+
+@dataclass
+class EncodedImage:
+    """Закодированный результат и способ его доставки в Telegram."""
+
+    data: bytes
+    format: str
+    as_document: bool = False
+
+    @property
+    def content_type(self) -> str:
+        return f"image/{self.format}"
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "EncodedImage":
+        """
+        Восстанавливает описание результата из кэша по сигнатуре формата и размерам
+        из заголовка изображения.
+        """
+        image_format = detect_format(data)
+        size = read_image_size(data)
+        if size is not None:
+            width, height = size
+            size_fits = fits_photo(height, width)
+        else:
+            size_fits = False
+        as_document = (
+            len(data) > TELEGRAM_PHOTO_MAX_BYTES
+            or image_format not in PHOTO_FORMATS
+            or not size_fits
+        )
+        return cls(data=data, format=image_format, as_document=as_document)
+
+
+def detect_format(data: bytes) -> str:
+    """Определяет формат изображения по первым байтам."""
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[4:12] in (b"ftypavif", b"ftypavis"):
+        return "avif"
+    return "jpeg"
+
+
+def resolve_options(defaults: EncodeOptions, options: dict | None) -> EncodeOptions:
+    """
+    Накладывает параметры кодирования из options сообщения на значения по умолчанию.
+    """
+    overrides = {}
+    for key, field_name in _OPTION_KEYS.items():
+        if options and key in options:
+            overrides[field_name] = options[key]
+    if not overrides:
+        return defaults
+
+    resolved = replace(defaults, **overrides)
+    if resolved.format not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Неизвестный формат {resolved.format}, ожидается один из {OUTPUT_FORMATS}",
+        )
+    if resolved.chroma_subsampling not in _JPEG_SAMPLING:
+        raise ValueError(f"Неизвестная субдискретизация {resolved.chroma_subsampling}")
+    return replace(resolved, quality=max(1, min(int(resolved.quality), 100)))
+
+
+def cache_parts(options: EncodeOptions) -> dict:
+    """Параметры кодирования для ключа кэша результатов."""
+    return asdict(options)
+
+
+def fits_photo(height: int, width: int) -> bool:
+    """Примет ли Telegram изображение таких размеров как фотографию."""
+    return (
+        height + width <= TELEGRAM_PHOTO_MAX_DIMENSIONS
+        and max(height, width) <= TELEGRAM_PHOTO_MAX_RATIO * min(height, width)
+    )
+
+
+def _params(image_format, quality, options):
+    if image_format == "jpeg":
+        params = [
+            cv2.IMWRITE_JPEG_QUALITY, quality,
+            cv2.IMWRITE_JPEG_PROGRESSIVE, int(options.progressive),
+            cv2.IMWRITE_JPEG_OPTIMIZE, int(options.optimize),
+        ]
+        sampling = getattr(cv2, _JPEG_SAMPLING[options.chroma_subsampling], None)
+        if sampling is not None:
+            params += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, sampling]
+        return params
+    if image_format == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    if image_format == "avif":
+        return [cv2.IMWRITE_AVIF_QUALITY, quality]
+    # PNG без потерь: optimize выбирает максимальное сжатие
+    return [cv2.IMWRITE_PNG_COMPRESSION, 9 if options.optimize else 3]
+
+
+def _supported(image_format, img):
+    if image_format == "webp":
+        return max(img.shape[:2]) <= WEBP_MAX_SIDE
+    if image_format == "avif":
+        return hasattr(cv2, "IMWRITE_AVIF_QUALITY") and cv2.haveImageWriter(".avif")
+    return True
+
+
+def _encode(img, image_format, quality, options):
+    params = _params(image_format, quality, options)
+    ok, encoded = cv2.imencode(_EXTENSIONS[image_format], img, params)
+    if not ok:
+        raise ValueError(f"Не удалось закодировать изображение в {image_format}")
+    return encoded
+
+
+def _encode_fitted(img, image_format, options):
+    """Кодирует изображение, снижая качество, пока результат не уложится в max_bytes."""
+    quality = options.quality
+    encoded = _encode(img, image_format, quality, options)
+    if image_format == "png" or not options.max_bytes:
+        return encoded, quality
+    while encoded.nbytes > options.max_bytes and quality > options.min_quality:
+        quality = max(quality - 10, options.min_quality)
+        encoded = _encode(img, image_format, quality, options)
+    return encoded, quality
+
+
+def encode_image(img, options: EncodeOptions) -> EncodedImage:
+    """
+    Кодирует изображение с заданными параметрами.
+
+    Для форматов с потерями качество снижается до min_quality, пока результат
+    не уложится в max_bytes. В режиме "auto" сначала пробуется JPEG, затем WebP;
+    для изображений, которые Telegram не примет как фото по размерам, — наоборот.
+    Результат, не проходящий ограничения send_photo, помечается для отправки
+    документом.
+    """
+    if options.format != "auto":
+        candidates = [options.format]
+    elif fits_photo(*img.shape[:2]):
+        candidates = ["jpeg", "webp"]
+    else:
+        candidates = ["webp", "jpeg"]
+    candidates = [image_format for image_format in candidates if _supported(image_format, img)]
+    if not candidates:
+        logger.warning(
+            f"Формат {options.format} недоступен для этого изображения, используется JPEG.",
+        )
+        candidates = ["jpeg"]
+
+    best = None
+    for image_format in candidates:
+        encoded, quality = _encode_fitted(img, image_format, options)
+        if best is None or encoded.nbytes < best[0].nbytes:
+            best = encoded, quality, image_format
+        if not options.max_bytes or encoded.nbytes <= options.max_bytes:
+            break
+
+    encoded, quality, image_format = best
+    if quality != options.quality:
+        logger.info(f"Качество {image_format} снижено до {quality}: {encoded.nbytes} байт")
+
+    as_document = (
+        encoded.nbytes > TELEGRAM_PHOTO_MAX_BYTES
+        or not fits_photo(*img.shape[:2])
+        or image_format not in PHOTO_FORMATS
+    )
+    return EncodedImage(data=encoded.tobytes(), format=image_format, as_document=as_document)
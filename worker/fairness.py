@@ -0,0 +1,110 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class FairQueue:
+    """
+    Очередь задач с честным разделением между пользователями.
+
+    У каждого chat_id своя подочередь; задачи выдаются по кругу - по одной от
+    каждого пользователя, у которого есть ожидающие задачи. Внутри подочереди
+    первыми идут задачи с наименьшей стоимостью (числом пикселей), при равной
+    стоимости - в порядке поступления. Так альбом из 50 фотографий одного
+    пользователя не задерживает остальных, а маленькие изображения пользователя
+    не ждут его же большие.
+    """
+
+    def __init__(self):
+        self._queues: dict = {}
+        self._order: deque = deque()
+        self._counter = itertools.count()
+        self._size = 0
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return self._size
+
+    def put(self, key, cost, item) -> None:
+        """
+        Добавляет задачу пользователя key со стоимостью cost.
+        """
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = []
+            self._order.append(key)
+        heapq.heappush(queue, (cost, next(self._counter), item))
+        self._size += 1
+        self._ready.set()
+
+    def get_nowait(self):
+        """
+        Возвращает следующую задачу; IndexError, если очередь пуста.
+        """
+        if not self._order:
+            raise IndexError("Очередь пуста")
+
+        key = self._order.popleft()
+        queue = self._queues[key]
+        _, _, item = heapq.heappop(queue)
+        if queue:
+            self._order.append(key)
+        else:
+            del self._queues[key]
+
+        self._size -= 1
+        if not self._size:
+            self._ready.clear()
+        return item
+
+    async def get(self):
+        """
+        Ждёт и возвращает следующую задачу.
+        """
+        while not self._size:
+            await self._ready.wait()
+        return self.get_nowait()
+
+
+# Стоимость задачи неизвестного размера: такие задачи идут после измеренных
+UNKNOWN_COST = float("inf")
+
+
+def job_pixels(message) -> int:
+    """
+    Число пикселей изображения из заголовка pixels; 0, если размер неизвестен.
+    """
+    headers = message.headers or {}
+    return int(headers.get("pixels") or 0)
+
+
+def job_priority_key(message) -> tuple:
+    """
+    Пользователь и стоимость задачи по заголовкам сообщения, без разбора тела.
+
+    Сообщения без заголовков (протокол версии 1) попадают в общую подочередь.
+    Размер задачи без pixels неизвестен, поэтому она считается самой дорогой
+    и не обгоняет измеренные задачи пользователя.
+    """
+    headers = message.headers or {}
+    return headers.get("chat_id"), job_pixels(message) or UNKNOWN_COST
+
+
+async def dispatch(fair_queue: FairQueue, handler, workers: int) -> None:
+    """
+    Запускает workers обработчиков, которые берут задачи из fair_queue.
+    """
+
+    async def worker():
+        while True:
+            message = await fair_queue.get()
+            try:
+                await handler(message)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика задачи: {e}", exc_info=True)
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
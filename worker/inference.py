@@ -0,0 +1,264 @@
+import asyncio
+import glob
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from model import RESRGANinf, RRDBNet
+from model.precision import precision_report
+from model.weights import safetensors_path
+
+from worker.config import get_config
+from worker.encoding import EncodeOptions, encode_image
+
+config = get_config()
+logger = logging.getLogger(__name__)
+
+MODEL_SCALE = 4
+
+# Модель процесса-исполнителя (используется только в режиме "process")
+_process_model = None
+
+
+def load_sample_images(directory):
+    """
+    Загружает примеры изображений для калибровки int8 и проверки точности.
+    """
+    if not directory:
+        return None
+    images = []
+    for path in sorted(glob.glob(os.path.join(directory, "*"))):
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is not None:
+            images.append(img)
+    logger.info(f"Загружено {len(images)} примеров изображений из {directory}")
+    return images or None
+
+
+def resolve_model_path():
+    """
+    Путь к весам: предпочитаем сконвертированный *.safetensors (загрузка через mmap),
+    если он лежит рядом с MODEL_PATH.
+    """
+    converted_path = safetensors_path(config.MODEL_PATH)
+    if os.path.exists(converted_path):
+        return converted_path
+    return config.MODEL_PATH
+
+
+def streaming_min_pixels():
+    if config.STREAMING_MIN_MEGAPIXELS is None:
+        return None
+    return int(config.STREAMING_MIN_MEGAPIXELS * 1_000_000)
+
+
+def _create_model(device, precision, sample_images=None, backend="eager"):
+    model = RRDBNet(
+        num_in_ch=3,
+        num_out_ch=3,
+        num_feat=64,
+        num_block=23,
+        num_grow_ch=32,
+        scale=MODEL_SCALE,
+    )
+    return RESRGANinf(
+        scale=MODEL_SCALE,
+        model=model,
+        model_path=resolve_model_path(),
+        device=device,
+        calc_tiles=True,
+        tile_pad=config.TILE_PAD,
+        pad=10,
+        calibrate=config.MEMORY_CALIBRATION,
+        calibration_cache=config.MEMORY_CALIBRATION_CACHE,
+        precision=precision,
+        calibration_images=sample_images,
+        backend=backend,
+        stream_min_pixels=streaming_min_pixels(),
+        stream_tile_size=config.STREAMING_TILE_SIZE,
+        stream_buffer_dir=config.STREAMING_BUFFER_DIR,
+        pipeline_workers=config.TILE_PIPELINE_WORKERS,
+        tile_blend=config.TILE_BLEND,
+    )
+
+
+def build_model(device=None, precision="fp32", backend="eager"):
+    """
+    Синхронно создаёт и загружает модель Real-ESRGAN.
+
+    Для пониженной точности (если включено PRECISION_CHECK) результат сравнивается
+    с fp32 по качеству (PSNR/SSIM) и скорости на примерах изображений;
+    при PSNR ниже порога используется fp32.
+    """
+    sample_images = load_sample_images(config.PRECISION_SAMPLES_DIR)
+    model = _create_model(device, precision, sample_images, backend)
+    if precision == "fp32" or not config.PRECISION_CHECK:
+        return model
+
+    reference = _create_model(device, "fp32")
+    report = precision_report(model, reference, sample_images)
+    del reference
+    if report["psnr"] < config.PRECISION_MIN_PSNR:
+        logger.error(
+            f"Точность {precision} недостаточна: PSNR {report['psnr']:.2f} дБ < "
+            f"{config.PRECISION_MIN_PSNR} дБ, используется fp32.",
+        )
+        return _create_model(device, "fp32", backend=backend)
+
+    logger.info(
+        f"Точность {precision} проверена: PSNR {report['psnr']:.2f} дБ, "
+        f"SSIM {report['ssim']:.4f}, ускорение x{report['speedup']:.2f}.",
+    )
+    return model
+
+
+def run_pipeline(image_bytes, model, encoding=None):
+    """
+    Декодирует изображение, увеличивает его разрешение и кодирует результат.
+
+    Args:
+        image_bytes (bytes): Байтовые данные изображения.
+        model (RESRGANinf): Объект модели для обработки.
+        encoding (EncodeOptions | None): Параметры кодирования результата.
+
+    Returns:
+        EncodedImage: Закодированное обработанное изображение.
+    """
+    np_image = np.frombuffer(image_bytes, np.uint8)
+    img = cv2.imdecode(np_image, cv2.IMREAD_COLOR)
+
+    if img is None:
+        logger.error("Ошибка: не удалось декодировать изображение.")
+        raise ValueError("Не удалось декодировать изображение.")
+
+    logger.info("Обработка изображения с помощью модели...")
+    processed_image, _ = model.upgrade_resolution(img)
+
+    return encode_image(processed_image, encoding or EncodeOptions())
+
+
+def build_warm_model(device=None, precision="fp32", backend="eager"):
+    """
+    Загружает модель и выполняет прогревочный прямой проход.
+    """
+    model = build_model(device, precision, backend)
+    model.warmup()
+    return model
+
+
+def _init_process(device, precision, backend):
+    """
+    Инициализатор процесса пула: загружает собственную копию модели и прогревает её.
+    """
+    global _process_model
+    _process_model = build_warm_model(device, precision, backend)
+
+
+def _process_ready():
+    """
+    Пробный вызов в процессе пула: pid и точность, с которой загружена его модель.
+    """
+    return os.getpid(), _process_model.precision
+
+
+def _run_in_process(image_bytes, encoding):
+    return run_pipeline(image_bytes, _process_model, encoding)
+
+
+class InferenceExecutor:
+    """
+    Пул, выполняющий декодирование → инференс → кодирование вне event loop.
+
+    В режиме "thread" все потоки параллельно используют одну загруженную модель
+    (RESRGANinf реентерабелен), в режиме "process" каждый процесс пула загружает
+    свою копию модели.
+    """
+
+    def __init__(self, kind="thread", workers=1, device=None, precision="fp32", backend="eager"):
+        self.kind = kind
+        self.workers = workers
+        self.device = device
+        self.precision = precision
+        self.backend = backend
+        self.model = None
+        self._executor: Executor | None = None
+
+    async def start(self):
+        """
+        Запускает пул и дожидается загрузки и прогрева модели.
+        """
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        if self.kind == "thread":
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="inference",
+            )
+            self.model = await loop.run_in_executor(
+                self._executor, build_warm_model, self.device, self.precision, self.backend,
+            )
+            # Проверка точности могла откатить модель на fp32
+            self.precision = self.model.precision
+        elif self.kind == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process,
+                initargs=(self.device, self.precision, self.backend),
+            )
+            # Процессы создаются при отправке задач; ждём, пока они загрузят модели
+            ready = await asyncio.gather(
+                *(
+                    loop.run_in_executor(self._executor, _process_ready)
+                    for _ in range(self.workers)
+                ),
+            )
+            logger.info(f"Процессы инференса готовы: {sorted({pid for pid, _ in ready})}")
+            # Проверка точности могла откатить модели процессов на fp32
+            self.precision = self._effective_precision([precision for _, precision in ready])
+        else:
+            raise ValueError(f"Неизвестный тип исполнителя: {self.kind}")
+
+        logger.info(
+            f"Исполнитель инференса запущен за {time.perf_counter() - start:.2f}с: "
+            f"kind={self.kind}, workers={self.workers}, "
+            f"precision={self.precision}, backend={self.backend}",
+        )
+
+    def _effective_precision(self, precisions):
+        if len(set(precisions)) > 1:
+            # модели процессов должны совпадать, иначе результаты и ключи кэша разойдутся
+            raise RuntimeError(f"Процессы инференса загрузили модели разной точности: {precisions}")
+        return precisions[0]
+
+    async def run(self, image_bytes, encoding=None):
+        if self._executor is None:
+            raise RuntimeError("Исполнитель инференса не запущен.")
+
+        loop = asyncio.get_running_loop()
+        if self.kind == "thread":
+            return await loop.run_in_executor(
+                self._executor, run_pipeline, image_bytes, self.model, encoding,
+            )
+        return await loop.run_in_executor(
+            self._executor, _run_in_process, image_bytes, encoding,
+        )
+
+    async def call(self, func, *args):
+        """
+        Выполняет произвольную функцию в пуле потоков (только режим "thread").
+        """
+        if self._executor is None or self.kind != "thread":
+            raise RuntimeError("Вызов функций доступен только для запущенного пула потоков.")
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
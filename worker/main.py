@@ -1,13 +1,19 @@
 import asyncio
-import json
 import logging
+import time
 
 import aio_pika
-import cv2
-import numpy as np
-from model import RESRGANinf, RRDBNet
 
+from shared.blob_store import create_blob_store, offload_body, release_body, resolve_body
+from shared.result_cache import ResultCache
+from worker.batching import BatchScheduler
 from worker.config import get_config
+from worker.encoding import EncodedImage, EncodeOptions, cache_parts, resolve_options
+from worker.fairness import FairQueue, dispatch, job_pixels, job_priority_key
+from worker.inference import MODEL_SCALE, InferenceExecutor
+from worker.protocol import error_headers, parse_image_message, result_headers
+from worker.routing import class_settings, served_size_classes, size_class_queue
+from worker.stats import WorkerStats, publish_stats_periodically
 from worker.utils import setup_logging
 
 config = get_config()
@@ -15,64 +21,135 @@ setup_logging(config)
 logger = logging.getLogger(__name__)
 
 
-SEMAPHORE_LIMIT = 2
-semaphore = asyncio.Semaphore(SEMAPHORE_LIMIT)
-
-
-async def load_model(device=None):
+async def load_model(
+    device=None,
+    executor_kind=None,
+    workers=None,
+    precision=None,
+    backend=None,
+):
     """
-    Загружает модель для обработки изображений.
+    Загружает модель и запускает исполнитель инференса.
     """
     logger.info("Загрузка модели Real-ESRGAN...")
-    model = RRDBNet(
-        num_in_ch=3,
-        num_out_ch=3,
-        num_feat=64,
-        num_block=23,
-        num_grow_ch=32,
-        scale=4,
-    )
-    upsmpl = RESRGANinf(
-        scale=4,
-        model=model,
-        model_path="model/RealESRGAN_x4plus.pth",
+    executor = InferenceExecutor(
+        kind=executor_kind or config.INFERENCE_EXECUTOR,
+        workers=workers or config.INFERENCE_WORKERS,
         device=device,
-        calc_tiles=True,
-        tile_pad=10,
-        pad=10,
+        precision=precision or config.PRECISION,
+        backend=backend or config.INFERENCE_BACKEND,
     )
+    await executor.start()
     logger.info("Модель успешно загружена.")
-    return upsmpl
+    return executor
+
+
+def create_scheduler(executor, settings=None):
+    """
+    Создаёт планировщик динамического батчинга, если он включён и поддерживается.
+
+    settings - настройки батчинга класса размеров, по умолчанию из конфигурации.
+    """
+    settings = settings or config
+    if not settings.BATCHING_ENABLED:
+        return None
+    if executor.kind != "thread":
+        logger.warning("Динамический батчинг доступен только для INFERENCE_EXECUTOR=thread.")
+        return None
+
+    logger.info(
+        f"Динамический батчинг включён: max_batch_size={settings.BATCH_MAX_SIZE}, "
+        f"max_latency_ms={settings.BATCH_MAX_LATENCY_MS}, tile_size={settings.BATCH_TILE_SIZE}",
+    )
+    return BatchScheduler(
+        executor,
+        max_batch_size=settings.BATCH_MAX_SIZE,
+        max_latency_ms=settings.BATCH_MAX_LATENCY_MS,
+        tile_size=settings.BATCH_TILE_SIZE,
+    )
 
 
-async def process_image(image_bytes, model):
+async def process_image(image_bytes, executor, scheduler=None, encoding=None):
     """
     Обрабатывает изображение, увеличивая его разрешение.
 
+    Декодирование, инференс и кодирование выполняются в пуле исполнителя,
+    event loop остаётся свободным для работы с RabbitMQ.
+
     Args:
         image_bytes (bytes): Байтовые данные изображения.
-        model (RESRGANinf): Объект модели для обработки.
+        executor (InferenceExecutor): Исполнитель инференса.
+        scheduler (BatchScheduler | None): Планировщик батчинга между сообщениями.
+        encoding (EncodeOptions | None): Параметры кодирования результата.
 
     Returns:
-        bytes: Обработанное изображение в байтах.
+        EncodedImage: Закодированное обработанное изображение.
     """
     logger.info("Начало обработки изображения.")
+    if scheduler is not None:
+        processed_image = await scheduler.process(image_bytes, encoding)
+    else:
+        processed_image = await executor.run(image_bytes, encoding)
+    logger.info("Обработка изображения завершена.")
+    return processed_image
 
-    np_image = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(np_image, cv2.IMREAD_COLOR)
 
-    if img is None:
-        logger.error("Ошибка: не удалось декодировать изображение.")
-        raise ValueError("Не удалось декодировать изображение.")
+def default_encode_options():
+    """
+    Параметры кодирования результата из конфигурации.
+    """
+    max_bytes = None
+    if config.OUTPUT_MAX_MB:
+        max_bytes = int(config.OUTPUT_MAX_MB * 1024 * 1024)
+    return EncodeOptions(
+        format=config.OUTPUT_FORMAT,
+        quality=config.OUTPUT_QUALITY,
+        chroma_subsampling=config.OUTPUT_CHROMA_SUBSAMPLING,
+        progressive=config.OUTPUT_PROGRESSIVE,
+        optimize=config.OUTPUT_OPTIMIZE,
+        max_bytes=max_bytes,
+        min_quality=config.OUTPUT_MIN_QUALITY,
+    )
 
-    # Обработка изображения моделью
-    logger.info("Обработка изображения с помощью модели...")
-    processed_image, _ = model.upgrade_resolution(img)
 
-    # Кодируем обратно в JPEG
-    _, encoded_image = cv2.imencode(".jpg", processed_image)
-    logger.info("Обработка изображения завершена.")
-    return encoded_image.tobytes()
+def create_result_cache():
+    """
+    Создаёт кэш результатов, если он включён в конфигурации.
+    """
+    if not config.RESULT_CACHE_ENABLED:
+        return None
+    return ResultCache(
+        config.RESULT_CACHE_DIR,
+        max_size_bytes=config.RESULT_CACHE_MAX_MB * 1024 * 1024,
+    )
+
+
+def _cache_lookup(result_cache, job, precision, encoding):
+    key = result_cache.make_key(
+        job.image_bytes, config.MODEL_PATH, MODEL_SCALE, precision, job.options,
+        cache_parts(encoding),
+    )
+    return key, result_cache.get(key)
+
+
+async def process_job(job, executor, scheduler=None, result_cache=None):
+    """
+    Возвращает результат из кэша по содержимому изображения или обрабатывает его.
+    """
+    encoding = resolve_options(default_encode_options(), job.options)
+    if result_cache is None:
+        return await process_image(job.image_bytes, executor, scheduler, encoding)
+
+    key, cached = await asyncio.to_thread(
+        _cache_lookup, result_cache, job, executor.precision, encoding,
+    )
+    if cached is not None:
+        logger.info("Результат найден в кэше, инференс пропущен.")
+        return EncodedImage.from_bytes(cached)
+
+    processed_image = await process_image(job.image_bytes, executor, scheduler, encoding)
+    await asyncio.to_thread(result_cache.put, key, processed_image.data)
+    return processed_image
 
 
 async def publish_with_retry(publisher_channel, message, routing_key, retries=3):
@@ -95,43 +172,81 @@ async def publish_with_retry(publisher_channel, message, routing_key, retries=3)
                 raise
 
 
+async def publish_error(publisher_channel, output_queue_name, message, error):
+    """
+    Публикует вместо результата сообщение об ошибке обработки.
+
+    Сообщения без chat_id в заголовках (протокол версии 1) остаются без ответа.
+    """
+    chat_id = job_priority_key(message)[0]
+    if chat_id is None:
+        return
+    error_message = aio_pika.Message(
+        body=b"",
+        headers=error_headers(chat_id, str(error) or type(error).__name__),
+        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+    )
+    try:
+        await publish_with_retry(publisher_channel, error_message, output_queue_name)
+    except Exception as e:
+        logger.error(f"Не удалось сообщить об ошибке обработки: {e}")
+
+
 async def handle_message(
     message: aio_pika.IncomingMessage,
-    model,
+    executor,
     publisher_channel,
     output_queue_name,
+    semaphore,
+    scheduler=None,
+    result_cache=None,
+    blob_store=None,
+    stats=None,
 ):
     """
     Обрабатывает сообщение из очереди RabbitMQ.
 
     Args:
         message (aio_pika.IncomingMessage): Входящее сообщение из RabbitMQ.
-        model: Объект модели для обработки изображений.
+        executor (InferenceExecutor): Исполнитель инференса.
         publisher_channel: Постоянный канал для публикации результата.
         output_queue_name (str): Имя очереди для отправки результата.
+        semaphore (asyncio.Semaphore): Ограничение числа одновременно обрабатываемых задач.
+        scheduler (BatchScheduler | None): Планировщик батчинга между сообщениями.
+        result_cache (ResultCache | None): Кэш результатов по содержимому изображения.
+        blob_store: Хранилище больших тел сообщений (ссылки вместо байтов в RabbitMQ).
+        stats (WorkerStats | None): Статистика загрузки воркера.
     """
     async with semaphore:
+        stats = stats or WorkerStats()
+        stats.job_started()
+        started = time.perf_counter()
+        elapsed = None
         try:
             logger.info("Получено сообщение из очереди.")
-            # Декодируем сообщение
-            msg = json.loads(message.body)
-            image_hex = msg.get("image_data")
-
-            if not image_hex:
-                logger.error("Ошибка: получены пустые данные изображения.")
-                raise ValueError("Получены пустые данные изображения.")
-
-            # Декодируем байты изображения
-            image_bytes = bytes.fromhex(image_hex)
+            # Декодируем сообщение (поддерживаются обе версии протокола)
+            body = await asyncio.to_thread(
+                resolve_body, blob_store, message.headers, message.body,
+            )
+            job = parse_image_message(message, body)
 
             # Обработка изображения
             logger.info("Начинается обработка изображения...")
-            processed_image = await process_image(image_bytes, model)
-
-            # Создаём сообщение
+            processed_image = await process_job(job, executor, scheduler, result_cache)
+
+            # Создаём сообщение; большой результат уходит в хранилище
+            body, blob_headers = await asyncio.to_thread(
+                offload_body,
+                blob_store,
+                processed_image.data,
+                config.BLOB_THRESHOLD_KB * 1024,
+            )
+            headers = result_headers(job, processed_image.format, processed_image.as_document)
+            headers.update(blob_headers)
             message_to_publish = aio_pika.Message(
-                body=processed_image,
-                headers={"chat_id": msg["chat_id"]},
+                body=body,
+                headers=headers,
+                content_type=processed_image.content_type,
                 delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
             )
 
@@ -143,15 +258,119 @@ async def handle_message(
             )
 
             await message.ack()
+            elapsed = time.perf_counter() - started
             logger.info("Исходное сообщение подтверждено (ack).")
         except Exception as e:
             logger.error(f"Ошибка при обработке сообщения: {e}", exc_info=True)
+            await publish_error(publisher_channel, output_queue_name, message, e)
             await message.reject(
                 requeue=False,
             )
+        else:
+            # Сообщение уже подтверждено: сбой удаления объекта из хранилища
+            # не должен превращаться в ошибку доставленного результата
+            try:
+                await asyncio.to_thread(release_body, blob_store, message.headers)
+            except Exception as e:
+                logger.warning(f"Не удалось освободить тело сообщения: {e}")
+        finally:
+            stats.job_finished(elapsed, job_pixels(message))
+
+
+def queue_arguments():
+    """
+    Аргументы объявления очереди обработки (одинаковые для всех классов размеров).
+    """
+    arguments = {}
+    if config.QUEUE_MAX_PRIORITY:
+        arguments["x-max-priority"] = config.QUEUE_MAX_PRIORITY
+    if config.QUEUE_MAX_LENGTH:
+        # при переполнении брокер отклоняет публикацию, бот сообщает об этом
+        arguments["x-max-length"] = config.QUEUE_MAX_LENGTH
+        arguments["x-overflow"] = config.QUEUE_OVERFLOW
+    return arguments
+
+
+class QueueConsumer:
+    """
+    Потребитель одной очереди обработки со своими настройками.
+
+    При маршрутизации по размеру у каждого обслуживаемого класса своя очередь,
+    свой prefetch, своя честная очередь и свой планировщик батчинга; модель и
+    исполнитель инференса общие.
+    """
+
+    def __init__(self, executor, size_class, settings):
+        self.executor = executor
+        self.size_class = size_class
+        self.settings = settings
+        self.queue_name = size_class_queue(config.QUEUE_PROCESS_IMAGE, size_class)
+        self.scheduler = create_scheduler(executor, settings)
+        # Число сообщений в обработке; при батчинге их может быть больше, чем потоков
+        self.in_flight = max(settings.PREFETCH_COUNT, executor.workers)
+        self.semaphore = asyncio.Semaphore(self.in_flight)
+        self.fair_queue = FairQueue() if config.FAIR_SCHEDULING else None
+
+    def waiting(self) -> int:
+        """
+        Число полученных, но ещё не начатых задач.
+        """
+        return len(self.fair_queue) if self.fair_queue is not None else 0
+
+    async def declare(self, connection):
+        """
+        Открывает канал потребителя и объявляет его очередь.
+        """
+        self.channel = await connection.channel(publisher_confirms=True)
+        self.input_queue = await self.channel.declare_queue(
+            self.queue_name, durable=True, arguments=queue_arguments(),
+        )
+
+    async def serve(self, publisher_channel, result_cache, blob_store, stats):
+        """
+        Подписывается на объявленную очередь и обрабатывает сообщения до отмены.
+        """
+        channel, input_queue = self.channel, self.input_queue
+
+        def handler(msg):
+            return handle_message(
+                msg,
+                self.executor,
+                publisher_channel,
+                config.QUEUE_RESULT,
+                self.semaphore,
+                self.scheduler,
+                result_cache,
+                blob_store,
+                stats,
+            )
+
+        if self.fair_queue is not None:
+            # Сверх сообщений в обработке получаем FAIR_QUEUE_SIZE, чтобы было из
+            # кого выбирать следующую задачу
+            async def enqueue(msg):
+                chat_id, cost = job_priority_key(msg)
+                self.fair_queue.put(chat_id, cost, msg)
+
+            await channel.set_qos(prefetch_count=self.in_flight + self.settings.FAIR_QUEUE_SIZE)
+            await input_queue.consume(enqueue)
+            logger.info(f"Очередь {self.queue_name}: ожидание сообщений.")
+            await dispatch(self.fair_queue, handler, self.in_flight)
+        else:
+            # Устанавливаем prefetch_count по числу сообщений в обработке
+            await channel.set_qos(prefetch_count=self.in_flight)
+            await input_queue.consume(handler)
+            logger.info(f"Очередь {self.queue_name}: ожидание сообщений.")
+            await asyncio.Future()  # Бесконечное ожидаение сообщений
 
 
-async def main(device: str = None):
+async def main(
+    device: str = None,
+    executor_kind: str = None,
+    workers: int = None,
+    precision: str = None,
+    backend: str = None,
+):
     """
     Основная функция, запускающая обработку изображений через очередь.
     """
@@ -162,7 +381,15 @@ async def main(device: str = None):
     else:
         logger.warning("Устройство не указано, используется значение по умолчанию.")
 
-    model = await load_model(device)
+    # Подписка на очередь начинается только после загрузки и прогрева модели
+    executor = await load_model(device, executor_kind, workers, precision, backend)
+    result_cache = create_result_cache()
+    blob_store = create_blob_store(config)
+    stats = WorkerStats()
+    queues = [
+        QueueConsumer(executor, size_class, class_settings(config, size_class))
+        for size_class in served_size_classes(config)
+    ]
 
     logger.info("Подключение к RabbitMQ...")
 
@@ -178,39 +405,49 @@ async def main(device: str = None):
         client_properties=client_props,
     )
 
+    stats_task = None
     try:
         async with connection:
             logger.info("Подключение к RabbitMQ успешно установлено.")
-            channel = await connection.channel(publisher_confirms=True)
             publisher_channel = await connection.channel(publisher_confirms=True)
-
-            # Объявление очередей
-            input_queue = await channel.declare_queue(
-                config.QUEUE_PROCESS_IMAGE, durable=True,
-            )
-            output_queue_name = config.QUEUE_RESULT
-
-            # Устанавливаем prefetch_count
-            await channel.set_qos(prefetch_count=SEMAPHORE_LIMIT)
-
-            # Привязываем обработчик сообщений
-            await input_queue.consume(
-                lambda msg: handle_message(
-                    msg,
-                    model,
-                    publisher_channel,
-                    output_queue_name,
+            # Очереди объявляются до запуска статистики, которая читает их глубину
+            for consumer in queues:
+                await consumer.declare(connection)
+
+            # Статистика загрузки для контроля допуска задач в боте
+            if config.STATS_INTERVAL:
+                stats_task = asyncio.create_task(
+                    publish_stats_periodically(
+                        connection,
+                        config.STATS_EXCHANGE,
+                        [consumer.queue_name for consumer in queues],
+                        stats,
+                        concurrency=sum(consumer.in_flight for consumer in queues),
+                        waiting=lambda: sum(consumer.waiting() for consumer in queues),
+                        interval=config.STATS_INTERVAL,
+                    ),
+                )
+
+            await asyncio.gather(
+                *(
+                    consumer.serve(
+                        publisher_channel,
+                        result_cache,
+                        blob_store,
+                        stats,
+                    )
+                    for consumer in queues
                 ),
             )
-
-            logger.info("Сервис обработки изображений запущен и ожидает сообщений.")
-            await asyncio.Future()  # Бесконечное ожидаение сообщений
     except asyncio.CancelledError:
         logger.info("Получен сигнал завершения работы.")
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}", exc_info=True)
     finally:
+        if stats_task is not None:
+            stats_task.cancel()
         # Корректное закрытие соединения
         if not connection.is_closed:
             await connection.close()
             logger.info("Соединение с RabbitMQ закрыто.")
+        executor.shutdown()
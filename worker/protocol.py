@@ -0,0 +1,100 @@
+import json
+import logging
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Версия 1: JSON {"chat_id": ..., "image_data": "<hex>"} в теле сообщения.
+# Версия 2: сырые байты изображения в теле, метаданные в заголовках AMQP.
+PROTOCOL_VERSION = 2
+VERSION_HEADER = "protocol_version"
+# Результат с status=error сообщает боту, что изображение обработать не удалось
+STATUS_HEADER = "status"
+STATUS_ERROR = "error"
+
+
+@dataclass
+class ImageJob:
+    """Задача на обработку изображения, извлечённая из сообщения."""
+
+    chat_id: int
+    image_bytes: bytes
+    image_format: str = "jpeg"
+    options: dict = field(default_factory=dict)
+    version: int = PROTOCOL_VERSION
+    cache_key: str | None = None
+
+
+def parse_image_message(message, body: bytes | None = None) -> ImageJob:
+    """
+    Извлекает задачу из входящего сообщения любой поддерживаемой версии протокола.
+
+    Сообщения без заголовка версии считаются сообщениями версии 1.
+    body - тело, загруженное из хранилища, если в сообщении только ссылка на него.
+    """
+    headers = message.headers or {}
+    if body is None:
+        body = message.body
+    version = int(headers.get(VERSION_HEADER, 1))
+
+    if version == 1:
+        msg = json.loads(body)
+        image_hex = msg.get("image_data")
+        if not image_hex:
+            logger.error("Ошибка: получены пустые данные изображения.")
+            raise ValueError("Получены пустые данные изображения.")
+        return ImageJob(
+            chat_id=msg["chat_id"],
+            image_bytes=bytes.fromhex(image_hex),
+            version=version,
+        )
+
+    if version == 2:
+        if not body:
+            logger.error("Ошибка: получены пустые данные изображения.")
+            raise ValueError("Получены пустые данные изображения.")
+        chat_id = headers.get("chat_id")
+        if chat_id is None:
+            raise ValueError("Отсутствует chat_id в заголовках.")
+        return ImageJob(
+            chat_id=chat_id,
+            image_bytes=body,
+            image_format=headers.get("format", "jpeg"),
+            options=dict(headers.get("options") or {}),
+            version=version,
+            cache_key=headers.get("cache_key"),
+        )
+
+    raise ValueError(f"Неподдерживаемая версия протокола: {version}")
+
+
+def result_headers(job: ImageJob, image_format: str = "jpeg", as_document: bool = False) -> dict:
+    """
+    Заголовки сообщения с результатом обработки.
+
+    delivery подсказывает боту, отправлять результат фотографией или документом.
+    """
+    headers = {
+        VERSION_HEADER: PROTOCOL_VERSION,
+        "chat_id": job.chat_id,
+        "format": image_format,
+        "delivery": "document" if as_document else "photo",
+    }
+    # Ключ кэша бота возвращается обратно, чтобы бот сохранил результат
+    if job.cache_key:
+        headers["cache_key"] = job.cache_key
+    return headers
+
+
+def error_headers(chat_id, error: str) -> dict:
+    """
+    Заголовки сообщения об ошибке обработки (тело сообщения пустое).
+
+    По нему бот освобождает место пользователя в лимите задач и сообщает ему об ошибке.
+    """
+    return {
+        VERSION_HEADER: PROTOCOL_VERSION,
+        "chat_id": chat_id,
+        STATUS_HEADER: STATUS_ERROR,
+        "error": error[:500],
+    }
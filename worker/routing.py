@@ -0,0 +1,59 @@
+import logging
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+# Классы размеров изображений; у каждого своя очередь <QUEUE_PROCESS_IMAGE>.<класс>
+SIZE_CLASSES = ("small", "large")
+
+# Настройки, которые можно задать отдельно для класса в SIZE_CLASS_SETTINGS
+CLASS_SETTING_KEYS = (
+    "PREFETCH_COUNT",
+    "FAIR_QUEUE_SIZE",
+    "BATCHING_ENABLED",
+    "BATCH_MAX_SIZE",
+    "BATCH_MAX_LATENCY_MS",
+    "BATCH_TILE_SIZE",
+)
+
+
+def size_class_queue(queue_name: str, size_class: str | None) -> str:
+    """
+    Имя очереди класса размеров; None - общая очередь без маршрутизации.
+    """
+    return f"{queue_name}.{size_class}" if size_class else queue_name
+
+
+def served_size_classes(config) -> list[str | None]:
+    """
+    Классы размеров, которые обслуживает воркер, по WORKER_SIZE_CLASSES.
+
+    Без маршрутизации по размеру воркер читает общую очередь ([None]).
+    """
+    if not config.SIZE_ROUTING:
+        return [None]
+    classes = [name.strip() for name in config.WORKER_SIZE_CLASSES.split(",") if name.strip()]
+    unknown = set(classes) - set(SIZE_CLASSES)
+    if unknown or not classes:
+        raise ValueError(
+            f"Неизвестные классы размеров в WORKER_SIZE_CLASSES: {config.WORKER_SIZE_CLASSES}, "
+            f"ожидаются {SIZE_CLASSES}",
+        )
+    return classes
+
+
+def class_settings(config, size_class: str | None) -> SimpleNamespace:
+    """
+    Настройки очереди класса: общие значения конфигурации, поверх которых
+    наложены значения из SIZE_CLASS_SETTINGS[size_class].
+    """
+    settings = {key: getattr(config, key) for key in CLASS_SETTING_KEYS}
+    overrides = dict(config.SIZE_CLASS_SETTINGS.get(size_class, {})) if size_class else {}
+    unknown = set(overrides) - set(CLASS_SETTING_KEYS)
+    if unknown:
+        raise ValueError(
+            f"Настройки {sorted(unknown)} нельзя задать для класса {size_class}, "
+            f"доступны {CLASS_SETTING_KEYS}",
+        )
+    settings.update(overrides)
+    return SimpleNamespace(**settings)
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from collections import deque
+
+import aio_pika
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, q: float) -> float | None:
+    """
+    Перцентиль q (0..1) методом ближайшего ранга; None для пустого списка.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))
+    return ordered[index]
+
+
+class WorkerStats:
+    """
+    Статистика загрузки воркера: задачи в обработке и время последних задач.
+
+    Хранит window последних завершённых задач; пропускная способность считается
+    по задачам, завершённым за последние rate_window секунд.
+    """
+
+    def __init__(self, window: int = 200, rate_window: float = 300.0):
+        self.rate_window = rate_window
+        self.in_flight = 0
+        self._durations: deque = deque(maxlen=window)
+        self._finished: deque = deque(maxlen=window)
+
+    def job_started(self) -> None:
+        self.in_flight += 1
+
+    def job_finished(self, seconds: float | None, pixels: int = 0) -> None:
+        """
+        Отмечает завершение задачи; seconds=None для задач, завершённых ошибкой.
+        """
+        self.in_flight -= 1
+        if seconds is None:
+            return
+        self._durations.append(seconds)
+        self._finished.append((time.monotonic(), pixels))
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        since = now - self.rate_window
+        recent = [pixels for finished, pixels in self._finished if finished >= since]
+        durations = list(self._durations)
+        return {
+            "in_flight": self.in_flight,
+            "p50_seconds": percentile(durations, 0.5),
+            "p95_seconds": percentile(durations, 0.95),
+            "jobs_per_minute": len(recent) * 60 / self.rate_window,
+            "megapixels_per_second": sum(recent) / 1e6 / self.rate_window,
+        }
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def _open_stats_channel(connection, exchange_name):
+    channel = await connection.channel()
+    exchange = await channel.declare_exchange(exchange_name, aio_pika.ExchangeType.FANOUT)
+    return channel, exchange
+
+
+async def _queue_depths(channel, queue_names: list[str]) -> dict:
+    queue_depths = {}
+    for queue_name in queue_names:
+        queue = await channel.declare_queue(queue_name, passive=True)
+        queue_depths[queue_name] = queue.declaration_result.message_count
+    return queue_depths
+
+
+async def publish_stats_periodically(
+    connection,
+    exchange_name: str,
+    queue_names: list[str],
+    stats: WorkerStats,
+    concurrency: int,
+    waiting,
+    interval: float,
+) -> None:
+    """
+    Периодически публикует статистику воркера в fanout-обменник exchange_name.
+
+    Ошибка брокера (например, 404 на пассивное объявление удалённой очереди)
+    закрывает канал, поэтому перед каждой публикацией закрытый канал
+    открывается заново.
+
+    Args:
+        connection: Соединение с RabbitMQ.
+        exchange_name (str): Обменник статистики, на него подписан бот.
+        queue_names (list[str]): Очереди обработки воркера, их глубина входит в статистику.
+        stats (WorkerStats): Статистика задач воркера.
+        concurrency (int): Число задач, которые воркер обрабатывает одновременно.
+        waiting: Функция без аргументов - число полученных, но не начатых задач.
+        interval (float): Период публикации в секундах.
+    """
+    identifier = worker_id()
+    channel = exchange = None
+    while True:
+        try:
+            if channel is None or channel.is_closed:
+                channel, exchange = await _open_stats_channel(connection, exchange_name)
+            report = {
+                "worker_id": identifier,
+                "timestamp": time.time(),
+                "concurrency": concurrency,
+                "queue_depths": await _queue_depths(channel, queue_names),
+                "waiting": waiting(),
+                **stats.snapshot(),
+            }
+            await exchange.publish(
+                aio_pika.Message(
+                    body=json.dumps(report).encode(),
+                    content_type="application/json",
+                    # устаревшая статистика бесполезна
+                    expiration=interval * 3,
+                ),
+                routing_key="",
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось опубликовать статистику воркера: {e}")
+        await asyncio.sleep(interval)
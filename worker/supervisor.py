@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from dataclasses import dataclass
+
+from worker.config import get_config
+from worker.utils import setup_logging
+
+config = get_config()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WorkerSpec:
+    """
+    Параметры одного процесса-потребителя.
+    """
+
+    name: str
+    device: str | None = None
+    num_threads: int | None = None
+    cpu_affinity: tuple[int, ...] | None = None
+
+
+def parse_devices(devices):
+    """
+    Разбирает список устройств вида "cuda:0,cuda:1".
+    """
+    return [device.strip() for device in devices.split(",") if device.strip()]
+
+
+def _available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def build_worker_specs(devices=None, cpu_workers=0):
+    """
+    Формирует список процессов: по одному на каждое устройство из devices
+    и cpu_workers процессов CPU, между которыми поровну делятся ядра.
+    """
+    specs = [WorkerSpec(name=device, device=device) for device in devices or []]
+
+    if cpu_workers:
+        cpus = _available_cpus()
+        if cpu_workers > len(cpus):
+            raise ValueError(f"CPU-процессов ({cpu_workers}) больше, чем ядер ({len(cpus)})")
+        per_worker = len(cpus) // cpu_workers
+        for index in range(cpu_workers):
+            cores = tuple(cpus[index * per_worker:(index + 1) * per_worker])
+            specs.append(
+                WorkerSpec(
+                    name=f"cpu-{index}",
+                    device="cpu",
+                    num_threads=per_worker,
+                    cpu_affinity=cores,
+                ),
+            )
+
+    if not specs:
+        raise ValueError("Не указано ни одного устройства для процессов воркера")
+    return specs
+
+
+def _run_worker(spec, options):
+    """
+    Точка входа дочернего процесса: отдельный потребитель очереди со своей моделью,
+    prefetch и менеджером памяти.
+    """
+    setup_logging(config)
+
+    if spec.cpu_affinity and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, spec.cpu_affinity)
+    if spec.num_threads:
+        import torch
+
+        torch.set_num_threads(spec.num_threads)
+
+    from worker.main import main
+
+    logger.info(f"Процесс {spec.name} (pid={os.getpid()}) запущен на {spec.device}")
+    try:
+        asyncio.run(main(device=spec.device, **options))
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerSupervisor:
+    """
+    Запускает по процессу на устройство и перезапускает упавшие процессы.
+
+    Все процессы читают общую входную очередь. Сообщения подтверждаются только
+    после публикации результата, поэтому сообщения упавшего процесса RabbitMQ
+    возвращает в очередь при закрытии его соединения, и их обрабатывают другие.
+    """
+
+    def __init__(self, specs, options=None, restart_delay=None, poll_interval=1.0):
+        self.specs = specs
+        self.options = options or {}
+        self.restart_delay = (
+            config.SUPERVISOR_RESTART_DELAY if restart_delay is None else restart_delay
+        )
+        self.poll_interval = poll_interval
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: dict[str, multiprocessing.Process] = {}
+        self._restart_at: dict[str, float] = {}
+        self._stopping = False
+
+    def _start(self, spec):
+        process = self._context.Process(
+            target=_run_worker,
+            args=(spec, self.options),
+            name=f"worker-{spec.name}",
+        )
+        process.start()
+        self._processes[spec.name] = process
+        logger.info(f"Запущен процесс {spec.name} (pid={process.pid})")
+
+    def start(self):
+        for spec in self.specs:
+            self._start(spec)
+
+    def check(self):
+        """
+        Перезапускает процессы, завершившиеся без команды остановки.
+        Повторный запуск выполняется не раньше, чем через restart_delay секунд.
+        """
+        now = time.monotonic()
+        for spec in self.specs:
+            process = self._processes.get(spec.name)
+            if process is not None and process.is_alive():
+                continue
+
+            if spec.name not in self._restart_at:
+                exitcode = process.exitcode if process is not None else None
+                logger.error(
+                    f"Процесс {spec.name} завершился (exitcode={exitcode}), "
+                    f"перезапуск через {self.restart_delay}с",
+                )
+                self._restart_at[spec.name] = now + self.restart_delay
+
+            if now >= self._restart_at[spec.name]:
+                del self._restart_at[spec.name]
+                self._start(spec)
+
+    def _handle_signal(self, signum, frame):
+        logger.info(f"Получен сигнал {signum}, остановка процессов воркера...")
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        self.start()
+        try:
+            while not self._stopping:
+                time.sleep(self.poll_interval)
+                self.check()
+        finally:
+            self.stop()
+
+    def stop(self, timeout=30):
+        self._stopping = True
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        for name, process in self._processes.items():
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Процесс {name} не завершился, принудительная остановка")
+                process.kill()
+        logger.info("Все процессы воркера остановлены.")